@@ -5,23 +5,25 @@ It creates a Flask app and starts the socketio server.
 # locals
 import sys
 import uuid
-import random
 import asyncio
+import logging
 
 # project
 from src.sim import config
-from src.sim.db_client import DatabaseClient
-from src.sim.data_model import SimID
-from src.sim.simulator import MonteCarloSimulation
+from src.sim.backfill import open_writer, run_backfill
+from src.sim.live_feed import LiveFeed
+from src.sim.scheduler import TickScheduler
+from src.sim.shards import create_sink, create_simulations, start_shards
+from src.sim.statistics import parse_cadence
 from src.sim.web_apis import SimulationWEBAPIs
 from src.sim.web_server import WebServer
-from src.sim.utils import parse_cvars, setup_logging
+from src.sim.utils import parse_cvars, parse_duration, setup_logging
 
 # third party
-# ..
+import numpy as np
 
 # constants
-# ..
+logger = logging.getLogger(__name__)
 
 
 async def main() -> None:
@@ -34,38 +36,65 @@ async def main() -> None:
     setup_logging(cvars)
 
     num_simulations = cvars.sims if cvars.sims else config.NUM_SIMS
+    batch_size = cvars.batch_size if cvars.batch_size else config.SIM_BATCH_SIZE
+    sched_workers = cvars.sched_workers if cvars.sched_workers is not None else config.SCHED_WORKERS
+    workers = cvars.workers if cvars.workers else config.SIM_WORKERS
+    sinks = cvars.sinks if cvars.sinks else config.SIM_SINKS
+    seed = cvars.seed if cvars.seed is not None else config.SIM_SEED
+    paths = cvars.paths if cvars.paths is not None else config.SIM_PATHS
+    path_rows = cvars.path_rows if cvars.path_rows is not None else config.SIM_PATH_ROWS
+    shared_window = cvars.shared_windows if cvars.shared_windows is not None else config.SIM_SHARED_WINDOWS
+    stat_cadence = parse_cadence(
+        cvars.stat_cadence if cvars.stat_cadence is not None else config.SIM_STAT_CADENCE)
 
-    simulation_ids = []
-    sims = {}
+    # one stream for the sample rates and one per simulation
+    seed_sequence = np.random.SeedSequence(seed)
+    logger.info(f"simulation seed: {seed_sequence.entropy}")
+    rates_seed, *sim_seeds = seed_sequence.spawn(num_simulations + 1)
+    rates = np.random.default_rng(rates_seed).integers(
+        int(config.SIM_FREQ_LOW), 
+        int(config.SIM_FREQ_HIGH), 
+        size=num_simulations, 
+        endpoint=True)
 
-    for _ in range(num_simulations):
+    sim_specs = []
+
+    for sampling_frequency, sim_seed in zip(rates.tolist(), sim_seeds):
         rand = str(uuid.uuid4()).replace("-", "")[:6]
-        simulation_ids.append(f"sim-{rand}")
-
-    db_client = DatabaseClient(
-        num_buffers=config.DB_BUFFERS,
-        buffer_limit=config.DB_BUFFER_LEN)
-
-    for sim_id in simulation_ids:
-        sampling_frequency = random.randint(
-            config.SIM_FREQ_LOW, 
-            config.SIM_FREQ_HIGH)
-        sim_id = f"{sim_id}-{sampling_frequency}-Hz"
-        
-        db_client.write(
-            SimID(
-                sim_id=sim_id),
-            immediate_commit=True)
-        
-        sims[sim_id] = MonteCarloSimulation(
-            sim_id=sim_id, 
-            db_client=db_client, 
-            sample_hz=sampling_frequency,
-            max_sample_queue=1000)
-
-        sims[sim_id].start()
+        sim_specs.append((f"sim-{rand}-{sampling_frequency}-Hz", sampling_frequency, sim_seed))
+
+    if cvars.backfill:
+        sink = open_writer(cvars.output) if cvars.output else create_sink(sinks)
+        # off the event loop, an asyncdb sink runs on it
+        result = await asyncio.to_thread(
+            run_backfill, sim_specs, parse_duration(cvars.backfill), sink, paths=paths, path_rows=path_rows)
+        print(
+            f"backfilled {result['samples']:,} samples in {result['elapsed']:.1f}s, "
+            f"{result['samples_per_sec']:,.0f} samples/sec")
+        return
+
+    scheduler = None
+    db_client = None
+    feed = None
+    shards = []
+
+    if workers > 1:
+        shards, sims = start_shards(
+            sim_specs, workers, cvars, batch_size, sched_workers)
+    else:
+        if sched_workers > 0:
+            scheduler = TickScheduler(workers=sched_workers)
+            scheduler.start()
+
+        db_client = create_sink(sinks)
+
+        feed = LiveFeed()
+
+        sims = create_simulations(
+            sim_specs, db_client, batch_size, scheduler, feed, 
+            paths=paths, path_rows=path_rows, shared_window=shared_window, stat_cadence=stat_cadence)
     
-    web_api = SimulationWEBAPIs(sims)
+    web_api = SimulationWEBAPIs(sims, feed)
     web_server = WebServer(
         web_apis=web_api,
         host="0.0.0.0", 
@@ -75,9 +104,18 @@ async def main() -> None:
         await web_server.start_server()
     finally:
         await web_server.stop_server()
-        db_client.close()
-        for sim_id, simulation in sims.items():
-            simulation.stop()
+        web_api.control.close()
+        for shard in shards:
+            shard.close()
+        # producers are stopped off the event loop, an asyncdb sink
+        #   may have to drain the queue they are waiting on for space
+        if db_client is not None:
+            for sim_id, simulation in sims.items():
+                await asyncio.to_thread(simulation.close)
+        if scheduler is not None:
+            await asyncio.to_thread(scheduler.stop)
+        if db_client is not None:
+            await db_client.aclose()
         sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,379 @@
+"""
+Async DB Client
+"""
+# locals
+import time
+import asyncio
+import logging
+import threading
+from typing import Optional, Union
+from datetime import datetime
+
+# project
+from src.sim.data_model import SampleData, SampleRecord, SimID
+from src.sim.db_client import (
+    CLIENT_IDS, COPY_COLUMNS, DB_BUFFER_WAITS, DB_BUFFERED_ROWS, DB_FLUSH_ROWS, DB_FLUSH_SECONDS,
+    DB_ROWS_BUFFERED, DB_ROWS_DROPPED, DB_ROWS_WRITTEN, PARTITION_MAINTENANCE_INTERVAL,
+    SAMPLES_TABLE, copy_row, create_partitions, create_schema, maintain_partitions,
+    rollup_upsert, sample_row)
+from src.sim.rollups import Rollups
+from src.sim.sinks import Sink
+from src.sim.config import DATABASE_URL
+
+# third party
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+# constants
+logger = logging.getLogger(__name__)
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+CLOSE = object()  # queued by aclose, the consumer flushes what is left and returns
+
+
+def async_url(url: str) -> str:
+    """
+    Switches a database url to the async driver of its backend,
+        e.g. `postgresql://...` to `postgresql+asyncpg://...`.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"no async driver for {backend}, use postgresql or sqlite")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+class AsyncDatabaseClient(Sink):
+    """
+    A database client ingesting on an asyncio event loop through an async driver
+    (asyncpg, aiosqlite for SQLite) and a connection pool.
+
+    Producers (simulation threads, scheduler workers) hand their rows to an `asyncio.Queue`
+    with `loop.call_soon_threadsafe`, so writing never waits on the database. A consumer
+    task gathers the queued rows into batches of `buffer_limit` rows, or whatever arrived
+    within `flush_interval` seconds, and starts a flush per batch. Up to `max_flushes`
+    flushes run concurrently, each on its own pooled connection, so their round trips
+    overlap instead of queueing behind one another. A producer only blocks (backpressure)
+    when `max_pending` rows are queued, producers on the event loop itself never block.
+
+    Batches are ingested with a Core `INSERT` executed for the whole batch 
+    (`ingest_mode="insert"`, the default), which asyncpg pipelines instead of waiting 
+    for a reply per row, or with asyncpg's binary `COPY` (`ingest_mode="copy"`, 
+    PostgreSQL only, experimental). Flushes complete in the
+    order their batches were taken, the rollups of a batch are written once the previous
+    batch finished, as `Rollups` expects the rows of a sim_id in time order.
+
+    The client runs on the event loop running when it is created, e.g. the one serving
+    the web APIs, otherwise on its own loop in a `db-loop` thread. Schema and partition
+    management are shared with DatabaseClient, see `create_schema`. With `setup_schema=False`
+    the schema is expected to exist already, see `setup_database`.
+
+    Close it with `await aclose()` on its event loop, or `close()` from any other thread.
+    """
+    def __init__(self,
+                 buffer_limit:int=500,
+                 max_pending:int=50000,
+                 max_flushes:int=4,
+                 flush_interval:float=1.0,
+                 ingest_mode:str="insert",
+                 partition_days_ahead:int=3,
+                 retention_days:int=0,
+                 rollups:bool=True,
+                 database_url:str=None,
+                 setup_schema:bool=True) -> None:
+        url = async_url(database_url or DATABASE_URL)
+        pool = {}
+        if url.startswith("postgresql"):
+            # a connection per flush plus immediate commits, SQLite opens one per use
+            pool = {"pool_size": max_flushes + 1, "max_overflow": max_flushes}
+        self.engine = create_async_engine(url, echo=False, pool_pre_ping=True, **pool)
+        if ingest_mode == "copy" and self.engine.dialect.name != "postgresql":
+            logger.warning(f"COPY ingest requires postgresql, using INSERT for {self.engine.dialect.name}")
+            ingest_mode = "insert"
+        self.ingest_mode = ingest_mode
+        self.setup_schema = setup_schema
+        self.partition_days_ahead = partition_days_ahead
+        self.retention_days = retention_days  # 0 keeps every partition
+        self.rollups = Rollups() if rollups else None
+        self.buffer_limit = buffer_limit  # Rows per flush
+        self.max_pending = max_pending  # Rows queued before producers block
+        self.max_flushes = max_flushes  # Flushes in flight
+        self.flush_interval = flush_interval  # Seconds before a partial batch is flushed
+        self.queue = asyncio.Queue()
+        self.queued = 0
+        self.space = threading.Condition()  # Guards `queued`, producers wait on it for space
+        self.flush_slots = asyncio.Semaphore(max_flushes)
+        self.last_flush: Optional[asyncio.Task] = None
+        self.commits = set()  # Immediate commits scheduled from the event loop
+        self.closing = False
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.client_label = f"asyncdb-{next(CLIENT_IDS)}"
+        DB_BUFFERED_ROWS.labels(self.client_label).set_function(self.pending)
+
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.loop_thread = None
+        except RuntimeError:
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, name="db-loop", daemon=True)
+            self.loop_thread.start()
+
+        if self.loop_thread is None:
+            self.loop_ident = threading.get_ident()
+            self.starting = self.loop.create_task(self.start())
+        else:
+            self.loop_ident = self.loop_thread.ident
+            self.starting = None
+            asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    async def start(self) -> None:
+        """
+        Creates or migrates the schema, unless `setup_schema` is off, then starts 
+            the consumer and the partition maintenance tasks.
+        """
+        if self.setup_schema:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(create_schema)
+            await self.maintain_partitions()
+        self.consumer = asyncio.create_task(self.run_consumer(), name="db-consumer")
+        self.maintenance = asyncio.create_task(self.run_maintenance(), name="db-maintenance")
+
+    def on_loop(self) -> bool:
+        return threading.get_ident() == self.loop_ident
+
+    def write(self,
+        sample_data: Union[SampleRecord, SampleData, SimID], immediate_commit:bool=False) -> None:
+        """
+        Queues data for a batched flush, or commits it immediately. Immediate
+            commits made on the event loop are only scheduled, but finish before
+            any row queued after them is flushed.
+        """
+        if immediate_commit:
+            if self.on_loop():
+                task = self.loop.create_task(self.commit([sample_data]))
+                self.commits.add(task)
+                task.add_done_callback(self.committed)
+            else:
+                asyncio.run_coroutine_threadsafe(self.commit([sample_data]), self.loop).result()
+            return
+        self.enqueue([sample_data])
+
+    def write_many(self, items: list) -> None:
+        """
+        Queues several items as one handoff to the event loop.
+        """
+        if items:
+            self.enqueue(list(items))
+
+    def enqueue(self, items: list) -> None:
+        on_loop = self.on_loop()
+        with self.space:
+            if self.queued >= self.max_pending and not on_loop:
+                logger.warning("database flushes falling behind, waiting for the queue to drain")
+                DB_BUFFER_WAITS.inc()
+                while self.queued >= self.max_pending:
+                    self.space.wait(timeout=self.flush_interval)
+            self.queued += len(items)
+        DB_ROWS_BUFFERED.inc(len(items))
+
+        if on_loop:
+            self.queue.put_nowait(items)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, items)
+
+    def release(self, count: int) -> None:
+        with self.space:
+            self.queued -= count
+            self.space.notify_all()
+
+    def pending(self) -> int:
+        """
+        Rows queued and not yet taken into a batch.
+        """
+        return self.queued
+
+    def committed(self, task: asyncio.Task) -> None:
+        self.commits.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("immediate commit failed", exc_info=task.exception())
+
+    async def commit(self, items: list) -> None:
+        if self.starting is not None:
+            await self.starting
+        await self.ingest(items)
+
+    async def run_consumer(self) -> None:
+        """
+        Consumer task loop, takes the queued rows into batches and dispatches
+            them, until aclose queues CLOSE.
+        """
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = loop.time() + self.flush_interval
+        closing = False
+        while not closing:
+            try:
+                items = await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                items = []
+
+            # take whatever else is queued without waiting
+            while True:
+                if items is CLOSE:
+                    closing = True
+                    break
+                batch.extend(items)
+                self.release(len(items))
+                if len(batch) >= self.buffer_limit or self.queue.empty():
+                    break
+                items = self.queue.get_nowait()
+
+            while len(batch) >= self.buffer_limit:
+                await self.dispatch(batch[:self.buffer_limit])
+                batch = batch[self.buffer_limit:]
+
+            if closing or loop.time() >= deadline:
+                if batch:
+                    await self.dispatch(batch)
+                    batch = []
+                deadline = loop.time() + self.flush_interval
+
+        if self.last_flush is not None:
+            await self.last_flush
+
+    async def dispatch(self, batch: list) -> None:
+        """
+        Starts the flush of a batch once a flush slot is free.
+        """
+        if self.commits:
+            # e.g. the SimID rows the batch refers to
+            await asyncio.gather(*self.commits, return_exceptions=True)
+        await self.flush_slots.acquire()
+        self.last_flush = asyncio.create_task(self.flush(batch, self.last_flush))
+
+    async def flush(self, batch: list, previous: Optional[asyncio.Task]) -> None:
+        """
+        Ingests a batch, then writes its rollups after the previous batch's.
+        """
+        begin = time.perf_counter()
+        ingested = False
+        try:
+            await self.ingest(batch)
+            ingested = True
+            self.rows_written += len(batch)
+            DB_ROWS_WRITTEN.inc(len(batch))
+        except Exception:
+            self.rows_dropped += len(batch)
+            DB_ROWS_DROPPED.inc(len(batch))
+            logger.exception(f"failed to flush {len(batch)} rows, dropping them")
+        finally:
+            self.flush_slots.release()
+        DB_FLUSH_ROWS.observe(len(batch))
+        DB_FLUSH_SECONDS.observe(time.perf_counter() - begin)
+
+        if previous is not None:
+            await previous
+        if ingested and self.rollups is not None:
+            try:
+                await self.write_rollups(self.rollups.add(
+                    [item for item in batch if isinstance(item, (SampleRecord, SampleData))]))
+            except Exception:
+                logger.exception("failed to update rollups")
+
+    async def ingest(self, items: list) -> None:
+        """
+        Writes a batch in one transaction on a pooled connection, other rows
+            (SimID) first as the samples refer to them.
+        """
+        samples = [item for item in items if isinstance(item, (SampleRecord, SampleData))]
+        others = [item for item in items if not isinstance(item, (SampleRecord, SampleData))]
+        async with self.engine.begin() as connection:
+            for item in others:
+                await connection.execute(insert(type(item).__table__), [item.model_dump()])
+            if not samples:
+                return
+            if self.ingest_mode == "copy":
+                await self.ingest_copy(connection, samples)
+            else:
+                await connection.execute(
+                    insert(SampleData.__table__), [sample_row(sample) for sample in samples])
+
+    async def ingest_copy(self, connection: AsyncConnection, samples: list) -> None:
+        """
+        Streams the samples with asyncpg's binary `COPY`.
+        """
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            SAMPLES_TABLE,
+            records=[copy_row(sample) for sample in samples],
+            columns=COPY_COLUMNS)
+
+    async def write_rollups(self, rollups: list) -> None:
+        """
+        Upserts the current state of the touched rollup buckets.
+        """
+        if not rollups:
+            return
+        async with self.engine.begin() as connection:
+            await connection.execute(rollup_upsert(self.engine.dialect.name), rollups)
+
+    async def maintain_partitions(self) -> None:
+        """
+        Creates the upcoming partitions and applies the retention.
+        """
+        if self.engine.dialect.name != "postgresql":
+            return
+        try:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(
+                    maintain_partitions, self.partition_days_ahead, self.retention_days)
+        except Exception:
+            logger.exception("partition maintenance failed")
+
+    async def run_maintenance(self) -> None:
+        while True:
+            await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+            await self.maintain_partitions()
+
+    def ensure_partitions(self, start: datetime, end: datetime) -> None:
+        """
+        Creates the daily partitions covering `start` to `end`, from a thread
+            other than the event loop's.
+        """
+        async def create() -> None:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(create_partitions, start, end)
+        asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+
+    async def aclose(self) -> None:
+        """
+        Flushes the queued rows, waits for the flushes in flight and disposes the engine.
+        """
+        if self.closing:
+            return
+        self.closing = True
+        try:
+            if self.starting is not None:
+                await self.starting
+            self.queue.put_nowait(CLOSE)
+            await self.consumer
+            self.maintenance.cancel()
+            if self.commits:
+                await asyncio.gather(*self.commits, return_exceptions=True)
+        finally:
+            await self.engine.dispose()
+            DB_BUFFERED_ROWS.remove(self.client_label)
+
+    def close(self) -> None:
+        """
+        Closes the client from a thread other than the event loop's, stopping
+            its own loop if it started one.
+        """
+        if self.on_loop():
+            raise RuntimeError("close() would block the event loop, await aclose() instead")
+        asyncio.run_coroutine_threadsafe(self.aclose(), self.loop).result()
+        if self.loop_thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
@@ -0,0 +1,239 @@
+"""
+Headless backfill, runs simulations on a virtual clock as fast as possible.
+"""
+# locals
+import csv
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+# project
+from src.sim.async_db_client import AsyncDatabaseClient
+from src.sim.data_model import SampleBatch, SampleRecord, SimID
+from src.sim.db_client import DatabaseClient, csv_column, csv_field, csv_lines
+from src.sim.ensemble import EnsembleSimulation
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import ColumnarFileSink, Sink
+
+# third party
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+
+# constants
+logger = logging.getLogger(__name__)
+BASE_COLUMNS = ["timestamp", "sim_id", "samples", "value", "mark", "delta"]
+
+
+class CsvWriter(Sink):
+    """
+    Writes sample records to a CSV file, one column per stat key.
+
+    The stat columns are taken from the first record or batch written.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.stat_keys = None
+        self.rows_written = 0
+
+    def write(self, record: SampleRecord, immediate_commit: bool=False) -> None:
+        if isinstance(record, SampleRecord):
+            self.write_many([record])
+
+    def write_many(self, records: List[SampleRecord]) -> None:
+        if not records:
+            return
+        self.write_header(list(records[0].statistics))
+        self.writer.writerows(
+            [record.timestamp.isoformat(), record.sim_id, record.samples, record.value,
+             record.mark, record.delta, *[record.statistics.get(key) for key in self.stat_keys]]
+            for record in records)
+        self.rows_written += len(records)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        rows = len(batch)
+        if not rows:
+            return
+        self.write_header(list(batch.statistics))
+        # formatting the floats is most of the cost, the columns are joined as they are
+        empty = [""] * rows
+        columns = [
+            batch.isoformat(), 
+            [csv_field(batch.sim_id)] * rows, 
+            list(map(str, batch.samples.tolist())), 
+            csv_column(batch.values),
+            [csv_field(batch.mark)] * rows, 
+            csv_column(batch.deltas),
+            *[csv_column(batch.statistics[key]) if key in batch.statistics else empty 
+              for key in self.stat_keys]]
+        self.file.write(csv_lines(columns))
+        self.rows_written += rows
+
+    def write_header(self, stat_keys: List[str]) -> None:
+        if self.stat_keys is None:
+            self.stat_keys = stat_keys
+            self.writer.writerow(BASE_COLUMNS + self.stat_keys)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetWriter(Sink):
+    """
+    Writes sample records to a Parquet file, a row group per `write_many` or
+        `write_columns` call, the stat columns are taken from the first record 
+        or batch written.
+
+    Requires pyarrow.
+    """
+    def __init__(self, path: str) -> None:
+        if pa is None:
+            raise RuntimeError("parquet output requires pyarrow")
+        self.path = path
+        self.stat_keys = None
+        self.writer = None
+        self.rows_written = 0
+
+    def write(self, record: SampleRecord, immediate_commit: bool=False) -> None:
+        if isinstance(record, SampleRecord):
+            self.write_many([record])
+
+    def write_many(self, records: List[SampleRecord]) -> None:
+        if not records:
+            return
+        self.open(list(records[0].statistics))
+        columns = {name: [getattr(record, name) for record in records] for name in BASE_COLUMNS}
+        for key in self.stat_keys:
+            columns[key] = [record.statistics.get(key) for record in records]
+        self.writer.write_table(pa.table(columns, schema=self.schema))
+        self.rows_written += len(records)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        rows = len(batch)
+        if not rows:
+            return
+        self.open(list(batch.statistics))
+        columns = {
+            "timestamp": batch.timestamps,
+            "sim_id": pa.array([batch.sim_id] * rows, pa.string()),
+            "samples": batch.samples,
+            "value": batch.values,
+            "mark": pa.nulls(rows, pa.float64()) if batch.mark is None else np.full(rows, batch.mark),
+            "delta": batch.deltas,
+        }
+        for key in self.stat_keys:
+            column = batch.statistics.get(key)
+            # NaN stats are nulls, as None in the records
+            columns[key] = (
+                pa.nulls(rows, pa.float64()) if column is None else pa.array(column, from_pandas=True))
+        self.writer.write_table(pa.table(columns, schema=self.schema))
+        self.rows_written += rows
+
+    def open(self, stat_keys: List[str]) -> None:
+        if self.writer is None:
+            self.stat_keys = stat_keys
+            self.schema = pa.schema(
+                [("timestamp", pa.timestamp("us")), ("sim_id", pa.string()), ("samples", pa.int64()),
+                 ("value", pa.float64()), ("mark", pa.float64()), ("delta", pa.float64())]
+                + [(key, pa.float64()) for key in self.stat_keys])
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path: str) -> Sink:
+    """
+    Opens the file writer matching `path`: a single .csv or .parquet file, 
+        otherwise a directory of per simulation raw segments.
+    """
+    if path.endswith(".csv"):
+        return CsvWriter(path)
+    if path.endswith(".parquet"):
+        return ParquetWriter(path)
+    return ColumnarFileSink(path, batch_rows=10000)
+
+
+def run_backfill(
+        sim_specs: List[Tuple[str, int, np.random.SeedSequence]],
+        duration: timedelta,
+        sink: Sink,
+        chunk: int=1000,
+        end: datetime=None,
+        paths: int=0,
+        path_rows: int=0) -> dict:
+    """
+    Generates `duration` worth of samples per simulation, ending at `end`.
+
+    Simulations are not started, instead they take `chunk` steps at a time in
+    turn, timestamped at their nominal rate, so every simulation moves forward
+    in time together and a writer never holds more than a chunk per simulation.
+    The sink is closed once done, so the reported rate includes the final flush.
+
+    Args:
+        sim_specs (list): (sim_id, sample_hz, seed) per simulation.
+        duration (timedelta): Simulated time per simulation.
+        sink (Sink): A DatabaseClient, a file writer from `open_writer` or a chain of both.
+        chunk (int): Steps per simulation per turn.
+        end (datetime): Timestamp the backfill ends at (default: now).
+        paths (int): Paths per EnsembleSimulation, 0 for single path simulations.
+        path_rows (int): Paths of each ensemble also written as their own rows.
+
+    Returns:
+        dict: Samples written, elapsed seconds and samples per second.
+    """
+    end = end or datetime.utcnow()
+    start = end - duration
+
+    for database in getattr(sink, "sinks", [sink]):
+        if (isinstance(database, (DatabaseClient, AsyncDatabaseClient)) 
+                and database.engine.dialect.name == "postgresql"):
+            database.ensure_partitions(start, end)
+    for sim_id, _, _ in sim_specs:
+        sink.write(SimID(sim_id=sim_id), immediate_commit=True)
+
+    sims, remaining = [], []
+    for sim_id, sampling_frequency, seed in sim_specs:
+        options = dict(
+            sim_id=sim_id,
+            db_client=sink,
+            sample_hz=sampling_frequency,
+            max_sample_queue=1000,
+            seed=seed)
+        if paths:
+            sims.append(EnsembleSimulation(paths=paths, path_rows=path_rows, **options))
+        else:
+            sims.append(MonteCarloSimulation(**options))
+        remaining.append(int(duration.total_seconds() * sampling_frequency))
+
+    total = sum(remaining)
+    logger.info(f"backfilling {total} samples of {len(sims)} simulations from {start} to {end}")
+
+    begin = time.perf_counter()
+    done = [0] * len(sims)
+    while any(remaining):
+        for i, sim in enumerate(sims):
+            steps = min(chunk, remaining[i])
+            if steps == 0:
+                continue
+            sim.step_batch(steps, start_time=start + timedelta(seconds=done[i] * sim.sample_frequency))
+            done[i] += steps
+            remaining[i] -= steps
+
+    for sim in sims:
+        sim.close()
+    sink.close()
+    elapsed = time.perf_counter() - begin
+
+    return {
+        "samples": total,
+        "elapsed": elapsed,
+        "samples_per_sec": total / elapsed if elapsed > 0 else float("inf"),
+    }
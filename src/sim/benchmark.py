@@ -0,0 +1,636 @@
+"""
+Benchmarks for the simulation hot paths.
+
+    poetry run python -m src.sim.benchmark stats
+    poetry run python -m src.sim.benchmark scaling
+    poetry run python -m src.sim.benchmark ensemble
+    poetry run python -m src.sim.benchmark cadence --cadences "" "*=10" "*=1s" "*=demand"
+    poetry run python -m src.sim.benchmark ingest --database-url sqlite:///bench.db
+    poetry run python -m src.sim.benchmark records
+    poetry run python -m src.sim.benchmark layout --database-url sqlite:///bench.db
+    poetry run python -m src.sim.benchmark all --json results.json --baseline baseline.json
+"""
+# locals
+import sys
+import json
+import time
+import uuid
+import itertools
+import logging
+import argparse
+import platform
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+
+# project
+from src.sim.async_db_client import AsyncDatabaseClient
+from src.sim.db_client import DatabaseClient, copy_row
+from src.sim.ensemble import EnsembleSimulation
+from src.sim.data_model import STAT_COLUMNS, SampleData, SampleRecord, SimID
+from src.sim.scheduler import TickScheduler
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import Sink
+from src.sim.statistics import SAMPLE_PERIODS, Statistics, parse_cadence, stat_keys
+
+# third party
+import numpy as np
+from sqlalchemy import JSON, Column, DateTime, Double, Float, Integer, MetaData, String, Table, text
+from sqlmodel import Session, delete
+
+# constants
+logger = logging.getLogger(__name__)
+STAT_KEYS = stat_keys()
+
+
+def make_samples(
+        sim_id: str, count: int, start_time: datetime, row_type: type=SampleRecord) -> list:
+    """
+    Builds `count` rows shaped like the simulator's output.
+    """
+    step = timedelta(milliseconds=20)
+    return [
+        row_type(
+            timestamp=start_time + step * i,
+            sim_id=sim_id,
+            samples=i,
+            value=float(i),
+            mark=None,
+            delta=0.0,
+            statistics={key: float(i) for key in STAT_KEYS})
+        for i in range(count)]
+
+
+class NullSink(Sink):
+    """
+    Stands in for the DatabaseClient, counting the rows written.
+    """
+    def __init__(self) -> None:
+        self.rows_written = 0
+
+    def write(self, item, immediate_commit: bool=False) -> None:
+        self.rows_written += 1
+
+    def write_many(self, items: list) -> None:
+        self.rows_written += len(items)
+
+    def write_columns(self, batch) -> None:
+        self.rows_written += len(batch)
+
+    def close(self) -> None:
+        pass
+
+
+def bench_stats(window_sizes: list, steps: int) -> list:
+    """
+    Measures the per-step cost of `Statistics.process` and the per-row cost of
+        `Statistics.process_batch` for each window size.
+    """
+    results = []
+    draws = np.random.default_rng(0).uniform(-5, 5, size=steps).cumsum()
+    for window in window_sizes:
+        # stepwise, as MonteCarloSimulation.step drives it
+        sample_queue = deque(maxlen=window + 5)
+        stats = Statistics(sample_periods=[window], sample_queue=sample_queue)
+        values = draws.tolist()
+        begin = time.perf_counter()
+        for value in values:
+            sample_queue.append(value)
+            stats.process()
+        elapsed = time.perf_counter() - begin
+        results.append({
+            "benchmark": "stats",
+            "mode": "step",
+            "window": window,
+            "rows_per_sec": steps / elapsed,
+            "ns_per_row": elapsed / steps * 1e9,
+        })
+
+        # batched, as MonteCarloSimulation.step_batch drives it
+        sample_queue = deque(maxlen=window + 5)
+        stats = Statistics(sample_periods=[window], sample_queue=sample_queue)
+        begin = time.perf_counter()
+        for start in range(0, steps, 1000):
+            stats.process_batch(draws[start:start + 1000])
+        elapsed = time.perf_counter() - begin
+        results.append({
+            "benchmark": "stats",
+            "mode": "batch",
+            "window": window,
+            "rows_per_sec": steps / elapsed,
+            "ns_per_row": elapsed / steps * 1e9,
+        })
+    return results
+
+
+def bench_scaling(sim_counts: list, sample_hz: int, duration: float, sched_workers: int) -> list:
+    """
+    Runs `sim_count` simulations in this process for `duration` seconds writing
+        to a NullSink, and compares the achieved rate with the requested one.
+
+    CPU time is the process time over the run, so it includes any other thread.
+    """
+    results = []
+    for sim_count in sim_counts:
+        scheduler = None
+        if sched_workers > 0:
+            scheduler = TickScheduler(workers=sched_workers)
+            scheduler.start()
+        sink = NullSink()
+        sims = [
+            MonteCarloSimulation(
+                sim_id=f"bench-{i}", db_client=sink, sample_hz=sample_hz, 
+                scheduler=scheduler, seed=i)
+            for i in range(sim_count)]
+
+        cpu_begin = time.process_time()
+        begin = time.perf_counter()
+        for sim in sims:
+            sim.start()
+        time.sleep(duration)
+        for sim in sims:
+            sim.pause()
+        elapsed = time.perf_counter() - begin
+        cpu = time.process_time() - cpu_begin
+        for sim in sims:
+            sim.close()
+        if scheduler is not None:
+            scheduler.stop()
+
+        results.append({
+            "benchmark": "scaling",
+            "sims": sim_count,
+            "sample_hz": sample_hz,
+            "sched_workers": sched_workers,
+            "rows_per_sec": sink.rows_written / elapsed,
+            "rate_ratio": sink.rows_written / (elapsed * sim_count * sample_hz),
+            "cpu_percent": cpu / elapsed * 100,
+        })
+    return results
+
+
+def bench_ensemble(path_counts: list, steps: int) -> list:
+    """
+    Measures the cost per step of an EnsembleSimulation for each number of paths,
+        against a single path MonteCarloSimulation step, writing to a NullSink.
+    """
+    sims = [("single", 1, MonteCarloSimulation(sim_id="bench", db_client=NullSink(), seed=0))]
+    sims += [
+        ("ensemble", paths, EnsembleSimulation(sim_id="bench", db_client=NullSink(), paths=paths, seed=0))
+        for paths in path_counts]
+
+    results = []
+    for mode, paths, sim in sims:
+        # fill the windows first, stats are only computed once a window is full
+        for _ in range(SAMPLE_PERIODS[-1]):
+            sim.step()
+        begin = time.perf_counter()
+        for _ in range(steps):
+            sim.step()
+        elapsed = time.perf_counter() - begin
+        results.append({
+            "benchmark": "ensemble",
+            "mode": mode,
+            "paths": paths,
+            "rows_per_sec": steps / elapsed,
+            "path_steps_per_sec": steps * paths / elapsed,
+            "us_per_step": elapsed / steps * 1e6,
+        })
+    return results
+
+
+def bench_cadence(cadences: list, sample_hz: int, steps: int) -> list:
+    """
+    Measures the CPU per step of a simulation with the default sample periods
+        for each stat cadence, writing to a NullSink.
+
+    Time cadences run on a virtual clock advancing `1 / sample_hz` per step,
+    so they are due as often as at `sample_hz` without waiting for it.
+    `cpu_pct` is the share of a core the simulation takes at `sample_hz`.
+    """
+    results = []
+    for cadence in cadences:
+        sim = MonteCarloSimulation(
+            sim_id="bench", db_client=NullSink(), sample_hz=sample_hz, 
+            seed=0, stat_cadence=parse_cadence(cadence))
+        sim.stats.clock = lambda: sim.samples / sample_hz
+        # fill the windows first, stats are only computed once a window is full
+        for _ in range(SAMPLE_PERIODS[-1]):
+            sim.step()
+        begin = time.process_time()
+        for _ in range(steps):
+            sim.step()
+        elapsed = time.process_time() - begin
+        results.append({
+            "benchmark": "cadence",
+            "cadence": cadence or "every sample",
+            "rows_per_sec": steps / elapsed,
+            "us_per_step": elapsed / steps * 1e6,
+            "cpu_pct": elapsed / steps * sample_hz * 100,
+        })
+    return results
+
+
+def bench_ingest(buffer_sizes: list, repeat: int, database_url: str=None) -> list:
+    """
+    Compares rows/sec of the ORM and COPY ingest paths for each buffer size,
+        COPY only runs against PostgreSQL.
+
+    Rows are written under a throwaway sim_id which is removed afterwards.
+    """
+    db_client = DatabaseClient(
+        num_buffers=1, buffer_limit=max(buffer_sizes), rollups=False, database_url=database_url)
+    sim_id = f"bench-{uuid.uuid4().hex[:6]}"
+    db_client.write(SimID(sim_id=sim_id), immediate_commit=True)
+
+    strategies = {"orm": db_client.ingest_orm}
+    if db_client.engine.dialect.name == "postgresql":
+        strategies["copy"] = db_client.ingest_copy
+    results = []
+    start_time = datetime.utcnow()
+    try:
+        for buffer_size in buffer_sizes:
+            for name, ingest in strategies.items():
+                timings = []
+                for _ in range(repeat):
+                    samples = make_samples(sim_id, buffer_size, start_time)
+                    start_time += timedelta(milliseconds=20) * buffer_size
+                    begin = time.perf_counter()
+                    ingest(samples)
+                    timings.append(time.perf_counter() - begin)
+                results.append({
+                    "benchmark": "ingest",
+                    "dialect": db_client.engine.dialect.name,
+                    "strategy": name,
+                    "buffer_size": buffer_size,
+                    "rows_per_sec": buffer_size / min(timings),
+                })
+    finally:
+        with Session(db_client.engine) as session:
+            session.exec(delete(SampleData).where(SampleData.sim_id == sim_id))
+            session.exec(delete(SimID).where(SimID.sim_id == sim_id))
+            session.commit()
+        db_client.close()
+
+    return results
+
+
+def bench_async_ingest(rows: int, flushes: list, producers: int=8, database_url: str=None) -> list:
+    """
+    Rows/sec through AsyncDatabaseClient for each number of concurrent flushes,
+        from `producers` threads writing like simulations do. The client is 
+        closed inside the timing, so the rate includes the last flushes.
+
+    Requires the async driver (asyncpg, or aiosqlite for SQLite). Rows are 
+        written under throwaway sim_ids which are removed afterwards. On 
+        PostgreSQL both the INSERT and the COPY ingest are measured.
+    """
+    db_client = DatabaseClient(num_buffers=1, rollups=False, database_url=database_url)
+    ingest_modes = ["insert", "copy"] if db_client.engine.dialect.name == "postgresql" else ["insert"]
+    results = []
+    per_producer = rows // producers
+    start_time = datetime.utcnow()
+    try:
+        for max_flushes, ingest_mode in itertools.product(flushes, ingest_modes):
+            try:
+                async_client = AsyncDatabaseClient(
+                    max_flushes=max_flushes, ingest_mode=ingest_mode, rollups=False, database_url=database_url)
+            except ImportError as e:
+                logger.warning(f"skipping async ingest, driver not installed: {e}")
+                return results
+            sim_ids = [f"bench-{uuid.uuid4().hex[:6]}" for _ in range(producers)]
+            batches = [make_samples(sim_id, per_producer, start_time) for sim_id in sim_ids]
+            for sim_id in sim_ids:
+                async_client.write(SimID(sim_id=sim_id), immediate_commit=True)
+
+            def produce(samples: list) -> None:
+                for sample in samples:
+                    async_client.write(sample)
+
+            threads = [threading.Thread(target=produce, args=(batch,)) for batch in batches]
+            begin = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            async_client.close()
+            elapsed = time.perf_counter() - begin
+
+            results.append({
+                "benchmark": "ingest",
+                "dialect": async_client.engine.dialect.name,
+                "strategy": f"async-{async_client.ingest_mode}",
+                "flushes": max_flushes,
+                "rows_per_sec": per_producer * producers / elapsed,
+            })
+            with Session(db_client.engine) as session:
+                session.exec(delete(SampleData).where(SampleData.sim_id.in_(sim_ids)))
+                session.exec(delete(SimID).where(SimID.sim_id.in_(sim_ids)))
+                session.commit()
+    finally:
+        db_client.close()
+
+    return results
+
+
+def layout_tables(dialect: str) -> dict:
+    """
+    Standalone copies of the sampledata layouts: `json`, every stat in a JSON 
+        blob as before, and `typed`, a double precision column per stat.
+    """
+    metadata = MetaData()
+    base = lambda: [
+        Column("timestamp", DateTime, primary_key=True),
+        Column("sim_id", String, primary_key=True),
+        Column("samples", Integer),
+        Column("value", Float),
+        Column("mark", Float),
+        Column("delta", Float)]
+    json_table = Table("bench_layout_json", metadata, *base(), Column("statistics", JSON))
+    typed_table = Table(
+        "bench_layout_typed", metadata, *base(), Column("statistics", SampleData.__table__.c.statistics.type),
+        *[Column(key, Double) for key in STAT_COLUMNS])
+
+    stat = STAT_COLUMNS[-1]
+    if dialect == "postgresql":
+        minute = "date_trunc('minute', timestamp)"
+        json_stat = f"(statistics->>'{stat}')::double precision"
+    else:
+        minute = "strftime('%Y-%m-%d %H:%M', timestamp)"
+        json_stat = f"json_extract(statistics, '$.{stat}')"
+    query = "SELECT {minute} AS t, avg({stat}) FROM {table} WHERE sim_id = :sim_id GROUP BY 1"
+    return {
+        "json": (json_table, query.format(minute=minute, stat=json_stat, table=json_table.name)),
+        "typed": (typed_table, query.format(minute=minute, stat=stat, table=typed_table.name)),
+    }
+
+
+def table_bytes(connection, dialect: str, table: str) -> float:
+    if dialect == "postgresql":
+        return connection.execute(text(f"SELECT pg_total_relation_size('{table}')")).scalar()
+    # needs SQLite built with the dbstat virtual table
+    return connection.execute(text(f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{table}'")).scalar()
+
+
+def bench_layout(count: int, repeat: int, database_url: str=None) -> list:
+    """
+    Compares storage per row and the latency of a dashboard style query 
+        (per minute average of a stat) of the JSON and typed stat layouts.
+
+    `count` rows of one sim are written to throwaway tables, dropped afterwards.
+    """
+    db_client = DatabaseClient(num_buffers=1, rollups=False, database_url=database_url)
+    dialect = db_client.engine.dialect.name
+    tables = layout_tables(dialect)
+    metadata = next(iter(tables.values()))[0].metadata
+    samples = make_samples("bench", count, datetime(2024, 1, 1))
+
+    results = []
+    try:
+        metadata.create_all(db_client.engine)
+        for layout, (table, query) in tables.items():
+            if layout == "json":
+                rows = [
+                    {"timestamp": sample.timestamp, "sim_id": sample.sim_id, "samples": sample.samples,
+                     "value": sample.value, "mark": sample.mark, "delta": sample.delta,
+                     "statistics": sample.statistics}
+                    for sample in samples]
+            else:
+                rows = [
+                    dict(zip(table.columns.keys(), copy_row(sample)))
+                    for sample in samples]
+                for row in rows:
+                    row["statistics"] = None
+            with db_client.engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+                if dialect == "postgresql":
+                    connection.execute(text(f"ANALYZE {table.name}"))
+
+            timings = []
+            with db_client.engine.connect() as connection:
+                size = table_bytes(connection, dialect, table.name)
+                for _ in range(repeat):
+                    begin = time.perf_counter()
+                    connection.execute(text(query), {"sim_id": "bench"}).all()
+                    timings.append(time.perf_counter() - begin)
+
+            results.append({
+                "benchmark": "layout",
+                "dialect": dialect,
+                "layout": layout,
+                "rows": count,
+                "rows_per_sec": count / min(timings),
+                "bytes_per_row": size / count,
+                "query_ms": min(timings) * 1000,
+            })
+    finally:
+        metadata.drop_all(db_client.engine)
+        db_client.close()
+
+    return results
+
+
+def bench_records(count: int) -> list:
+    """
+    Compares construction rate and retained memory per buffered row of
+        SampleData and the hot path SampleRecord, measured with tracemalloc.
+    """
+    results = []
+    start_time = datetime.utcnow()
+    for row_type in (SampleData, SampleRecord):
+        begin = time.perf_counter()
+        make_samples("bench", count, start_time, row_type)
+        elapsed = time.perf_counter() - begin
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        rows = make_samples("bench", count, start_time, row_type)
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rows
+
+        results.append({
+            "benchmark": "records",
+            "row_type": row_type.__name__,
+            "rows_per_sec": count / elapsed,
+            "bytes_per_row": (after - before) / count,
+            "peak_bytes_per_row": (peak - before) / count,
+        })
+    return results
+
+
+def result_key(result: dict) -> tuple:
+    """
+    Identifies a result by its benchmark and parameters, the non-float values.
+    """
+    return tuple((key, value) for key, value in result.items() if not isinstance(value, float))
+
+
+def print_results(results: list) -> None:
+    for result in results:
+        params = ", ".join(
+            f"{key}={value}" for key, value in result.items()
+            if key not in ("benchmark", "rows_per_sec") and not isinstance(value, float))
+        metrics = ", ".join(
+            f"{key}={value:,.{2 if value < 10 else 0}f}" for key, value in result.items()
+            if key not in ("rows_per_sec", "baseline_ratio") and isinstance(value, float))
+        ratio = result.get("baseline_ratio")
+        print(
+            f"{result['benchmark']:>10s} | {params:<40s} | {result['rows_per_sec']:>14,.0f} rows/s"
+            + (f" | {ratio:6.2f}x baseline" if ratio is not None else "")
+            + (f" | {metrics}" if metrics else ""))
+
+
+def compare_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    """
+    Sets `baseline_ratio` (rows/sec over the baseline's) on the results found in 
+        the baseline file.
+
+    Returns:
+        list: The results slower than the baseline by more than `tolerance`.
+    """
+    with open(baseline_path) as file:
+        baseline = {result_key(result): result for result in json.load(file)["results"]}
+
+    regressions = []
+    for result in results:
+        reference = baseline.get(result_key(result))
+        if reference is None:
+            continue
+        result["baseline_ratio"] = result["rows_per_sec"] / reference["rows_per_sec"]
+        if result["baseline_ratio"] < 1 - tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def save_results(results: list, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump({
+            "created": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, file, indent=2)
+
+
+def parse_cvars() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--json", type=str, help="write the results to this file, usable as a baseline")
+    common.add_argument(
+        "--baseline", type=str, help="results file to compare with, exits 1 on regressions")
+    common.add_argument(
+        "--tolerance", type=float, default=0.1, help="slowdown vs the baseline tolerated")
+
+    stats = argparse.ArgumentParser(add_help=False)
+    stats.add_argument(
+        "--windows", type=int, nargs="+", default=[23, 223, 2230, 22300], help="stat window sizes")
+    stats.add_argument(
+        "--steps", type=int, default=100000, help="samples processed per window size")
+
+    scaling = argparse.ArgumentParser(add_help=False)
+    scaling.add_argument(
+        "--sims", type=int, nargs="+", default=[10, 100, 500], help="simulations per process")
+    scaling.add_argument(
+        "--sample-hz", type=int, default=50, help="sample rate of each simulation")
+    scaling.add_argument(
+        "--duration", type=float, default=5.0, help="seconds run per simulation count")
+    scaling.add_argument(
+        "--sched-workers", type=int, default=1, help="scheduler threads, 0 for a thread per simulation")
+
+    ensemble = argparse.ArgumentParser(add_help=False)
+    ensemble.add_argument(
+        "--paths", type=int, nargs="+", default=[100, 1000, 10000], help="paths per ensemble")
+    ensemble.add_argument(
+        "--ensemble-steps", type=int, default=2000, help="steps timed per path count")
+
+    cadence = argparse.ArgumentParser(add_help=False)
+    cadence.add_argument(
+        "--cadences", type=str, nargs="+", default=["", "*=10", "*=1s", "*=demand"], 
+        help="stat cadences to compare, see statistics.parse_cadence")
+    cadence.add_argument(
+        "--cadence-hz", type=int, default=50, help="sample rate the CPU share is reported at")
+    cadence.add_argument(
+        "--cadence-steps", type=int, default=50000, help="steps timed per cadence")
+
+    ingest = argparse.ArgumentParser(add_help=False)
+    ingest.add_argument(
+        "--buffer-sizes", type=int, nargs="+", default=[500, 1000, 5000, 10000],
+        help="rows per flush")
+    ingest.add_argument(
+        "--repeat", type=int, default=3, help="runs per buffer size, the best is reported")
+    ingest.add_argument(
+        "--database-url", type=str, help="database to ingest into, e.g. sqlite:///bench.db (default: config)")
+    ingest.add_argument(
+        "--flushes", type=int, nargs="+", default=[1, 4], help="concurrent flushes of the async client")
+    ingest.add_argument(
+        "--async-rows", type=int, default=50000, help="rows written through the async client per run")
+
+    records = argparse.ArgumentParser(add_help=False)
+    records.add_argument(
+        "--count", type=int, default=100000, help="rows to build")
+
+    layout = argparse.ArgumentParser(add_help=False)
+    layout.add_argument(
+        "--rows", type=int, default=200000, help="rows written per layout")
+
+    subparsers.add_parser(
+        "stats", parents=[common, stats], help="Statistics cost per row vs window size")
+    subparsers.add_parser(
+        "scaling", parents=[common, scaling], help="achieved sample rate vs simulations per process")
+    subparsers.add_parser(
+        "ensemble", parents=[common, ensemble], help="ensemble step cost vs paths")
+    subparsers.add_parser(
+        "cadence", parents=[common, cadence], help="CPU per simulation vs stat cadence")
+    subparsers.add_parser(
+        "ingest", parents=[common, ingest], help="ORM vs COPY vs async ingest rows/sec")
+    subparsers.add_parser(
+        "records", parents=[common, records], help="SampleData vs SampleRecord cost per row")
+    subparsers.add_parser(
+        "layout", parents=[common, layout, ingest], help="JSON vs typed stat columns, size and query latency")
+    subparsers.add_parser(
+        "all", parents=[common, stats, scaling, ensemble, cadence, ingest, records, layout], help="every benchmark above")
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    cvars = parse_cvars()
+
+    results = []
+    if cvars.benchmark in ("stats", "all"):
+        results += bench_stats(cvars.windows, cvars.steps)
+    if cvars.benchmark in ("scaling", "all"):
+        results += bench_scaling(cvars.sims, cvars.sample_hz, cvars.duration, cvars.sched_workers)
+    if cvars.benchmark in ("ensemble", "all"):
+        results += bench_ensemble(cvars.paths, cvars.ensemble_steps)
+    if cvars.benchmark in ("cadence", "all"):
+        results += bench_cadence(cvars.cadences, cvars.cadence_hz, cvars.cadence_steps)
+    if cvars.benchmark in ("ingest", "all"):
+        results += bench_ingest(cvars.buffer_sizes, cvars.repeat, cvars.database_url)
+        results += bench_async_ingest(cvars.async_rows, cvars.flushes, database_url=cvars.database_url)
+    if cvars.benchmark in ("records", "all"):
+        results += bench_records(cvars.count)
+    if cvars.benchmark in ("layout", "all"):
+        results += bench_layout(cvars.rows, cvars.repeat, cvars.database_url)
+
+    regressions = []
+    if cvars.baseline:
+        regressions = compare_baseline(results, cvars.baseline, cvars.tolerance)
+
+    print_results(results)
+
+    if cvars.json:
+        save_results(results, cvars.json)
+
+    if regressions:
+        print(f"{len(regressions)} results regressed by more than {cvars.tolerance:.0%} vs {cvars.baseline}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
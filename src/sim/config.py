@@ -9,10 +9,34 @@ DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # database client
-DB_BUFFERS = os.getenv("DB_BUFFERS", 5)
-DB_BUFFER_LEN = os.getenv("DB_BUFFER_LEN", 500)
+DB_BUFFERS = int(os.getenv("DB_BUFFERS", 5))
+DB_BUFFER_LEN = int(os.getenv("DB_BUFFER_LEN", 500))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 1.0))
+DB_INGEST_MODE = os.getenv("DB_INGEST_MODE", "copy")  # copy | orm
+DB_PARTITION_DAYS_AHEAD = int(os.getenv("DB_PARTITION_DAYS_AHEAD", 3))
+DB_RETENTION_DAYS = int(os.getenv("DB_RETENTION_DAYS", 0))  # 0 keeps all data
+DB_ROLLUPS = os.getenv("DB_ROLLUPS", "1") == "1"
+DB_ASYNC_FLUSHES = int(os.getenv("DB_ASYNC_FLUSHES", 4))  # concurrent flushes of the asyncdb sink
+DB_ASYNC_PENDING = int(os.getenv("DB_ASYNC_PENDING", 50000))  # rows queued before producers block
+DB_ASYNC_INGEST_MODE = os.getenv("DB_ASYNC_INGEST_MODE", "insert")  # insert | copy, COPY is experimental
+
+# file sink, see sinks.ColumnarFileSink
+FILES_DIR = os.getenv("FILES_DIR", "./data/segments")  # ./data holds the docker volumes
+FILES_FORMAT = os.getenv("FILES_FORMAT", "raw")  # raw | parquet
+FILES_CHUNK = os.getenv("FILES_CHUNK", "1h")  # time covered per segment file
 
 # sims
+SIM_SINKS = os.getenv("SIM_SINKS", "db")  # comma separated: db, asyncdb, files
 NUM_SIMS = os.getenv("NUM_SIMS", 4)
 SIM_FREQ_LOW = os.getenv("SIM_FREQ_LOW", 20)
 SIM_FREQ_HIGH = os.getenv("SIM_FREQ_HIGH", 50)
+SIM_BATCH_SIZE = int(os.getenv("SIM_BATCH_SIZE", 1))
+SIM_WORKERS = int(os.getenv("SIM_WORKERS", 1))
+SIM_PATHS = int(os.getenv("SIM_PATHS", 0))  # paths per ensemble simulation, 0 runs single path simulations
+SIM_PATH_ROWS = int(os.getenv("SIM_PATH_ROWS", 0))  # paths of each ensemble also written as their own rows
+SIM_SHARED_WINDOWS = os.getenv("SIM_SHARED_WINDOWS", "0") == "1"  # publish histories to shared memory, see shared_window
+SIM_STAT_CADENCE = os.getenv("SIM_STAT_CADENCE", "")  # e.g. ema=10,*=500ms, see statistics.parse_cadence
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None  # None seeds from fresh entropy
+
+# scheduler, 0 runs each simulation on its own thread
+SCHED_WORKERS = int(os.getenv("SCHED_WORKERS", 1))
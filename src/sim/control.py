@@ -0,0 +1,124 @@
+"""
+Non-blocking dispatch of control actions to simulations.
+"""
+# locals
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+# project
+# ..
+
+# third party
+# ..
+
+# constants
+logger = logging.getLogger(__name__)
+ACTIONS = ("start", "pause", "resume", "stop", "restart", "mark", "clear_mark")
+
+
+class ControlDispatcher:
+    """
+    Runs control actions (stop, restart, ...) on a small thread pool so callers,
+    e.g. the web APIs, never block on a simulation joining its thread.
+
+    Commands for one simulation are queued and applied in the order they were
+    submitted by at most one worker at a time, commands for different
+    simulations run concurrently.
+
+    Attributes:
+        workers (int): The number of pool threads.
+        queues (dict): sim_id -> deque of (sim, action, future) waiting to run.
+        executor (ThreadPoolExecutor): The pool applying the commands.
+    """
+    def __init__(self, workers: int=16) -> None:
+        self.workers = workers
+        self.queues: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="control")
+
+    def submit(self, sim_id: str, sim: object, action: str) -> Future:
+        """
+        Queue an action for a simulation.
+
+        Args:
+            sim_id (str): The simulation id, commands are ordered per id.
+            sim (object): The simulation or its proxy.
+            action (str): One of `ACTIONS`.
+
+        Returns:
+            Future: Resolves to None once applied, or to the exception raised.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action: {action}")
+
+        future = Future()
+        with self.lock:
+            queue = self.queues.get(sim_id)
+            if queue is None:
+                # no worker is draining this simulation, start one
+                self.queues[sim_id] = deque([(sim, action, future)])
+                self.executor.submit(self.drain, sim_id)
+            else:
+                queue.append((sim, action, future))
+        return future
+
+    def submit_many(self, sims: Dict[str, object], action: str) -> Dict[str, Future]:
+        return {sim_id: self.submit(sim_id, sim, action) for sim_id, sim in sims.items()}
+
+    def drain(self, sim_id: str) -> None:
+        """
+        Apply the queued commands of a simulation until its queue is empty.
+        """
+        while True:
+            with self.lock:
+                queue = self.queues[sim_id]
+                if not queue:
+                    del self.queues[sim_id]
+                    return
+                sim, action, future = queue.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                logger.debug(f"applying {action} to {sim_id}")
+                getattr(sim, action)()
+                future.set_result(None)
+            except Exception as e:
+                logger.exception(f"{action} failed for {sim_id}")
+                future.set_exception(e)
+
+    @staticmethod
+    def results(futures: Dict[str, Future], timeout: Optional[float]=None) -> Dict[str, str]:
+        """
+        Wait up to `timeout` seconds for the futures and summarize each.
+
+        Returns:
+            dict: sim_id -> "ok", "pending" or "error: <detail>".
+        """
+        if timeout is None or timeout > 0:
+            wait(list(futures.values()), timeout=timeout)
+
+        results = {}
+        for sim_id, future in futures.items():
+            if not future.done():
+                results[sim_id] = "pending"
+            elif future.cancelled():
+                results[sim_id] = "error: cancelled"
+            elif future.exception() is not None:
+                results[sim_id] = f"error: {future.exception()}"
+            else:
+                results[sim_id] = "ok"
+        return results
+
+    def pending(self) -> List[str]:
+        with self.lock:
+            return list(self.queues)
+
+    def close(self, wait: bool=True) -> None:
+        """
+        Stop accepting commands, waiting for the queued ones to be applied.
+        """
+        self.executor.shutdown(wait=wait)
@@ -2,28 +2,228 @@
 Data Models
 """
 # locals
+import re
+import types
 import logging
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+
+# project
+from src.sim.statistics import stat_keys
 
 # third party
+import numpy as np
 from pydantic import BaseModel
-from sqlalchemy import Column
+from sqlalchemy import Column, Double, PrimaryKeyConstraint
 from sqlmodel import SQLModel, Field
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSON, JSONB
 
 # constants
 logger = logging.getLogger(__name__)
+# registered stats get a typed column, other stats (subclasses, `proc_` shim) go to the JSONB
+STAT_COLUMNS = [key for key in stat_keys() if re.fullmatch(r"[a-z_][a-z0-9_]*", key)]
+STAT_COLUMN_SET = frozenset(STAT_COLUMNS)
+
+
+def split_statistics(statistics: Optional[Dict[str, float]]) -> Tuple[dict, Optional[dict]]:
+    """
+    Splits a stats dict into the values of the typed stat columns and the 
+        other stats stored as JSONB, None when there are none.
+    """
+    if not statistics:
+        return {}, None
+    typed = {key: value for key, value in statistics.items() if key in STAT_COLUMN_SET}
+    if len(typed) == len(statistics):
+        return typed, None
+    return typed, {key: value for key, value in statistics.items() if key not in STAT_COLUMN_SET}
+
+
+def sample_data_namespace(namespace: dict) -> None:
+    """
+    Fills the class namespace of SampleData. The typed stat columns depend on
+        the registered stats, so the annotations are built as an explicit dict
+        rather than declared in a class body.
+    """
+    annotations = {
+        "timestamp": datetime,
+        "sim_id": str,
+        "samples": Optional[int],
+        "value": float,
+        "mark": Optional[float],
+        "delta": Optional[float],
+        "statistics": Optional[Dict[str, float]],
+    }
+    namespace.update(
+        __module__=__name__,
+        __qualname__="SampleData",
+        # keyed by (sim_id, timestamp) and range partitioned by time on postgres,
+        #   partitions are managed by DatabaseClient.setup_schema
+        __table_args__=(
+            PrimaryKeyConstraint("sim_id", "timestamp"),
+            {"postgresql_partition_by": "RANGE (timestamp)"},
+        ),
+        timestamp=Field(default=datetime.utcnow, primary_key=True),
+        sim_id=Field(foreign_key="simid.sim_id", primary_key=True),
+        samples=None,
+        mark=None,
+        delta=None,
+        statistics=Field(
+            default=None,
+            sa_column=Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))),
+    )
+    # a double precision column per registered stat, see STAT_COLUMNS
+    for key in STAT_COLUMNS:
+        annotations[key] = Optional[float]
+        namespace[key] = Field(default=None, sa_column=Column(key, Double))
+    namespace["__annotations__"] = annotations
+
+
+SampleData = types.new_class("SampleData", (SQLModel,), {"table": True}, sample_data_namespace)
+
+
+class SampleRecord:
+    """
+    Compact sample row used on the simulation hot path.
+
+    Avoids the per-sample validation and ORM instrumentation of SampleData,
+    buffered records are only turned into a database representation at flush time.
+    """
+    __slots__ = ("timestamp", "sim_id", "samples", "value", "mark", "delta", "statistics")
+
+    def __init__(self, 
+                 timestamp: datetime, 
+                 sim_id: str, 
+                 samples: Optional[int], 
+                 value: float, 
+                 mark: Optional[float]=None, 
+                 delta: Optional[float]=None, 
+                 statistics: Optional[Dict[str, float]]=None) -> None:
+        self.timestamp = timestamp
+        self.sim_id = sim_id
+        self.samples = samples
+        self.value = value
+        self.mark = mark
+        self.delta = delta
+        self.statistics = statistics
+
+    def to_model(self) -> SampleData:
+        typed, extra = split_statistics(self.statistics)
+        return SampleData(
+            timestamp=self.timestamp,
+            sim_id=self.sim_id,
+            samples=self.samples,
+            value=self.value,
+            mark=self.mark,
+            delta=self.delta,
+            statistics=extra,
+            **typed)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
-class SampleData(SQLModel, table=True):
-    timestamp: datetime = Field(default=datetime.utcnow, primary_key=True)
-    sim_id: str = Field(foreign_key="simid.sim_id")
+class SampleBatch:
+    """
+    Consecutive rows of one simulation as columns, produced by `step_batch`.
+
+    Sinks that can write the columns as they are (COPY, segments, files) take
+    the batch through `Sink.write_columns`, the others get `records()`.
+    Timestamps are UTC `datetime64[us]`, the mark is shared by every row and
+    stats a cadence has not evaluated yet are NaN.
+    """
+    __slots__ = ("sim_id", "timestamps", "samples", "values", "mark", "deltas", "statistics")
+
+    def __init__(self,
+                 sim_id: str,
+                 timestamps: np.ndarray,
+                 samples: np.ndarray,
+                 values: np.ndarray,
+                 mark: Optional[float],
+                 deltas: np.ndarray,
+                 statistics: Dict[str, np.ndarray]) -> None:
+        self.sim_id = sim_id
+        self.timestamps = timestamps
+        self.samples = samples
+        self.values = values
+        self.mark = mark
+        self.deltas = deltas
+        self.statistics = statistics
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def slice(self, start: int, stop: int) -> "SampleBatch":
+        """
+        The rows `start` to `stop`, as views of the columns.
+        """
+        return SampleBatch(
+            self.sim_id, self.timestamps[start:stop], self.samples[start:stop],
+            self.values[start:stop], self.mark, self.deltas[start:stop],
+            {key: column[start:stop] for key, column in self.statistics.items()})
+
+    def epoch_seconds(self) -> np.ndarray:
+        return self.timestamps.astype(np.int64) / 1e6
+
+    def isoformat(self) -> List[str]:
+        """
+        The timestamps formatted like `datetime.isoformat`, without microseconds when they are 0.
+        """
+        strings = np.datetime_as_string(self.timestamps, unit="us")
+        whole = self.timestamps.astype(np.int64) % 1_000_000 == 0
+        if whole.any():
+            strings[whole] = np.datetime_as_string(self.timestamps[whole], unit="s")
+        return strings.tolist()
+
+    def column(self, key: str) -> list:
+        """
+        The values of a stat, None where it is NaN or the batch has no such stat.
+        """
+        column = self.statistics.get(key)
+        if column is None:
+            return [None] * len(self)
+        if np.isnan(column).any():
+            return np.where(np.isnan(column), None, column).tolist()
+        return column.tolist()
+
+    def records(self) -> List[SampleRecord]:
+        """
+        A SampleRecord per row, for the sinks that need row objects.
+        """
+        keys = list(self.statistics)
+        columns = [self.column(key) for key in keys]
+        return [
+            SampleRecord(
+                timestamp=timestamp,
+                sim_id=self.sim_id,
+                samples=sample,
+                value=value,
+                mark=self.mark,
+                delta=delta,
+                statistics=dict(zip(keys, row)))
+            for timestamp, sample, value, delta, row in zip(
+                self.timestamps.tolist(), self.samples.tolist(), self.values.tolist(),
+                self.deltas.tolist(), zip(*columns) if columns else [()] * len(self))]
+
+
+class SampleRollup(SQLModel, table=True):
+    # downsampled samples per sim_id, maintained by DatabaseClient as rows are written
+    __table_args__ = (
+        PrimaryKeyConstraint("sim_id", "resolution", "bucket"),
+    )
+    sim_id: str = Field(foreign_key="simid.sim_id", primary_key=True)
+    resolution: str = Field(primary_key=True)  # 1s | 1m | 1h
+    bucket: datetime = Field(primary_key=True)
+    count: int
+    value_min: float
+    value_max: float
+    value_avg: float
+    value_last: float
+    last_timestamp: datetime
     samples: Optional[int] = None
-    value: float
     mark: Optional[float] = None
     delta: Optional[float] = None
-    statistics: Optional[Dict[str, float]] = Field(default_factory=dict, sa_column=Column(JSON))
+    statistics_avg: Optional[Dict[str, float]] = Field(default_factory=dict, sa_column=Column(JSON))
+    statistics_last: Optional[Dict[str, float]] = Field(default_factory=dict, sa_column=Column(JSON))
 
 
 class SimID(SQLModel, table=True):
@@ -34,3 +234,11 @@ class SimulationControlRequest(BaseModel):
     sim_id: str
     action: str
     additional_data: Optional[dict] = None
+
+
+class BulkControlRequest(BaseModel):
+    action: str
+    sim_ids: Optional[List[str]] = None
+    pattern: Optional[str] = None  # glob matched against the simulation ids
+    wait: bool = False
+    timeout: float = 30.0
@@ -2,75 +2,817 @@
 DB Client
 """
 # locals
-import queue
+import io
+import csv
+import re
+import json
+import time
+import struct
+import itertools
 import logging
-from typing import Union
+import threading
+from typing import List, Optional, Union
+from datetime import datetime, timedelta
 
 # project
-from src.sim.data_model import SampleData, SimID
+from src.sim.data_model import (
+    STAT_COLUMN_SET, STAT_COLUMNS, SampleBatch, SampleData, SampleRecord, SampleRollup, SimID, split_statistics)
+from src.sim.metrics import Counter, Gauge, Histogram
+from src.sim.rollups import Rollups
+from src.sim.sinks import Sink
 from src.sim.config import DATABASE_URL
 
 # third party
+import numpy as np
+from sqlalchemy import JSON, Connection, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import create_engine, SQLModel, Session
 
 # constants
 logger = logging.getLogger(__name__)
+COPY_COLUMNS = [column.name for column in SampleData.__table__.columns]
+COPY_JSON_COLUMNS = {
+    column.name for column in SampleData.__table__.columns if isinstance(column.type, JSON)}
+SAMPLES_TABLE = SampleData.__tablename__
+PARTITION_BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+PARTITION_MAINTENANCE_INTERVAL = 3600  # seconds
+DB_ROWS_BUFFERED = Counter(
+    "db_rows_buffered_total", "Rows added to the ring buffers")
+DB_ROWS_WRITTEN = Counter(
+    "db_rows_written_total", "Rows ingested into the database")
+DB_ROWS_DROPPED = Counter(
+    "db_rows_dropped_total", "Rows dropped after a failed ingest")
+DB_BUFFER_WAITS = Counter(
+    "db_buffer_waits_total", "Times a producer blocked on a full ring buffer")
+DB_BUFFERED_ROWS = Gauge(
+    "db_buffered_rows", "Rows waiting to be written, per database client", ("client",))
+CLIENT_IDS = itertools.count()  # tells the clients of a process apart in their metrics
+DB_FLUSH_SECONDS = Histogram(
+    "db_flush_seconds", "Time spent per flush of all ring buffers")
+DB_FLUSH_ROWS = Histogram(
+    "db_flush_rows", "Rows per flush of all ring buffers",
+    buckets=(0, 10, 100, 500, 1000, 5000, 10000, 50000, 100000))
+COPY_SAMPLES_SQL = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)".format(
+    table=SampleData.__tablename__,
+    columns=", ".join(f'"{name}"' for name in COPY_COLUMNS))
+COPY_BINARY_SQL = COPY_SAMPLES_SQL.replace("(FORMAT csv)", "(FORMAT binary)")
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")  # binary timestamps count microseconds from it
 
 
-class DatabaseClient:
+def copy_row(sample: Union[SampleRecord, SampleData]) -> list:
+    """
+    Converts a sample row to CSV fields for COPY, None becomes an
+        unquoted empty field (NULL). Registered stats fill their typed 
+        columns and the other stats are serialized to the JSON column.
+    """
+    typed, extra = split_statistics(sample.statistics)
+    row = []
+    for name in COPY_COLUMNS:
+        if name in COPY_JSON_COLUMNS:
+            value = json.dumps(extra) if extra else None
+        elif name in typed:
+            value = typed[name]
+        else:
+            value = getattr(sample, name, None)
+        row.append(value)
+    return row
+
+
+def csv_field(value) -> str:
+    """
+    A single value formatted and quoted as `csv.writer` would.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow([value])
+    return buffer.getvalue()
+
+
+def csv_column(column: np.ndarray) -> List[str]:
+    """
+    The fields of a float column as `csv.writer` writes them, NaN as an empty field (NULL).
+    """
+    values = column.tolist()
+    if np.isnan(column).any():
+        return [repr(value) if value == value else "" for value in values]
+    return list(map(repr, values))
+
+
+def csv_lines(columns: List[List[str]]) -> str:
+    """
+    Joins formatted fields, column by column, into CSV lines ending like `csv.writer`'s.
+    """
+    return "".join(f"{line}\r\n" for line in map(",".join, zip(*columns)))
+
+
+def copy_columns(batch: SampleBatch) -> List[List[str]]:
+    """
+    The CSV fields for COPY of a batch, column by column, as `copy_row` 
+        formats a row. Formatting the floats is most of the cost, so the 
+        columns are formatted as they are rather than per row.
+    """
+    rows = len(batch)
+    null = [""] * rows
+    extra_keys = [key for key in batch.statistics if key not in STAT_COLUMN_SET]
+    columns = []
+    for name in COPY_COLUMNS:
+        if name in COPY_JSON_COLUMNS:
+            if extra_keys:
+                extras = zip(*[batch.column(key) for key in extra_keys])
+                columns.append([csv_field(json.dumps(dict(zip(extra_keys, row)))) for row in extras])
+            else:
+                columns.append(null)
+        elif name == "timestamp":
+            columns.append(batch.isoformat())
+        elif name == "sim_id":
+            columns.append([csv_field(batch.sim_id)] * rows)
+        elif name == "samples":
+            columns.append(list(map(str, batch.samples.tolist())))
+        elif name == "value":
+            columns.append(csv_column(batch.values))
+        elif name == "mark":
+            columns.append([csv_field(batch.mark)] * rows)
+        elif name == "delta":
+            columns.append(csv_column(batch.deltas))
+        elif name in batch.statistics:
+            columns.append(csv_column(batch.statistics[name]))
+        else:
+            columns.append(null)
+    return columns
+
+
+def copy_binary(batch: SampleBatch) -> Optional[bytes]:
+    """
+    The rows of a batch as binary COPY tuples, without the header and trailer.
+
+    Floats are written as they are instead of being formatted, the rows are
+    packed as NumPy structured arrays, a run of rows with the same NULL columns
+    at a time. Stats without a typed column vary the JSON column per row, those
+    batches return None and go through `copy_columns`.
+    """
+    if any(key not in STAT_COLUMN_SET for key in batch.statistics):
+        return None
+    rows = len(batch)
+    sim_id = batch.sim_id.encode()
+    timestamps = (batch.timestamps - PG_EPOCH).astype(np.int64)
+    nulls = np.ones((rows, len(STAT_COLUMNS)), dtype=bool)
+    for index, key in enumerate(STAT_COLUMNS):
+        if key in batch.statistics:
+            nulls[:, index] = np.isnan(batch.statistics[key])
+    bounds = [0, *(np.flatnonzero((nulls[1:] != nulls[:-1]).any(axis=1)) + 1).tolist(), rows]
+
+    parts = []
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        fields = {}  # name -> (format, values), in COPY_COLUMNS order
+        for name in COPY_COLUMNS:
+            if name == "timestamp":
+                fields[name] = (">i8", timestamps[begin:end])
+            elif name == "sim_id":
+                fields[name] = (f"S{len(sim_id)}", sim_id)
+            elif name == "samples":
+                fields[name] = (">i4", batch.samples[begin:end])
+            elif name == "value":
+                fields[name] = (">f8", batch.values[begin:end])
+            elif name == "mark":
+                fields[name] = None if batch.mark is None else (">f8", batch.mark)
+            elif name == "delta":
+                fields[name] = (">f8", batch.deltas[begin:end])
+            elif name in COPY_JSON_COLUMNS or nulls[begin, STAT_COLUMNS.index(name)]:
+                fields[name] = None
+            else:
+                fields[name] = (">f8", batch.statistics[name][begin:end])
+
+        dtype = [("fields", ">i2")]
+        for name, field in fields.items():
+            dtype.append((f"{name}_length", ">i4"))
+            if field is not None:
+                dtype.append((name, field[0]))
+        data = np.empty(end - begin, dtype=dtype)
+        data["fields"] = len(fields)
+        for name, field in fields.items():
+            if field is None:
+                data[f"{name}_length"] = -1
+            else:
+                data[f"{name}_length"] = data.dtype[name].itemsize
+                data[name] = field[1]
+        parts.append(data.tobytes())
+    return b"".join(parts)
+
+
+def item_rows(item) -> int:
+    """
+    The rows an item buffered by the clients holds, a SampleBatch holds several.
+    """
+    return len(item) if isinstance(item, SampleBatch) else 1
+
+
+def sample_row(sample: Union[SampleRecord, SampleData]) -> dict:
+    """
+    The column values of a sample row for a Core insert, registered stats 
+        fill their typed columns and the other stats go to the JSON column.
+    """
+    typed, extra = split_statistics(sample.statistics)
+    row = {}
+    for name in COPY_COLUMNS:
+        if name in COPY_JSON_COLUMNS:
+            row[name] = extra
+        elif name in typed:
+            row[name] = typed[name]
+        else:
+            row[name] = getattr(sample, name, None)
+    return row
+
+
+def create_schema(connection: Connection) -> None:
+    """
+    Creates the tables. On PostgreSQL an unpartitioned `sampledata` table from
+        before partitioning is migrated first, stats stored as a JSON blob are 
+        moved to their typed columns and the default partition is created.
+    """
+    if connection.dialect.name != "postgresql":
+        SQLModel.metadata.create_all(connection)
+        return
+
+    migrate_unpartitioned(connection)
+    SQLModel.metadata.create_all(connection)
+    migrate_statistics(connection)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SAMPLES_TABLE}_default "
+        f"PARTITION OF {SAMPLES_TABLE} DEFAULT"))
+
+
+def migrate_unpartitioned(connection: Connection) -> None:
+    """
+    Turns an existing unpartitioned `sampledata` table into the partition
+        holding everything up to the end of its last day. Renaming and 
+        attaching does not rewrite the rows.
+    """
+    relkind = connection.execute(text(
+        f"SELECT relkind FROM pg_class WHERE oid = to_regclass('{SAMPLES_TABLE}')")).scalar()
+    if relkind != "r":
+        return
+
+    legacy = f"{SAMPLES_TABLE}_legacy"
+    logger.warning(f"migrating unpartitioned {SAMPLES_TABLE} table to {legacy}")
+    connection.execute(text(f"ALTER TABLE {SAMPLES_TABLE} RENAME TO {legacy}"))
+    connection.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {SAMPLES_TABLE}_pkey"))
+    # a partition must have exactly the parent's columns, bring the stats to the current layout first
+    migrate_statistics(connection, legacy)
+    SQLModel.metadata.create_all(connection)
+
+    upper = connection.execute(text(
+        f"SELECT date_trunc('day', max(timestamp)) + interval '1 day' FROM {legacy}")).scalar()
+    if upper is None:
+        connection.execute(text(f"DROP TABLE {legacy}"))
+        return
+
+    connection.execute(text(
+        f"ALTER TABLE {SAMPLES_TABLE} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat()}')"))
+
+
+def migrate_statistics(connection: Connection, table: str=SAMPLES_TABLE) -> None:
+    """
+    Adds the typed column of any newly registered stat, and turns the JSON 
+        `statistics` blob of the previous layout into the typed columns plus 
+        a JSONB holding the remaining stats. The latter rewrites the table once.
+
+    Args:
+        connection (Connection): A PostgreSQL connection.
+        table (str): The samples table, or the legacy table before it is attached.
+    """
+    columns = dict(connection.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        f"WHERE table_schema = current_schema() AND table_name = '{table}'")).all())
+
+    for key in STAT_COLUMNS:
+        if key not in columns:
+            logger.info(f"adding column {key} to {table}")
+            connection.execute(text(
+                f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "{key}" double precision'))
+
+    if columns.get("statistics") != "json":
+        return
+
+    logger.warning(f"migrating {table} statistics to typed columns, this rewrites the table")
+    assignments = ", ".join(
+        f""""{key}" = (statistics->>'{key}')::double precision""" for key in STAT_COLUMNS)
+    connection.execute(text(
+        f"UPDATE {table} SET {assignments} WHERE statistics IS NOT NULL"))
+    typed_keys = ", ".join(f"'{key}'" for key in STAT_COLUMNS)
+    connection.execute(text(
+        f"ALTER TABLE {table} ALTER COLUMN statistics TYPE jsonb "
+        f"USING NULLIF(statistics::jsonb - ARRAY[{typed_keys}]::text[], '{{}}'::jsonb)"))
+
+
+def list_partitions(connection: Connection) -> list:
+    """
+    Lists the range partitions of `sampledata`.
+
+    Returns:
+        list: (name, lower, upper) tuples, unbounded ends are None.
+    """
+    rows = connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        f"WHERE pg_inherits.inhparent = to_regclass('{SAMPLES_TABLE}')")).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND_PATTERN.search(bound)
+        if match is None:
+            continue  # default partition
+        lower, upper = (
+            None if value in ("MINVALUE", "MAXVALUE") else datetime.fromisoformat(value.strip("'"))
+            for value in match.groups())
+        partitions.append((name, lower, upper))
+    return partitions
+
+
+def create_partitions(connection: Connection, start: datetime, end: datetime) -> None:
+    """
+    Creates the daily partitions covering `start` to `end` that do not exist yet,
+        each in its own savepoint so one failing does not abort the others.
+    """
+    existing = list_partitions(connection)
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        next_day = day + timedelta(days=1)
+        covered = any(
+            (lower is None or lower < next_day) and (upper is None or upper > day)
+            for _, lower, upper in existing)
+        if not covered:
+            name = f"{SAMPLES_TABLE}_p{day:%Y%m%d}"
+            try:
+                with connection.begin_nested():
+                    connection.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {SAMPLES_TABLE} "
+                        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{next_day.isoformat()}')"))
+                logger.debug(f"created partition {name}")
+            except Exception:
+                # e.g. rows for that day already landed in the default partition
+                logger.exception(f"failed to create partition {name}")
+        day = next_day
+
+
+def drop_expired_partitions(connection: Connection, retention_days: int) -> None:
+    """
+    Drops the partitions whose rows are all older than `retention_days`.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    for name, _, upper in list_partitions(connection):
+        if upper is not None and upper <= cutoff:
+            connection.execute(text(f"DROP TABLE {name}"))
+            logger.info(f"dropped expired partition {name}")
+
+
+def maintain_partitions(connection: Connection, days_ahead: int, retention_days: int=0) -> None:
+    """
+    Creates the partitions `days_ahead` days into the future and, when 
+        `retention_days` is set, drops the partitions older than that.
+    """
+    now = datetime.utcnow()
+    create_partitions(connection, now, now + timedelta(days=days_ahead + 1))
+    if retention_days > 0:
+        drop_expired_partitions(connection, retention_days)
+
+
+def setup_database(database_url: str=None, partition_days_ahead: int=3, retention_days: int=0) -> None:
+    """
+    Creates or migrates the schema and the upcoming partitions once, for clients
+        created with `setup_schema=False`, e.g. by several worker processes.
+    """
+    engine = create_engine(database_url or DATABASE_URL, echo=False)
+    try:
+        with engine.begin() as connection:
+            create_schema(connection)
+            if connection.dialect.name == "postgresql":
+                maintain_partitions(connection, partition_days_ahead, retention_days)
+    finally:
+        engine.dispose()
+
+
+def rollup_upsert(dialect: str):
+    """
+    The statement upserting SampleRollup rows for `dialect`, None when the 
+        dialect has no `ON CONFLICT` and rows are merged through the ORM.
+    """
+    if dialect == "postgresql":
+        statement = postgresql_insert(SampleRollup.__table__)
+    elif dialect == "sqlite":
+        statement = sqlite_insert(SampleRollup.__table__)
+    else:
+        return None
+    return statement.on_conflict_do_update(
+        index_elements=["sim_id", "resolution", "bucket"],
+        set_={
+            column.name: statement.excluded[column.name] 
+            for column in SampleRollup.__table__.columns if not column.primary_key})
+
+
+class RingBuffer:
+    """
+    Single-producer ring buffer of pending rows.
+
+    The producer only advances `head` and the flusher only advances `tail`, 
+    so neither side takes a lock on the hot path. Items are counted in rows,
+    a SampleBatch takes a single slot but counts its rows, so every pending
+    item still has a slot.
+
+    Attributes:
+        capacity (int): The number of slots, and the rows pending once the ring is full.
+        slots (list): Preallocated storage, slot `i % capacity` holds item `i`.
+        slot_rows (list): The rows of the item in each slot.
+        head (int): Items written so far.
+        tail (int): Items drained so far.
+        head_rows (int): Rows written so far.
+        tail_rows (int): Rows drained so far.
+    """
+    def __init__(self, capacity:int) -> None:
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.slot_rows = [0] * capacity
+        self.head = 0
+        self.tail = 0
+        self.head_rows = 0
+        self.tail_rows = 0
+
+    def pending(self) -> int:
+        return self.head_rows - self.tail_rows
+
+    def full(self) -> bool:
+        return self.head_rows - self.tail_rows >= self.capacity
+
+    def put(self, item, rows:int=1) -> None:
+        """
+        Writes an item of `rows` rows, the caller makes sure the ring is not full.
+        """
+        index = self.head % self.capacity
+        self.slots[index] = item
+        self.slot_rows[index] = rows
+        self.head_rows += rows
+        self.head += 1
+
+    def drain(self) -> list:
+        """
+        Takes every item written so far, releasing their slots.
+        """
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return []
+
+        start = tail % self.capacity
+        end = head % self.capacity
+        if start < end:
+            items = self.slots[start:end]
+            rows = sum(self.slot_rows[start:end])
+            self.slots[start:end] = [None] * (end - start)
+        else:
+            items = self.slots[start:] + self.slots[:end]
+            rows = sum(self.slot_rows[start:]) + sum(self.slot_rows[:end])
+            self.slots[start:] = [None] * (self.capacity - start)
+            self.slots[:end] = [None] * end
+
+        self.tail_rows += rows
+        self.tail = head
+        return items
+
+
+class DatabaseClient(Sink):
     """
     A database client that manages buffered writes to a database using SQLAlchemy and SQLModel.
 
-    The client maintains multiple buffers to handle high-throughput data writes efficiently.
-    Data can be written either immediately or buffered and committed in bulk when the buffer
-    reaches its limit. The buffers are flushed either when they are full or when the client is closed.
+    Data can be written either immediately or buffered and committed in bulk. Every producer 
+    (simulation, keyed by `sim_id`) writes to its own single-producer ring buffer, so writers 
+    neither contend with each other nor wait on a commit. A background flusher thread drains 
+    the rings whenever one holds `buffer_limit` rows, and every `flush_interval` seconds so 
+    low-rate writers show up promptly. A writer only blocks (backpressure) when its ring of 
+    `num_buffers * buffer_limit` rows is full. The rings are drained when the client is closed.
+
+    Buffered rows are ingested with `COPY ... FROM STDIN` (`ingest_mode="copy"`, PostgreSQL 
+    only) or through the ORM with `bulk_save_objects` (`ingest_mode="orm"`).
+
+    On PostgreSQL `sampledata` is range partitioned by day on `timestamp`, see `create_schema`.
+    Partitions `partition_days_ahead` days into the future are kept created and, when 
+    `retention_days` is set, partitions older than that are dropped.
+
+    With `rollups` enabled every flushed batch is also folded into 1s/1m/1h rollups per
+    sim_id (`samplerollup`), which the dashboard queries instead of the raw rows.
+
+    `database_url` overrides the configured DATABASE_URL, e.g. a SQLite file for benchmarks.
+    With `setup_schema=False` the schema is expected to exist already, see `setup_database`.
     """
-    def __init__(self, num_buffers:int=3, buffer_limit:int=500) -> None:
+    def __init__(self, 
+                 num_buffers:int=3, 
+                 buffer_limit:int=500, 
+                 flush_interval:float=1.0,
+                 ingest_mode:str="copy",
+                 partition_days_ahead:int=3,
+                 retention_days:int=0,
+                 rollups:bool=True,
+                 database_url:str=None,
+                 setup_schema:bool=True) -> None:
         self.engine = create_engine(
-            DATABASE_URL,
+            database_url or DATABASE_URL,
             echo=False,  # Set to True for debugging SQL statements
             pool_pre_ping=True,  # Use pre-ping to avoid stale connections in the pool
             pool_size=10,  # Default pool size
             max_overflow=20  # Overflow size of the pool
         )
-        SQLModel.metadata.create_all(self.engine)
-        self.buffer_limit = buffer_limit  # Maximum size of each buffer
-        self.num_buffers = num_buffers  # Number of buffers to use
-        self.buffers = [queue.Queue() for _ in range(num_buffers)]
-        self.current_buffer = 0  # Index of the current buffer to use
+        self.partition_days_ahead = partition_days_ahead
+        self.retention_days = retention_days  # 0 keeps every partition
+        self.next_maintenance = time.monotonic() + PARTITION_MAINTENANCE_INTERVAL
+        if setup_schema:
+            self.setup_schema()
+        if ingest_mode == "copy" and self.engine.dialect.name != "postgresql":
+            logger.warning(f"COPY ingest requires postgresql, using the ORM for {self.engine.dialect.name}")
+            ingest_mode = "orm"
+        self.ingest_mode = ingest_mode
+        self.rollups = Rollups() if rollups else None
+        self.buffer_limit = buffer_limit  # Rows per flush
+        self.num_buffers = num_buffers  # Flushes worth of rows each producer may have pending
+        self.rings = {}  # Ring buffer per producer
+        self.rings_lock = threading.Lock()  # Only taken to add a ring
+        self.flush_interval = flush_interval  # Seconds between flushes of partial rings
+        self.flush_requested = threading.Event()
+        self.drained = threading.Condition()
+        self.closing = False
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.client_label = f"db-{next(CLIENT_IDS)}"
+        DB_BUFFERED_ROWS.labels(self.client_label).set_function(self.pending)
+        self.flusher = threading.Thread(target=self.run_flusher, name="db-flusher", daemon=True)
+        self.flusher.start()
 
     def write(self, 
-        sample_data: Union[SampleData, SimID], immediate_commit:bool=False) -> None:
+        sample_data: Union[SampleRecord, SampleData, SimID], immediate_commit:bool=False) -> None:
         """
         Writes data to the database, either immediately 
-            or by adding it to a buffer for bulk processing.
+            or by adding it to the producer's ring buffer for bulk processing.
         """
         if immediate_commit:
+            if isinstance(sample_data, SampleRecord):
+                sample_data = sample_data.to_model()
             with Session(self.engine) as session:
                 session.add(sample_data)
                 session.commit()
             return
 
-        # add item to buffer
-        self.buffers[self.current_buffer].put(sample_data)
+        self.buffer(sample_data.sim_id, sample_data)
+
+    def write_many(self, items: list) -> None:
+        """
+        Adds several items to the buffers for bulk processing.
+        """
+        for sample_data in items:
+            self.write(sample_data)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        """
+        Adds the rows of a batch to the buffers as they are, in slices of at 
+            most `buffer_limit` rows. They are COPYed from the columns, row 
+            objects are only built for the ORM ingest.
+        """
+        for start in range(0, len(batch), self.buffer_limit):
+            part = batch.slice(start, start + self.buffer_limit)
+            self.buffer(batch.sim_id, part, len(part))
+
+    def buffer(self, producer: str, item, rows: int=1) -> None:
+        """
+        Adds an item to the producer's ring buffer, waiting for space when it is full.
+        """
+        ring = self.rings.get(producer)
+        if ring is None:
+            ring = self.add_ring(producer)
+
+        if ring.full():
+            self.wait_for_space(ring)
+
+        # add item to the ring
+        ring.put(item, rows)
+        DB_ROWS_BUFFERED.inc(rows)
         
-        # check if item caused buffer overflow and flush if so
-        if self.buffers[self.current_buffer].qsize() >= self.buffer_limit:
-            self.flush_buffer(self.current_buffer)
-            self.current_buffer = (self.current_buffer + 1) % self.num_buffers
+        # wake the flusher once a flush worth of rows is pending
+        if ring.pending() >= self.buffer_limit and not self.flush_requested.is_set():
+            self.flush_requested.set()
+
+    def add_ring(self, producer: str) -> RingBuffer:
+        """
+        Creates the ring buffer of a new producer.
+        """
+        with self.rings_lock:
+            if producer not in self.rings:
+                self.rings[producer] = RingBuffer(self.num_buffers * self.buffer_limit)
+            return self.rings[producer]
+
+    def wait_for_space(self, ring: RingBuffer) -> None:
+        """
+        Blocks a producer whose ring is full until the flusher drained it.
+        """
+        logger.warning("database flushes falling behind, waiting for a free slot")
+        DB_BUFFER_WAITS.inc()
+        with self.drained:
+            while ring.full():
+                self.flush_requested.set()
+                self.drained.wait(timeout=self.flush_interval)
+
+    def pending(self) -> int:
+        """
+        Rows waiting in the ring buffers.
+        """
+        return sum(ring.pending() for ring in list(self.rings.values()))
+
+    def run_flusher(self) -> None:
+        """
+        Flusher thread loop, drains the rings when a flush is requested or 
+            every `flush_interval` seconds, and a final time once closing.
+        """
+        while True:
+            self.flush_requested.wait(timeout=self.flush_interval)
+            self.flush_requested.clear()
+            closing = self.closing
+            self.flush()
+            if closing:
+                return
+            if time.monotonic() >= self.next_maintenance:
+                self.next_maintenance = time.monotonic() + PARTITION_MAINTENANCE_INTERVAL
+                self.maintain_partitions()
+
+    def setup_schema(self) -> None:
+        """
+        Creates the tables, migrating an existing schema, see `create_schema`.
+        """
+        with self.engine.begin() as connection:
+            create_schema(connection)
+        self.maintain_partitions()
+
+    def partitions(self) -> list:
+        with self.engine.connect() as connection:
+            return list_partitions(connection)
+
+    def ensure_partitions(self, start: datetime, end: datetime) -> None:
+        with self.engine.begin() as connection:
+            create_partitions(connection, start, end)
+
+    def maintain_partitions(self) -> None:
+        """
+        Creates the upcoming partitions and applies the retention.
+        """
+        if self.engine.dialect.name != "postgresql":
+            return
+        try:
+            with self.engine.begin() as connection:
+                maintain_partitions(connection, self.partition_days_ahead, self.retention_days)
+        except Exception:
+            logger.exception("partition maintenance failed")
+
+    def flush(self) -> None:
+        """
+        Drains every ring buffer and writes the rows to the database
+            in batches of at most `buffer_limit` rows.
+        """
+        begin = time.perf_counter()
+        items = []
+        for ring in list(self.rings.values()):
+            items.extend(ring.drain())
+
+        with self.drained:
+            self.drained.notify_all()
+
+        # batches hold up to `buffer_limit` rows each, see write_columns
+        batch, rows, total = [], 0, 0
+        for item in items:
+            count = item_rows(item)
+            if batch and rows + count > self.buffer_limit:
+                self.flush_batch(batch, rows)
+                batch, rows = [], 0
+            batch.append(item)
+            rows += count
+            total += count
+        if batch:
+            self.flush_batch(batch, rows)
+
+        if items:
+            DB_FLUSH_ROWS.observe(total)
+            DB_FLUSH_SECONDS.observe(time.perf_counter() - begin)
+
+    def flush_batch(self, batch: list, rows: int) -> None:
+        """
+        Writes a batch of `rows` rows and folds it into the rollups.
+        """
+        try:
+            self.ingest(batch)
+            self.rows_written += rows
+            DB_ROWS_WRITTEN.inc(rows)
+        except Exception:
+            self.rows_dropped += rows
+            DB_ROWS_DROPPED.inc(rows)
+            logger.exception(f"failed to flush {rows} rows, dropping them")
+            return
+
+        if self.rollups is not None:
+            try:
+                self.write_rollups(self.rollups.add(
+                    [item for item in batch if isinstance(item, (SampleRecord, SampleData, SampleBatch))]))
+            except Exception:
+                logger.exception("failed to update rollups")
 
-    def flush_buffer(self, index:int) -> None:
+    def ingest(self, items: list) -> None:
         """
-        Flushes the buffer at the specified index by writing 
-            its contents to the database.
+        Writes a batch of buffered items with the configured ingest mode.
         """
+        if self.ingest_mode == "copy":
+            samples = [item for item in items if isinstance(item, (SampleRecord, SampleData, SampleBatch))]
+            others = [item for item in items if not isinstance(item, (SampleRecord, SampleData, SampleBatch))]
+            if others:
+                self.ingest_orm(others)
+            self.ingest_copy(samples)
+        else:
+            self.ingest_orm(items)
+
+    def ingest_orm(self, items: list) -> None:
+        """
+        Writes a batch of items through the ORM, converting sample records 
+            and the rows of batches to SampleData.
+        """
+        models = []
+        for item in items:
+            if isinstance(item, SampleBatch):
+                models.extend(record.to_model() for record in item.records())
+            elif isinstance(item, SampleRecord):
+                models.append(item.to_model())
+            else:
+                models.append(item)
         with Session(self.engine) as session:
-            items = []
-            while not self.buffers[index].empty():
-                items.append(self.buffers[index].get())
-            
-            session.bulk_save_objects(items)
+            session.bulk_save_objects(models)
             session.commit()
 
+    def ingest_copy(self, samples: list) -> None:
+        """
+        Streams a batch of SampleRecord or SampleData rows and SampleBatch columns 
+            with `COPY ... FROM STDIN`, using a connection from the engine's pool. Rows go 
+            as CSV, batches as binary tuples unless they carry stats without a column.
+        """
+        if not samples:
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        tuples = []
+        for sample in samples:
+            if isinstance(sample, SampleBatch):
+                binary = copy_binary(sample)
+                if binary is not None:
+                    tuples.append(binary)
+                else:
+                    buffer.write(csv_lines(copy_columns(sample)))
+            else:
+                writer.writerow(copy_row(sample))
+
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                if buffer.tell():
+                    buffer.seek(0)
+                    cursor.copy_expert(COPY_SAMPLES_SQL, buffer)
+                if tuples:
+                    cursor.copy_expert(COPY_BINARY_SQL, io.BytesIO(
+                        COPY_BINARY_HEADER + b"".join(tuples) + COPY_BINARY_TRAILER))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def write_rollups(self, rollups: list) -> None:
+        """
+        Upserts the current state of the touched rollup buckets.
+        """
+        if not rollups:
+            return
+
+        statement = rollup_upsert(self.engine.dialect.name)
+        if statement is None:
+            with Session(self.engine) as session:
+                for rollup in rollups:
+                    session.merge(SampleRollup(**rollup))
+                session.commit()
+            return
+
+        with self.engine.begin() as connection:
+            connection.execute(statement, rollups)
+
     def close(self) -> None:
+        """
+        Drains the ring buffers, stops the flusher and disposes the engine.
+        """
+        self.closing = True
+        self.flush_requested.set()
+        self.flusher.join()
         self.engine.dispose()
+        DB_BUFFERED_ROWS.remove(self.client_label)
@@ -0,0 +1,213 @@
+"""
+Ensemble simulation, many Monte Carlo paths advanced as one NumPy vector.
+"""
+# locals
+import logging
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+# project
+from src.sim.data_model import SampleRecord, SimID
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import Sink
+from src.sim.statistics import RollingStatistics
+
+# third party
+import numpy as np
+
+# constants
+logger = logging.getLogger(__name__)
+QUANTILES = (5, 50, 95)  # percentiles across the paths reported as p5, p50, p95
+
+
+def ensemble_keys(periods: list, quantiles: Tuple[float, ...]=QUANTILES) -> List[str]:
+    """
+    The stat keys of an ensemble's aggregated rows: the per path averages,
+        keyed like `Statistics`, then the spread across the paths.
+    """
+    return (
+        [f"ema_{period}" for period in periods]
+        + [f"running_avg_{period}" for period in periods]
+        + ["std"]
+        + [f"p{quantile:g}" for quantile in quantiles])
+
+
+class EnsembleSimulation(MonteCarloSimulation):
+    """
+    Runs `paths` independent random walks as one simulation, each step draws
+    a vector of changes and moves every path at once.
+
+    Every step writes one aggregated row under the simulation's sim_id: `value`
+    is the mean across the paths, the statistics hold the cross path mean of
+    each path's own `ema_*` and `running_avg_*`, the standard deviation (`std`)
+    and the `quantiles` (`p5`, `p50`, `p95`) of the path values. Mark and delta
+    apply to the mean. Rows per path are only written for the first `path_rows`
+    paths, under the sim_ids `<sim_id>-path-<i>`.
+
+    The averages are linear, so the mean of the paths' averages is the average
+    of the mean path: a scalar RollingStatistics over the mean gives the
+    aggregated row's, and the per path averages are only kept, by a
+    RollingStatistics pushed whole vectors, for the `path_rows` written paths.
+    A step costs a draw, a mean, a variance and a partition over the paths
+    instead of a Python step per path.
+
+    Lifecycle, scheduling and control are those of MonteCarloSimulation, a
+    stat cadence does not apply.
+
+    Attributes:
+        paths (int): The number of paths.
+        quantiles (tuple): Percentiles across the paths reported per row.
+        path_rows (int): Paths also written as their own rows.
+        path_ids (list): The sim_ids of those paths.
+        values (np.ndarray): The current value of every path.
+        rolling (RollingStatistics): Running sums and EMA of the mean path.
+        path_rolling (RollingStatistics): Per path running sums and EMAs of
+            the written paths, None without `path_rows`.
+    """
+    def __init__(self,
+                 sim_id: str,
+                 db_client: Sink,
+                 paths: int=1000,
+                 quantiles: Tuple[float, ...]=QUANTILES,
+                 path_rows: int=0,
+                 **kwargs) -> None:
+        self.paths = paths
+        self.quantiles = tuple(quantiles)
+        self.path_rows = min(path_rows, paths)
+        self.path_ids = [f"{sim_id}-path-{i}" for i in range(self.path_rows)]
+        super().__init__(sim_id, db_client, **kwargs)
+        self.reset_paths()
+        for path_id in self.path_ids:
+            db_client.write(SimID(sim_id=path_id), immediate_commit=True)
+
+    def reset(self) -> None:
+        super().reset()
+        self.reset_paths()
+
+    def reset_paths(self) -> None:
+        self.values = np.zeros(self.paths)
+        self.scratch = np.empty(self.paths)  # partitioned in place for the quantiles
+        self.rolling = RollingStatistics(periods=self.sample_periods)
+        self.path_rolling = RollingStatistics(periods=self.sample_periods) if self.path_rows else None
+        self.stat_keys = ensemble_keys(self.sample_periods, self.quantiles)
+        self.history = self.new_history(self.stat_keys)
+        # linear interpolation between the closest ranks, as np.percentile
+        positions = np.asarray(self.quantiles, dtype=float) / 100 * (self.paths - 1)
+        self.quantile_lower = np.floor(positions).astype(int)
+        self.quantile_upper = np.ceil(positions).astype(int)
+        self.quantile_fraction = positions - self.quantile_lower
+        self.quantile_ranks = np.unique(np.concatenate((self.quantile_lower, self.quantile_upper)))
+
+    def evaluate_stats(self) -> dict:
+        """
+        Nothing to evaluate, the aggregated rows are computed every step and the
+            base Statistics, which a stat cadence applies to, is not used.
+        """
+        return {}
+
+    def averages(self, rolling: RollingStatistics) -> dict:
+        """
+        The `ema_*` and `running_avg_*` of a RollingStatistics, scalars or one
+            per path, 0 until `period` samples were pushed.
+        """
+        stats = {}
+        for period in self.sample_periods:
+            stats[f"ema_{period}"] = rolling.ema(period) if rolling.count >= period else 0.0
+        for period in self.sample_periods:
+            stats[f"running_avg_{period}"] = rolling.running_avg(period) if rolling.count >= period else 0.0
+        return stats
+
+    def percentiles(self) -> np.ndarray:
+        scratch = self.scratch
+        scratch[:] = self.values
+        scratch.partition(self.quantile_ranks)
+        lower = scratch[self.quantile_lower]
+        return lower + (scratch[self.quantile_upper] - lower) * self.quantile_fraction
+
+    def advance(self, timestamp: datetime, lower: float=-5.0, upper: float=5.0) -> List[SampleRecord]:
+        """
+        Moves every path one step.
+
+        Returns:
+            list: The aggregated row followed by the rows of the first `path_rows` paths.
+        """
+        self.values += self.rng.uniform(lower, upper, self.paths)
+        self.samples += 1
+        mean = float(self.values.mean())
+        self.current_value = mean
+        self.rolling.push(mean)
+
+        statistics = self.averages(self.rolling)
+        deviations = self.values - mean
+        statistics["std"] = float(np.sqrt(np.dot(deviations, deviations) / self.paths))
+        for quantile, value in zip(self.quantiles, self.percentiles().tolist()):
+            statistics[f"p{quantile:g}"] = value
+
+        if self.rolling.count > self.sample_periods[-1]:
+            self.update(statistics)
+
+        rows = [SampleRecord(
+            timestamp=timestamp,
+            sim_id=self.sim_id,
+            samples=self.samples,
+            value=mean,
+            mark=self.mark_value,
+            delta=self.max_delta,
+            statistics=statistics)]
+
+        if self.path_rolling is not None:
+            # a copy per step, the rolling ring keeps the previous ones
+            values = self.values[:self.path_rows].copy()
+            self.path_rolling.push(values)
+            columns = {
+                key: stat.tolist() if isinstance(stat, np.ndarray) else [stat] * self.path_rows
+                for key, stat in self.averages(self.path_rolling).items()}
+            keys = list(columns)
+            for path_id, value, row in zip(self.path_ids, values.tolist(), zip(*columns.values())):
+                rows.append(SampleRecord(
+                    timestamp=timestamp,
+                    sim_id=path_id,
+                    samples=self.samples,
+                    value=value,
+                    statistics=dict(zip(keys, row))))
+        return rows
+
+    def record(self, rows: List[SampleRecord]) -> None:
+        aggregate = rows[0]
+        self.history.append(
+            aggregate.timestamp, aggregate.samples, aggregate.value,
+            aggregate.mark, aggregate.delta, aggregate.statistics)
+
+    def step(self) -> None:
+        """
+        Moves every path one step and writes the rows.
+        """
+        with self.data_lock:
+            rows = self.advance(datetime.utcnow())
+            if len(rows) == 1:
+                self.db_client.write(rows[0])
+            else:
+                self.db_client.write_many(rows)
+            if self.feed is not None:
+                self.feed.publish(rows[0])
+            self.record(rows)
+
+    def step_batch(self, steps: int, start_time: datetime=None) -> None:
+        """
+        Takes `steps` steps, timestamped `sample_frequency` apart starting at
+            `start_time` (default: now), and writes the rows in bulk.
+        """
+        with self.data_lock:
+            if start_time is None:
+                start_time = datetime.utcnow()
+            step = timedelta(seconds=self.sample_frequency)
+            payloads = []
+            aggregates = []
+            for i in range(steps):
+                rows = self.advance(start_time + step * i)
+                payloads.extend(rows)
+                aggregates.append(rows[0])
+                self.record(rows)
+            self.db_client.write_many(payloads)
+            if self.feed is not None:
+                self.feed.publish_many(aggregates)
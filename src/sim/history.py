@@ -0,0 +1,124 @@
+"""
+Columnar in-memory history of the most recent simulation rows.
+"""
+# locals
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+# project
+# ..
+
+# third party
+import numpy as np
+
+# constants
+logger = logging.getLogger(__name__)
+EPOCH = datetime(1970, 1, 1)
+BASE_FIELDS = ["timestamp", "samples", "value", "mark", "delta"]
+
+
+class SampleHistory:
+    """
+    Ring of full rows (timestamp, samples, value, mark, delta and one column per
+    stat key) backed by a preallocated NumPy structured array.
+
+    Written by the simulation only, readers copy the tail while the producer
+    keeps writing and discard rows it lapped. Timestamps are stored as UTC epoch
+    seconds and a missing mark or stat as NaN.
+
+    Attributes:
+        capacity (int): The number of rows kept.
+        fields (list): Column names, the base fields followed by the stat keys.
+        data (np.ndarray): The ring, row `i % capacity` holds row `i`.
+        head (int): Rows written so far.
+    """
+    def __init__(self, capacity: int, stat_keys: List[str]) -> None:
+        self.capacity = capacity
+        self.stat_keys = list(stat_keys)
+        self.fields = BASE_FIELDS + self.stat_keys
+        self.dtype = np.dtype([
+            (name, np.int64 if name == "samples" else np.float64) for name in self.fields])
+        self.data = np.zeros(capacity, dtype=self.dtype)
+        self.head = 0
+
+    def append(self,
+               timestamp: datetime,
+               samples: int,
+               value: float,
+               mark: Optional[float],
+               delta: float,
+               statistics: dict) -> None:
+        """
+        Writes a single row.
+        """
+        self.data[self.head % self.capacity] = (
+            (timestamp - EPOCH).total_seconds(),
+            samples,
+            value,
+            np.nan if mark is None else mark,
+            delta,
+            *[statistics.get(key, np.nan) for key in self.stat_keys])
+        self.head += 1
+
+    def append_many(self,
+                    timestamps: np.ndarray,
+                    samples: np.ndarray,
+                    values: np.ndarray,
+                    mark: Optional[float],
+                    deltas: np.ndarray,
+                    statistics: dict) -> None:
+        """
+        Writes a batch of rows given as columns, timestamps in epoch seconds.
+        """
+        count = len(values)
+        keep = min(count, self.capacity)
+        columns = {
+            "timestamp": timestamps,
+            "samples": samples,
+            "value": values,
+            "mark": np.full(count, np.nan if mark is None else mark),
+            "delta": deltas,
+        }
+        for key in self.stat_keys:
+            columns[key] = statistics.get(key, np.full(count, np.nan))
+
+        slots = np.arange(self.head + count - keep, self.head + count) % self.capacity
+        for name in self.fields:
+            self.data[name][slots] = columns[name][-keep:]
+        self.head += count
+
+    def update_latest(self, statistics: dict) -> None:
+        """
+        Overwrites stats of the newest row, e.g. ones evaluated on demand.
+        """
+        if self.head == 0:
+            return
+        row = self.data[(self.head - 1) % self.capacity]
+        for key, value in statistics.items():
+            if key in self.stat_keys:
+                row[key] = value
+
+    def tail(self, n: int, fields: Optional[List[str]]=None) -> np.ndarray:
+        """
+        Copies the last `n` rows, oldest first.
+
+        Args:
+            n (int): The number of rows wanted, capped at what is available.
+            fields (list): Columns to return, all when omitted.
+
+        Returns:
+            np.ndarray: A structured array with the requested fields.
+        """
+        head = self.head
+        n = max(min(n, head, self.capacity), 0)
+        start = head - n
+        rows = self.data[np.arange(start, head) % self.capacity]
+
+        # drop rows the producer overwrote while copying
+        lapped = max(self.head - self.capacity - start, 0)
+        rows = rows[lapped:]
+
+        if fields:
+            rows = np.array(rows[fields], dtype=[(name, self.dtype[name]) for name in fields])
+        return rows
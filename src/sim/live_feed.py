@@ -0,0 +1,161 @@
+"""
+In-process fan-out of simulation samples to live viewers.
+"""
+# locals
+import logging
+import threading
+from typing import Dict, List, Optional
+
+# project
+from src.sim.data_model import SampleRecord
+
+# third party
+# ..
+
+# constants
+logger = logging.getLogger(__name__)
+
+
+class SampleRing:
+    """
+    Fixed size ring of the most recent records of one simulation.
+
+    Written by a single producer (the simulation) and read by any number of
+    subscribers, each tracking its own cursor, so publishing costs the same
+    no matter how many viewers there are.
+
+    Attributes:
+        capacity (int): The number of slots.
+        slots (list): Slot `i % capacity` holds record `i`.
+        head (int): Records written so far.
+    """
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+
+    def append(self, record: SampleRecord) -> None:
+        self.slots[self.head % self.capacity] = record
+        self.head += 1
+
+    def since(self, cursor: int) -> tuple:
+        """
+        Reads the records written since `cursor`.
+
+        Args:
+            cursor (int): Sequence number of the first record wanted.
+
+        Returns:
+            tuple: (records, next cursor, records missed because they were overwritten).
+        """
+        head = self.head
+        start = max(cursor, head - self.capacity)
+        records = [self.slots[i % self.capacity] for i in range(start, head)]
+        # the producer may have lapped the oldest slots while reading
+        lapped = max(self.head - self.capacity - start, 0)
+        return records[lapped:], head, start - cursor + lapped
+
+
+class Subscription:
+    """
+    A viewer's position in the live feed.
+
+    Args:
+        feed (LiveFeed): The feed subscribed to.
+        sim_ids (list): Simulations to receive, None for all.
+        max_rate (float): Max records per second per simulation, when set only
+            the latest record per simulation is delivered each poll.
+        max_pending (int): Max records per simulation delivered per poll, older
+            ones are dropped.
+    """
+    def __init__(self,
+                 feed: "LiveFeed",
+                 sim_ids: Optional[List[str]]=None,
+                 max_rate: Optional[float]=None,
+                 max_pending: int=256) -> None:
+        if max_rate is not None and not max_rate > 0:
+            raise ValueError(f"max_rate must be > 0, got {max_rate}")
+        self.feed = feed
+        self.sim_ids = sim_ids
+        self.max_rate = max_rate
+        self.max_pending = max_pending
+        self.interval = 1 / max_rate if max_rate else feed.poll_interval
+        self.cursors: Dict[str, int] = {}
+        self.dropped = 0
+
+    def poll(self) -> List[dict]:
+        """
+        Collects the records published since the last poll.
+
+        Returns:
+            list: The records as dicts, oldest first per simulation.
+        """
+        events = []
+        sim_ids = self.sim_ids if self.sim_ids is not None else list(self.feed.rings)
+        for sim_id in sim_ids:
+            ring = self.feed.rings.get(sim_id)
+            if ring is None:
+                continue
+            cursor = self.cursors.get(sim_id)
+            if cursor is None:
+                # live only, start from the newest record
+                self.cursors[sim_id] = ring.head
+                continue
+
+            records, self.cursors[sim_id], missed = ring.since(cursor)
+            self.dropped += missed
+            if self.max_rate:
+                records = records[-1:]
+            elif len(records) > self.max_pending:
+                self.dropped += len(records) - self.max_pending
+                records = records[-self.max_pending:]
+            events.extend(record.to_dict() for record in records)
+        return events
+
+
+class LiveFeed:
+    """
+    Keeps a ring of recent records per simulation for live subscribers.
+
+    Attributes:
+        capacity (int): Records kept per simulation.
+        poll_interval (float): Seconds between polls of subscribers without a max rate.
+        rings (dict): sim_id -> SampleRing.
+    """
+    def __init__(self, capacity: int=1024, poll_interval: float=0.05) -> None:
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.rings: Dict[str, SampleRing] = {}
+        self.lock = threading.Lock()
+        self.subscribers = 0
+
+    def publish(self, record: SampleRecord) -> None:
+        """
+        Publishes a record, called by the simulation producing it.
+        """
+        ring = self.rings.get(record.sim_id)
+        if ring is None:
+            ring = self.add_ring(record.sim_id)
+        ring.append(record)
+
+    def publish_many(self, records: List[SampleRecord]) -> None:
+        for record in records:
+            self.publish(record)
+
+    def add_ring(self, sim_id: str) -> SampleRing:
+        with self.lock:
+            if sim_id not in self.rings:
+                self.rings[sim_id] = SampleRing(self.capacity)
+            return self.rings[sim_id]
+
+    def subscribe(self,
+                  sim_ids: Optional[List[str]]=None,
+                  max_rate: Optional[float]=None) -> Subscription:
+        subscription = Subscription(self, sim_ids, max_rate)
+        with self.lock:
+            self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            self.subscribers -= 1
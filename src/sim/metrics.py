@@ -0,0 +1,265 @@
+"""
+Minimal Prometheus style metrics, rendered in the text exposition format.
+"""
+# locals
+import bisect
+import logging
+import weakref
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+# project
+# ..
+
+# third party
+# ..
+
+# constants
+logger = logging.getLogger(__name__)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str="") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float=1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value", "function", "weak", "lock")
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.function = None
+        self.weak = False
+        self.lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float=1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def set_function(self, function: Callable[[], float], weak: bool=False) -> None:
+        """
+        Evaluate `function` at scrape time instead of tracking a value. With
+            `weak` only a weak reference to the method's object is kept, once
+            it is collected the child is no longer rendered.
+        """
+        self.function = weakref.WeakMethod(function) if weak else function
+        self.weak = weak
+
+    def get(self) -> Optional[float]:
+        if self.function is None:
+            return self.value
+        if self.weak:
+            function = self.function()
+            return function() if function is not None else None
+        return self.function()
+
+
+class HistogramChild:
+    """
+    Counts observations in preallocated buckets, `counts[i]` holds the
+        observations `<= bounds[i]` and above the previous bound.
+    """
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """
+        The bucket counts and sum, consistent with each other.
+        """
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class Metric(ABC):
+    """
+    A metric family, one child per label value combination.
+
+    The globals are updated from every simulation, scheduler and flusher
+    thread, so each child guards its updates with its own uncontended lock,
+    `+=` is not atomic across threads and increments would otherwise be lost.
+    Callers on hot paths keep the child from `labels` rather than looking it
+    up per update.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labelnames (tuple): The label names, empty for a single unlabeled child.
+        children (dict): Label values -> child.
+    """
+    kind = None
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Tuple[str, ...]=(),
+                 registry: "Registry"=None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[tuple, object] = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+        if not self.labelnames:
+            self.default = self.labels()
+
+    @abstractmethod
+    def new_child(self):
+        """
+        A child holding the state of one label value combination.
+        """
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def remove(self, *values: str) -> None:
+        with self.lock:
+            self.children.pop(values, None)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """
+        The exposition lines of every child.
+        """
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float=1) -> None:
+        self.default.inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, values)} {child.value}"
+            for values, child in list(self.children.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.default.set(value)
+
+    def set_function(self, function: Callable[[], float], weak: bool=False) -> None:
+        self.default.set_function(function, weak)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            try:
+                value = child.get()
+            except Exception:
+                logger.exception(f"failed to evaluate gauge {self.name}")
+                continue
+            if value is None:
+                continue
+            lines.append(f"{self.name}{format_labels(self.labelnames, values)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Tuple[str, ...]=(),
+                 buckets: Tuple[float, ...]=LATENCY_BUCKETS,
+                 registry: "Registry"=None) -> None:
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def new_child(self) -> HistogramChild:
+        return HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self.default.observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = format_labels(self.labelnames, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics exposed together, e.g. by the `/metrics` endpoint.
+    """
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
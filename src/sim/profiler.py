@@ -0,0 +1,141 @@
+"""
+In-process statistical stack sampler producing collapsed (flamegraph) stacks.
+"""
+# locals
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+# project
+from src.sim.simulator import MonteCarloSimulation
+
+# third party
+# ..
+
+# constants
+logger = logging.getLogger(__name__)
+SIM_FRAMES = ("run_simulation", "tick")  # frames whose `self` identifies the simulation
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread of the process every `interval` seconds
+    with `sys._current_frames()` and counts the identical stacks.
+
+    Stacks are rooted at `sim:<sim_id>` when the thread is running a simulation,
+    found from the `self` of its `run_simulation` or `tick` frame, and at
+    `thread:<name>` otherwise (db-flusher, scheduler workers, ...). Nothing is
+    added to the simulations' hot path, all the work happens on the sampler
+    thread, which costs a stack walk per thread per sample.
+
+    Attributes:
+        interval (float): Seconds between samples.
+        max_depth (int): Frames kept per stack, the outermost are dropped.
+        counts (Counter): Collapsed stack -> samples of the current or last run.
+        samples (int): Samples taken in the current or last run.
+    """
+    def __init__(self, interval: float=0.005, max_depth: int=64) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = Counter()
+        self.samples = 0
+        self.labels: Dict[object, str] = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started = None
+        self.duration = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration: Optional[float]=None, interval: Optional[float]=None) -> None:
+        """
+        Start sampling, for `duration` seconds or until `stop` when None.
+        """
+        if self.running:
+            raise RuntimeError("profiler already running")
+        if interval:
+            self.interval = interval
+        with self.lock:
+            self.counts = Counter()
+            self.samples = 0
+        self.duration = duration
+        self.started = time.monotonic()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+        logger.info(f"profiler started, interval {self.interval}s, duration {duration}s")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        deadline = self.started + self.duration if self.duration else None
+        while not self.stopped.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                self.collapse(frame, names.get(ident, str(ident)))
+                for ident, frame in sys._current_frames().items() if ident != own]
+            with self.lock:
+                self.counts.update(stacks)
+                self.samples += 1
+        logger.info(f"profiler stopped after {self.samples} samples")
+
+    def label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ",")
+            self.labels[code] = label
+        return label
+
+    def collapse(self, frame, thread_name: str) -> str:
+        """
+        Turns a thread's stack into `root;outer;...;inner`.
+        """
+        frames = []
+        root = f"thread:{thread_name}"
+        while frame is not None:
+            code = frame.f_code
+            frames.append(self.label(code))
+            if code.co_name in SIM_FRAMES:
+                sim = frame.f_locals.get("self")
+                if isinstance(sim, MonteCarloSimulation):
+                    root = f"sim:{sim.sim_id}"
+            frame = frame.f_back
+        frames = frames[:self.max_depth]
+        frames.append(root.replace(";", ",").replace(" ", "_"))
+        return ";".join(reversed(frames))
+
+    def collapsed(self, sim_id: Optional[str]=None) -> str:
+        """
+        The stacks in the collapsed format read by flamegraph.pl and speedscope,
+            one `stack count` line each.
+
+        Args:
+            sim_id (str): Only the stacks attributed to this simulation.
+        """
+        prefix = f"sim:{sim_id};" if sim_id else ""
+        with self.lock:
+            items = sorted(self.counts.items(), key=lambda item: -item[1])
+        return "".join(
+            f"{stack} {count}\n" for stack, count in items if stack.startswith(prefix))
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "duration": self.duration,
+            "samples": self.samples,
+            "stacks": len(self.counts),
+        }
@@ -0,0 +1,187 @@
+"""
+Incremental downsampled rollups of the sample rows.
+"""
+# locals
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+# project
+from src.sim.data_model import SampleBatch
+
+# third party
+import numpy as np
+
+# constants
+logger = logging.getLogger(__name__)
+RESOLUTIONS = {
+    "1s": lambda ts: ts.replace(microsecond=0),
+    "1m": lambda ts: ts.replace(second=0, microsecond=0),
+    "1h": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+}
+RESOLUTION_UNITS = {"1s": "s", "1m": "m", "1h": "h"}  # the same truncation on datetime64 columns
+
+
+class RollupBucket:
+    """
+    Running aggregate of the rows of one sim_id falling into one bucket.
+    """
+    __slots__ = (
+        "count", "value_sum", "value_min", "value_max", "value_last", "last_timestamp",
+        "samples", "mark", "delta", "statistics_sum", "statistics_count", "statistics_last")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.value_sum = 0.0
+        self.value_min = None
+        self.value_max = None
+        self.value_last = None
+        self.last_timestamp = None
+        self.samples = None
+        self.mark = None
+        self.delta = None
+        self.statistics_sum = {}
+        self.statistics_count = {}  # rows per stat, stats not evaluated yet are None
+        self.statistics_last = {}
+
+    def add(self, row) -> None:
+        value = row.value
+        self.count += 1
+        self.value_sum += value
+        if self.value_min is None or value < self.value_min:
+            self.value_min = value
+        if self.value_max is None or value > self.value_max:
+            self.value_max = value
+        self.value_last = value
+        self.last_timestamp = row.timestamp
+        self.samples = row.samples
+        self.mark = row.mark
+        self.delta = row.delta
+        statistics = row.statistics or {}
+        for key, stat in statistics.items():
+            if stat is None:
+                continue
+            self.statistics_sum[key] = self.statistics_sum.get(key, 0.0) + stat
+            self.statistics_count[key] = self.statistics_count.get(key, 0) + 1
+        self.statistics_last = statistics
+
+    def add_columns(self, batch: SampleBatch, start: int, stop: int) -> None:
+        """
+        Folds in the rows `start` to `stop` of a batch, as `add` for each row.
+        """
+        values = batch.values[start:stop]
+        value_min = float(values.min())
+        value_max = float(values.max())
+        self.count += len(values)
+        self.value_sum += float(values.sum())
+        if self.value_min is None or value_min < self.value_min:
+            self.value_min = value_min
+        if self.value_max is None or value_max > self.value_max:
+            self.value_max = value_max
+        self.value_last = float(values[-1])
+        self.last_timestamp = batch.timestamps[stop - 1].item()
+        self.samples = int(batch.samples[stop - 1])
+        self.mark = batch.mark
+        self.delta = float(batch.deltas[stop - 1])
+        statistics = {}
+        for key, column in batch.statistics.items():
+            stats = column[start:stop]
+            # NaN stats were not evaluated yet, as None in the rows
+            evaluated = ~np.isnan(stats)
+            count = int(evaluated.sum())
+            if count:
+                self.statistics_sum[key] = self.statistics_sum.get(key, 0.0) + float(stats[evaluated].sum())
+                self.statistics_count[key] = self.statistics_count.get(key, 0) + count
+            last = float(stats[-1])
+            statistics[key] = None if last != last else last
+        self.statistics_last = statistics
+
+    def to_dict(self, sim_id: str, resolution: str, bucket: datetime) -> dict:
+        return {
+            "sim_id": sim_id,
+            "resolution": resolution,
+            "bucket": bucket,
+            "count": self.count,
+            "value_min": self.value_min,
+            "value_max": self.value_max,
+            "value_avg": self.value_sum / self.count,
+            "value_last": self.value_last,
+            "last_timestamp": self.last_timestamp,
+            "samples": self.samples,
+            "mark": self.mark,
+            "delta": self.delta,
+            "statistics_avg": {
+                key: total / self.statistics_count[key] for key, total in self.statistics_sum.items()},
+            "statistics_last": self.statistics_last,
+        }
+
+
+class Rollups:
+    """
+    Maintains the open 1s/1m/1h buckets of every sim_id in memory.
+
+    Rows of a sim_id arrive in time order from a single writer, so only the
+    newest bucket per (sim_id, resolution) is kept. Each call to `add` returns 
+    the full state of the buckets it touched, to be upserted over the stored rows.
+
+    Attributes:
+        open_buckets (dict): (sim_id, resolution) -> (bucket start, RollupBucket).
+    """
+    def __init__(self, resolutions: List[str]=None) -> None:
+        self.resolutions = {
+            name: RESOLUTIONS[name] for name in (resolutions or list(RESOLUTIONS))}
+        self.open_buckets: Dict[Tuple[str, str], Tuple[datetime, RollupBucket]] = {}
+
+    def add(self, rows: list) -> List[dict]:
+        """
+        Folds sample rows into their buckets.
+
+        Args:
+            rows (list): SampleRecord or SampleData rows, or SampleBatch columns.
+
+        Returns:
+            list: A dict per touched bucket, keyed like SampleRollup.
+        """
+        touched = {}
+        for row in rows:
+            if isinstance(row, SampleBatch):
+                self.add_batch(row, touched)
+                continue
+            for resolution, truncate in self.resolutions.items():
+                key = (row.sim_id, resolution)
+                start = truncate(row.timestamp)
+                current = self.open_buckets.get(key)
+                if current is None or start > current[0]:
+                    current = (start, RollupBucket())
+                    self.open_buckets[key] = current
+                elif start < current[0]:
+                    logger.debug(f"skipping out of order row for {row.sim_id} in {resolution} rollup")
+                    continue
+                current[1].add(row)
+                touched[(row.sim_id, resolution, start)] = current[1]
+
+        return [
+            bucket.to_dict(sim_id, resolution, start)
+            for (sim_id, resolution, start), bucket in touched.items()]
+
+    def add_batch(self, batch: SampleBatch, touched: dict) -> None:
+        """
+        Folds the rows of a batch into their buckets, a run of rows per bucket at once.
+        """
+        if not len(batch):
+            return
+        for resolution in self.resolutions:
+            starts = batch.timestamps.astype(f"datetime64[{RESOLUTION_UNITS[resolution]}]")
+            bounds = [0, *(np.flatnonzero(np.diff(starts.astype(np.int64))) + 1).tolist(), len(batch)]
+            key = (batch.sim_id, resolution)
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                start = starts[begin].astype("datetime64[us]").item()
+                current = self.open_buckets.get(key)
+                if current is None or start > current[0]:
+                    current = (start, RollupBucket())
+                    self.open_buckets[key] = current
+                elif start < current[0]:
+                    logger.debug(f"skipping out of order rows for {batch.sim_id} in {resolution} rollup")
+                    continue
+                current[1].add_columns(batch, begin, end)
+                touched[(batch.sim_id, resolution, start)] = current[1]
@@ -0,0 +1,169 @@
+"""
+Tick scheduler driving many simulations from a small pool of threads.
+"""
+# locals
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Hashable
+
+# project
+from src.sim.metrics import Counter, Histogram
+
+# third party
+# ..
+
+# constants
+logger = logging.getLogger(__name__)
+SCHEDULER_LAG_SECONDS = Histogram(
+    "scheduler_lag_seconds", "How late ticks start vs their due time")
+SCHEDULER_RESYNCS = Counter(
+    "scheduler_resyncs_total", "Times an entry fell more than max_lag behind and was resynced")
+
+
+class TickScheduler:
+    """
+    Runs registered tick functions at fixed periods from a small worker pool.
+
+    Entries are kept in a heap ordered by their next due time. Due times are
+    advanced by the period from the previous due time rather than from the
+    end of the tick, so actual rates match the requested ones without drift.
+    An entry that falls more than `max_lag` seconds behind is resynced to the
+    current time instead of bursting to catch up.
+
+    An entry is only rescheduled once its tick has returned, so the same key
+    is never ticked by two workers at once. A key added again while its tick
+    is running, e.g. paused and resumed, is deferred until that tick returned.
+
+    Attributes:
+        workers (int): The number of worker threads.
+        max_lag (float): Seconds an entry may fall behind before it is resynced.
+        heap (list): (due, sequence, token, key, func, period) entries.
+        tokens (dict): The current token per key, entries with stale tokens are dropped.
+        in_flight (set): Keys whose tick is currently running.
+        deferred (dict): Entries added while their key was in flight, per key.
+        condition (Condition): Guards the heap and wakes the workers.
+    """
+    def __init__(self, workers: int=1, max_lag: float=1.0) -> None:
+        self.workers = workers
+        self.max_lag = max_lag
+        self.heap = []
+        self.tokens = {}
+        self.in_flight = set()
+        self.deferred = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def start(self) -> None:
+        """
+        Start the worker threads.
+        """
+        logger.debug(f"Starting scheduler with {self.workers} workers")
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.run_worker, name=f"scheduler-{i}", daemon=True)
+            for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker threads, waiting for running ticks to finish.
+        """
+        logger.debug("Stopping scheduler")
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def add(self, key: Hashable, func: Callable, period: float) -> None:
+        """
+        Schedule `func` to be called every `period` seconds, starting now.
+
+        Adding a key that is already scheduled replaces its entry.
+
+        Args:
+            key (Hashable): Identifies the entry, e.g. the simulation.
+            func (Callable): The tick function.
+            period (float): Seconds between ticks.
+        """
+        with self.condition:
+            token = next(self.sequence)
+            self.tokens[key] = token
+            entry = (time.monotonic(), token, token, key, func, period)
+            if key in self.in_flight:
+                self.deferred[key] = entry
+                return
+            heapq.heappush(self.heap, entry)
+            self.condition.notify()
+
+    def remove(self, key: Hashable, wait: bool=False) -> None:
+        """
+        Unschedule an entry.
+
+        Args:
+            key (Hashable): The entry to remove.
+            wait (bool): Block until a tick of the entry that is running has returned.
+        """
+        with self.condition:
+            self.tokens.pop(key, None)
+            self.deferred.pop(key, None)
+            if wait and threading.current_thread() not in self.threads:
+                while key in self.in_flight:
+                    self.condition.wait()
+
+    def run_worker(self) -> None:
+        """
+        Worker loop, pops due entries and runs their tick.
+        """
+        with self.condition:
+            while self.running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                due, _, token, key, func, period = self.heap[0]
+                if self.tokens.get(key) != token:
+                    heapq.heappop(self.heap)
+                    continue
+
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                heapq.heappop(self.heap)
+                self.in_flight.add(key)
+                SCHEDULER_LAG_SECONDS.observe(-delay)
+
+                self.condition.release()
+                try:
+                    func()
+                    failed = False
+                except Exception:
+                    logger.exception(f"tick of {key} failed, removing it from the schedule")
+                    failed = True
+                finally:
+                    self.condition.acquire()
+
+                self.in_flight.discard(key)
+                current = self.tokens.get(key) == token
+                if failed and current:
+                    self.tokens.pop(key, None)
+                elif current:
+                    due += period
+                    now = time.monotonic()
+                    if now - due > self.max_lag:
+                        due = now
+                        SCHEDULER_RESYNCS.inc()
+                    heapq.heappush(self.heap, (due, next(self.sequence), token, key, func, period))
+                deferred = self.deferred.pop(key, None)
+                if deferred is not None:
+                    heapq.heappush(self.heap, deferred)
+                self.condition.notify_all()
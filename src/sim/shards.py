@@ -0,0 +1,290 @@
+"""
+Sharded simulation runner spreading simulations across worker processes.
+"""
+# locals
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Dict, List, Tuple
+
+# project
+from src.sim import config
+from src.sim.async_db_client import AsyncDatabaseClient
+from src.sim.control import ACTIONS
+from src.sim.db_client import DatabaseClient, setup_database
+from src.sim.data_model import SimID
+from src.sim.ensemble import EnsembleSimulation
+from src.sim.live_feed import LiveFeed
+from src.sim.scheduler import TickScheduler
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import ChainSink, ColumnarFileSink, Sink
+from src.sim.statistics import parse_cadence
+from src.sim.utils import parse_duration, setup_logging
+
+# third party
+import numpy as np
+
+# constants
+logger = logging.getLogger(__name__)
+
+
+def create_sink(names: str, setup_schema: bool=True) -> Sink:
+    """
+    Builds the sinks named in the comma separated `names` (db, asyncdb, files) 
+        from the config, chained when there are several. With `setup_schema` off
+        the database sinks leave the schema to `setup_database`.
+    """
+    sinks = []
+    for name in names.split(","):
+        if name == "db":
+            sinks.append(DatabaseClient(
+                num_buffers=config.DB_BUFFERS,
+                buffer_limit=config.DB_BUFFER_LEN,
+                flush_interval=config.DB_FLUSH_INTERVAL,
+                ingest_mode=config.DB_INGEST_MODE,
+                partition_days_ahead=config.DB_PARTITION_DAYS_AHEAD,
+                retention_days=config.DB_RETENTION_DAYS,
+                rollups=config.DB_ROLLUPS,
+                setup_schema=setup_schema))
+        elif name == "asyncdb":
+            sinks.append(AsyncDatabaseClient(
+                buffer_limit=config.DB_BUFFER_LEN,
+                max_pending=config.DB_ASYNC_PENDING,
+                max_flushes=config.DB_ASYNC_FLUSHES,
+                flush_interval=config.DB_FLUSH_INTERVAL,
+                ingest_mode=config.DB_ASYNC_INGEST_MODE,
+                partition_days_ahead=config.DB_PARTITION_DAYS_AHEAD,
+                retention_days=config.DB_RETENTION_DAYS,
+                rollups=config.DB_ROLLUPS,
+                setup_schema=setup_schema))
+        elif name == "files":
+            sinks.append(ColumnarFileSink(
+                directory=config.FILES_DIR,
+                chunk=parse_duration(config.FILES_CHUNK),
+                format=config.FILES_FORMAT))
+        else:
+            raise ValueError(f"unknown sink {name!r}, use db, asyncdb or files")
+    return sinks[0] if len(sinks) == 1 else ChainSink(sinks)
+
+
+def create_simulations(
+        sim_specs: List[Tuple[str, int, np.random.SeedSequence]],
+        db_client: Sink,
+        batch_size: int=1,
+        scheduler: TickScheduler=None,
+        feed: LiveFeed=None,
+        paths: int=0,
+        path_rows: int=0,
+        shared_window: bool=False,
+        stat_cadence: dict=None) -> Dict[str, MonteCarloSimulation]:
+    """
+    Registers and starts a simulation for each (sim_id, sample_hz, seed) spec,
+        an EnsembleSimulation of `paths` paths each when `paths` is set.
+    """
+    sims = {}
+    for sim_id, sampling_frequency, seed in sim_specs:
+        db_client.write(
+            SimID(
+                sim_id=sim_id),
+            immediate_commit=True)
+
+        options = dict(
+            sim_id=sim_id,
+            db_client=db_client,
+            sample_hz=sampling_frequency,
+            max_sample_queue=1000,
+            batch_size=batch_size,
+            scheduler=scheduler,
+            feed=feed,
+            seed=seed,
+            shared_window=shared_window,
+            stat_cadence=stat_cadence)
+        if paths:
+            sims[sim_id] = EnsembleSimulation(paths=paths, path_rows=path_rows, **options)
+        else:
+            sims[sim_id] = MonteCarloSimulation(**options)
+
+        sims[sim_id].start()
+    return sims
+
+
+def run_shard(
+        sim_specs: List[Tuple[str, int, np.random.SeedSequence]],
+        conn: Connection,
+        cvars: argparse.Namespace,
+        batch_size: int,
+        sched_workers: int) -> None:
+    """
+    Worker process entry point. Owns its sinks, a scheduler and its
+        simulations, and applies the commands received over `conn` until shutdown.
+    """
+    # the parent owns shutdown, see SimulationShard.close
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(cvars)
+
+    scheduler = None
+    if sched_workers > 0:
+        scheduler = TickScheduler(workers=sched_workers)
+        scheduler.start()
+
+    # the parent set the schema up, see start_shards
+    db_client = create_sink(cvars.sinks or config.SIM_SINKS, setup_schema=False)
+
+    paths = cvars.paths if cvars.paths is not None else config.SIM_PATHS
+    path_rows = cvars.path_rows if cvars.path_rows is not None else config.SIM_PATH_ROWS
+    shared_window = cvars.shared_windows if cvars.shared_windows is not None else config.SIM_SHARED_WINDOWS
+    stat_cadence = parse_cadence(
+        cvars.stat_cadence if cvars.stat_cadence is not None else config.SIM_STAT_CADENCE)
+    sims = create_simulations(
+        sim_specs, db_client, batch_size, scheduler, 
+        paths=paths, path_rows=path_rows, shared_window=shared_window, stat_cadence=stat_cadence)
+    conn.send(("ready", None))
+
+    try:
+        while True:
+            sim_id, action = conn.recv()
+            if action == "shutdown":
+                break
+            sim = sims.get(sim_id)
+            if sim is None or action not in ACTIONS:
+                conn.send(("error", f"unknown simulation or action: {sim_id} {action}"))
+                continue
+            try:
+                getattr(sim, action)()
+                conn.send(("ok", None))
+            except Exception as e:
+                logger.exception(f"{action} failed for {sim_id}")
+                conn.send(("error", str(e)))
+    except EOFError:
+        logger.warning("control pipe closed, shutting down shard")
+    finally:
+        for simulation in sims.values():
+            simulation.close()
+        if scheduler is not None:
+            scheduler.stop()
+        db_client.close()
+        try:
+            conn.send(("closed", None))
+        except (BrokenPipeError, OSError):
+            pass
+
+
+class SimulationShard:
+    """
+    Parent side handle of a worker process running a subset of the simulations.
+
+    Commands are sent over a pipe and answered in order, a lock serializes
+    callers since the web APIs run handlers on a threadpool.
+    """
+    def __init__(self,
+                 sim_specs: List[Tuple[str, int, np.random.SeedSequence]],
+                 cvars: argparse.Namespace,
+                 batch_size: int=1,
+                 sched_workers: int=1) -> None:
+        self.sim_ids = [sim_id for sim_id, _, _ in sim_specs]
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.lock = threading.Lock()
+        self.process = context.Process(
+            target=run_shard,
+            args=(sim_specs, child_conn, cvars, batch_size, sched_workers),
+            daemon=True)
+
+    def start(self) -> None:
+        """
+        Start the worker process and wait until its simulations are running.
+        """
+        self.process.start()
+        status, _ = self.conn.recv()
+        logger.debug(f"shard {self.process.pid} {status} with {len(self.sim_ids)} simulations")
+
+    def call(self, sim_id: str, action: str) -> None:
+        """
+        Apply an action to a simulation owned by this shard.
+        """
+        with self.lock:
+            self.conn.send((sim_id, action))
+            status, detail = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(detail)
+
+    def close(self, timeout: float=30.0) -> None:
+        """
+        Stop the simulations, drain the database client and end the process.
+        """
+        with self.lock:
+            try:
+                self.conn.send((None, "shutdown"))
+                if self.conn.poll(timeout):
+                    self.conn.recv()
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class SimulationProxy:
+    """
+    Stands in for a MonteCarloSimulation running in a shard, forwarding
+        the control actions to the owning worker process.
+    """
+    def __init__(self, sim_id: str, shard: SimulationShard) -> None:
+        self.sim_id = sim_id
+        self.shard = shard
+
+    def start(self) -> None:
+        self.shard.call(self.sim_id, "start")
+
+    def pause(self) -> None:
+        self.shard.call(self.sim_id, "pause")
+
+    def resume(self) -> None:
+        self.shard.call(self.sim_id, "resume")
+
+    def stop(self) -> None:
+        self.shard.call(self.sim_id, "stop")
+
+    def restart(self) -> None:
+        self.shard.call(self.sim_id, "restart")
+
+    def mark(self) -> None:
+        self.shard.call(self.sim_id, "mark")
+
+    def clear_mark(self) -> None:
+        self.shard.call(self.sim_id, "clear_mark")
+
+
+def start_shards(
+        sim_specs: List[Tuple[str, int, np.random.SeedSequence]],
+        workers: int,
+        cvars: argparse.Namespace,
+        batch_size: int=1,
+        sched_workers: int=1) -> Tuple[List[SimulationShard], Dict[str, SimulationProxy]]:
+    """
+    Spread the simulations round robin over `workers` processes. The database
+        schema is set up once here, the workers' sinks skip it so they do not 
+        race each other through the DDL.
+
+    Returns:
+        tuple: The shards and a proxy per simulation id.
+    """
+    names = (cvars.sinks or config.SIM_SINKS).split(",")
+    if "db" in names or "asyncdb" in names:
+        setup_database(
+            partition_days_ahead=config.DB_PARTITION_DAYS_AHEAD,
+            retention_days=config.DB_RETENTION_DAYS)
+
+    shards = [
+        SimulationShard(sim_specs[i::workers], cvars, batch_size, sched_workers)
+        for i in range(workers) if sim_specs[i::workers]]
+    for shard in shards:
+        shard.start()
+
+    proxies = {
+        sim_id: SimulationProxy(sim_id, shard)
+        for shard in shards for sim_id in shard.sim_ids}
+    return shards, proxies
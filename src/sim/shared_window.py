@@ -0,0 +1,264 @@
+"""
+Simulation histories in shared memory, readable zero-copy from other processes.
+"""
+# locals
+import os
+import json
+import time
+import logging
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+# project
+from src.sim.history import SampleHistory
+
+# third party
+import numpy as np
+
+# constants
+logger = logging.getLogger(__name__)
+SHM_PREFIX = "rtsim-"
+SHM_DIRECTORY = "/dev/shm"  # where Linux lists the segments, see `list_windows`
+HEADER_SIZE = 4096  # bytes before the rows, the header and the row dtype as JSON
+HEADER_DTYPE = np.dtype([
+    ("magic", np.uint64),
+    ("seq", np.uint64),  # odd while the writer is changing the ring
+    ("generation", np.uint64),  # bumped when the ring is cleared, e.g. on restart
+    ("head", np.uint64),
+    ("capacity", np.uint64),
+    ("descr_size", np.uint64),
+])
+MAGIC = 0x72747369_6d776e64  # "rtsimwnd"
+CREATED = set()  # segments created by this process, tracked until unlinked
+SEQ, GENERATION, HEAD = 1, 2, 3  # header words touched per append, as plain ints
+
+
+def window_name(sim_id: str) -> str:
+    """
+    The shared memory segment name of a simulation.
+    """
+    return SHM_PREFIX + sim_id.replace("/", "_")
+
+
+def list_windows() -> List[str]:
+    """
+    The sim_ids with a shared window on this host, Linux only.
+    """
+    if not os.path.isdir(SHM_DIRECTORY):
+        return []
+    return sorted(
+        name[len(SHM_PREFIX):] for name in os.listdir(SHM_DIRECTORY) if name.startswith(SHM_PREFIX))
+
+
+def release(shm: shared_memory.SharedMemory, unlink: bool) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        # views handed out are still alive, the mapping goes with the process
+        pass
+    if unlink:
+        CREATED.discard(shm.name)
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Opens an existing segment without handing it to this process' resource
+        tracker, which would unlink it when the reader exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # track was added in 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in CREATED:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedSampleHistory(SampleHistory):
+    """
+    SampleHistory whose ring lives in a shared memory segment named after the
+    sim_id, so other processes can attach with SharedWindow and read the
+    window and latest stats without going through the database.
+
+    Every append is wrapped in a seqlock: `seq` is made odd before the rows are
+    written and even again once `head` is published, readers retry a copy
+    during which `seq` changed. The writer never waits on readers.
+
+    The segment is unlinked when the history is closed, garbage collected or
+    the process exits.
+    """
+    def __init__(self, sim_id: str, capacity: int, stat_keys: List[str]) -> None:
+        super().__init__(capacity, stat_keys)
+        descr = json.dumps(np.lib.format.dtype_to_descr(self.dtype)).encode()
+        if HEADER_DTYPE.itemsize + len(descr) > HEADER_SIZE:
+            raise ValueError(f"too many fields for a shared window: {len(self.fields)}")
+
+        self.sim_id = sim_id
+        name = window_name(sim_id)
+        size = HEADER_SIZE + self.dtype.itemsize * capacity
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a process that did not exit cleanly
+            logger.warning(f"replacing stale shared window {name}")
+            release(shared_memory.SharedMemory(name=name), unlink=True)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        CREATED.add(name)
+        self.finalizer = weakref.finalize(self, release, self.shm, True)
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        # a memoryview of the header words, far cheaper per append than the structured scalar
+        self.words = self.shm.buf[:HEADER_DTYPE.itemsize].cast("Q")
+        self.shm.buf[HEADER_DTYPE.itemsize:HEADER_DTYPE.itemsize + len(descr)] = descr
+        self.data = np.ndarray((capacity,), dtype=self.dtype, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.data[:] = 0
+        self.header["seq"] = 0
+        self.header["generation"] = 0
+        self.header["head"] = 0
+        self.header["capacity"] = capacity
+        self.header["descr_size"] = len(descr)
+        # written last, readers refuse a segment without it
+        self.header["magic"] = MAGIC
+
+    def append(self, *args, **kwargs) -> None:
+        words = self.words
+        words[SEQ] += 1
+        super().append(*args, **kwargs)
+        words[HEAD] = self.head
+        words[SEQ] += 1
+
+    def append_many(self, *args, **kwargs) -> None:
+        words = self.words
+        words[SEQ] += 1
+        super().append_many(*args, **kwargs)
+        words[HEAD] = self.head
+        words[SEQ] += 1
+
+    def update_latest(self, statistics: dict) -> None:
+        words = self.words
+        words[SEQ] += 1
+        super().update_latest(statistics)
+        words[SEQ] += 1
+
+    def clear(self) -> None:
+        """
+        Empties the ring in place, attached readers see the generation change.
+        """
+        words = self.words
+        words[SEQ] += 1
+        self.head = 0
+        words[HEAD] = 0
+        words[GENERATION] += 1
+        words[SEQ] += 1
+
+    def close(self) -> None:
+        self.header = None
+        self.words.release()
+        self.data = np.zeros(0, dtype=self.dtype)
+        self.finalizer()
+
+
+class SharedWindow:
+    """
+    Read side of a SharedSampleHistory, attached by sim_id from any process.
+
+    `data` is a zero-copy view of the ring: row `i` is in slot `i % capacity`
+    and rows up to `head` are written. Consumers working on `data` directly
+    take `seq = begin()` first and only trust their result when `valid(seq)`.
+    `tail` and `latest` do that and return consistent copies.
+
+    Attributes:
+        sim_id (str): The simulation.
+        fields (list): Column names, as SampleHistory.
+        capacity (int): Rows kept by the ring.
+        data (np.ndarray): The ring, shared with the simulation.
+    """
+    def __init__(self, sim_id: str) -> None:
+        self.sim_id = sim_id
+        self.shm = attach(window_name(sim_id))
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        self.words = self.shm.buf[:HEADER_DTYPE.itemsize].cast("Q")
+        if int(self.header["magic"]) != MAGIC:
+            self.close()
+            raise ValueError(f"{window_name(sim_id)} is not a simulation window")
+
+        descr_size = int(self.header["descr_size"])
+        descr = bytes(self.shm.buf[HEADER_DTYPE.itemsize:HEADER_DTYPE.itemsize + descr_size])
+        self.dtype = np.lib.format.descr_to_dtype(
+            [tuple(field) for field in json.loads(descr)])
+        self.fields = list(self.dtype.names)
+        self.capacity = int(self.header["capacity"])
+        self.data = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.shm.buf, offset=HEADER_SIZE)
+
+    @property
+    def head(self) -> int:
+        return self.words[HEAD]
+
+    @property
+    def generation(self) -> int:
+        return self.words[GENERATION]
+
+    def begin(self) -> int:
+        """
+        Waits for the writer to finish the append in progress, if any.
+
+        Returns:
+            int: The sequence number to hand to `valid`.
+        """
+        while True:
+            seq = self.words[SEQ]
+            if seq % 2 == 0:
+                return seq
+            time.sleep(0)
+
+    def valid(self, seq: int) -> bool:
+        """
+        Whether the ring did not change since `begin` returned `seq`.
+        """
+        return self.words[SEQ] == seq
+
+    def tail(self, n: int, fields: Optional[List[str]]=None, retries: int=100) -> np.ndarray:
+        """
+        Copies the last `n` rows, oldest first, as SampleHistory.tail.
+
+        Raises:
+            TimeoutError: When the writer changed the ring during `retries` copies.
+        """
+        for _ in range(retries):
+            seq = self.begin()
+            head = self.head
+            count = max(min(n, head, self.capacity), 0)
+            rows = self.data[np.arange(head - count, head) % self.capacity]
+            if self.valid(seq):
+                if fields:
+                    rows = np.array(rows[fields], dtype=[(name, self.dtype[name]) for name in fields])
+                return rows
+        raise TimeoutError(f"no consistent copy of {self.sim_id} after {retries} tries")
+
+    def latest(self) -> Optional[dict]:
+        """
+        The newest row as a dict, None while the ring is empty.
+        """
+        rows = self.tail(1)
+        if len(rows) == 0:
+            return None
+        return {name: rows[name][0].item() for name in self.fields}
+
+    def close(self) -> None:
+        if self.words is None:
+            return
+        self.header = None
+        self.data = None
+        self.words.release()
+        self.words = None
+        release(self.shm, unlink=False)
+
+    def __del__(self) -> None:
+        # the views must go before the segment or SharedMemory complains at exit
+        if getattr(self, "words", None) is not None:
+            self.close()
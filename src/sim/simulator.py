@@ -3,22 +3,36 @@ Monte Carlo simulation.
 """
 # locals
 import time
-import random
 import logging
 import threading
 from collections import deque
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # project
-from src.sim.statistics import Statistics
-from src.sim.db_client import DatabaseClient
-from src.sim.data_model import SampleData
+from src.sim.statistics import SAMPLE_PERIODS, Statistics
+from src.sim.data_model import SampleBatch, SampleRecord
+from src.sim.live_feed import LiveFeed
+from src.sim.history import SampleHistory
+from src.sim.metrics import Counter, Gauge, Histogram
+from src.sim.scheduler import TickScheduler
+from src.sim.shared_window import SharedSampleHistory
+from src.sim.sinks import Sink
 
 # third party
-# ..
+import numpy as np
 
 # constants
 logger = logging.getLogger(__name__)
+SIM_SAMPLES = Counter(
+    "sim_samples_total", "Samples taken by the simulation", ("sim_id",))
+SIM_TARGET_RATE = Gauge(
+    "sim_target_rate_hz", "Samples per second requested of the simulation", ("sim_id",))
+SIM_SAMPLES_BEHIND = Gauge(
+    "sim_samples_behind", "Samples the simulation is behind its requested rate since it was (re)started", ("sim_id",))
+SIM_RESYNCS = Counter(
+    "sim_resyncs_total", "Times a simulation on its own thread fell over 1s behind and skipped ahead", ("sim_id",))
+SIM_TICK_SECONDS = Histogram(
+    "sim_tick_seconds", "Time spent per tick (one step or one batch) of all simulations")
 
 
 class MonteCarloSimulation:
@@ -26,7 +40,7 @@ class MonteCarloSimulation:
     Monte Carlo Simulation class.
     Attributes:
         sim_id (str): The ID of the simulation.
-        db_client (DatabaseClient): The database client used to write simulation data.
+        db_client (Sink): Where the simulation data is written, e.g. the DatabaseClient.
         sample_hz (int): The sample rate in hertz (default: 10).
         max_sample_queue (int): The maximum length of the sample queue (default: 1000).
         sample_periods (list): The periods at which statistics are calculated.
@@ -41,30 +55,72 @@ class MonteCarloSimulation:
         current_value (float): The current value of the simulation.
         mark_value (float): The initiation value.
         max_delta (float): The maximum change in value since the initiation.
+        batch_size (int): Steps taken per loop iteration, above 1 the steps are
+            generated vectorized with NumPy and written in bulk (default: 1).
+        scheduler (TickScheduler): Shared scheduler running the simulation, 
+            when None the simulation runs on its own thread (default: None).
+        feed (LiveFeed): Live feed the samples are published to (default: None).
+        history (SampleHistory): Columnar ring of the last `max_sample_queue` rows.
+        rng (Generator): The simulation's own random stream, seeded from `seed`
+            (a SeedSequence or int) so runs can be reproduced, fresh entropy when None.
+        prefetch (int): Draws taken from `rng` per block (default: 1024).
+        shared_window (bool): Keep `history` in shared memory, readable by other
+            processes with `SharedWindow(sim_id)` (default: False).
+        stat_cadence (dict): How often each stat is evaluated, see `parse_cadence`,
+            every sample when None (default: None).
     """
     def __init__(self, 
                  sim_id: str, 
-                 db_client: DatabaseClient, 
+                 db_client: Sink, 
                  sample_hz: int=10, 
-                 max_sample_queue: int=1000) -> None:
+                 max_sample_queue: int=1000,
+                 batch_size: int=1,
+                 scheduler: TickScheduler=None,
+                 feed: LiveFeed=None,
+                 seed: np.random.SeedSequence=None,
+                 prefetch: int=1024,
+                 shared_window: bool=False,
+                 stat_cadence: dict=None) -> None:
         self.sim_id = sim_id
         self.db_client = db_client
         self.max_sample_queue = max_sample_queue
-        self.sample_periods = [23, 53, 107, 223]
+        self.batch_size = batch_size
+        self.scheduler = scheduler
+        self.feed = feed
+        self.rng = np.random.default_rng(seed)
+        self.prefetch = prefetch
+        self.shared_window = shared_window
+        self.stat_cadence = stat_cadence
+        self.history = None
+        self.draws = np.empty(0)
+        self.draw_values = []
+        self.draw_index = 0
+        self.sample_periods = list(SAMPLE_PERIODS)
         self.sample_queue = deque(maxlen=self.max_sample_queue)
         self.running = False
         self.thread = None
         self.data_lock = threading.Lock()
         self.start_time = time.time()
         self.sample_frequency = 1 / sample_hz # hertz to seconds
+        self.tick_period = self.sample_frequency * batch_size
         self.stats = Statistics(
             sample_periods=self.sample_periods, 
-            sample_queue=self.sample_queue)
+            sample_queue=self.sample_queue,
+            cadence=self.stat_cadence)
+        self.history = self.new_history(self.stats.stat_keys)
         # values
         self.samples = 0
         self.current_value = 0
         self.mark_value = None
         self.max_delta = 0
+        # metrics
+        self.run_started = None
+        self.run_samples = 0
+        self.metric_samples = SIM_SAMPLES.labels(sim_id)
+        self.metric_resyncs = SIM_RESYNCS.labels(sim_id)
+        SIM_TARGET_RATE.labels(sim_id).set(sample_hz)
+        # the registry outlives the simulation, it must not keep it alive
+        SIM_SAMPLES_BEHIND.labels(sim_id).set_function(self.samples_behind, weak=True)
 
     def start(self) -> None:
         """
@@ -73,8 +129,7 @@ class MonteCarloSimulation:
         logger.debug(f"Starting simulation {self.sim_id}")
         self.reset()
         self.running = True
-        self.thread = threading.Thread(target=self.run_simulation)
-        self.thread.start()
+        self.schedule()
 
     def pause(self) -> None:
         """
@@ -82,6 +137,9 @@ class MonteCarloSimulation:
         """
         logger.debug(f"Pausing simulation {self.sim_id}")
         self.running = False
+        self.run_started = None
+        if self.scheduler is not None:
+            self.scheduler.remove(self)
 
     def stop(self) -> None:
         """
@@ -89,10 +147,20 @@ class MonteCarloSimulation:
         """
         logger.debug(f"Stopping simulation {self.sim_id}")
         self.pause()
-        if self.thread is not None:
+        if self.scheduler is not None:
+            self.scheduler.remove(self, wait=True)
+        elif self.thread is not None:
             self.thread.join()
         logger.debug(f"closed {self.sim_id}")
 
+    def close(self) -> None:
+        """
+        Stop the simulation for good and remove its per simulation metrics.
+        """
+        self.stop()
+        for metric in (SIM_SAMPLES, SIM_TARGET_RATE, SIM_SAMPLES_BEHIND, SIM_RESYNCS):
+            metric.remove(self.sim_id)
+
     def restart(self) -> None:
         """
         Restart the simulation.
@@ -109,20 +177,70 @@ class MonteCarloSimulation:
         if not self.running:
             logger.debug(f"Resuming simulation {self.sim_id}")
             self.running = True
+            self.schedule()
+
+    def schedule(self) -> None:
+        """
+        Hand the simulation to the scheduler, or start its own thread.
+        """
+        self.run_started = time.monotonic()
+        self.run_samples = self.samples
+        if self.scheduler is not None:
+            self.scheduler.add(self, self.tick, self.tick_period)
+        else:
             self.thread = threading.Thread(target=self.run_simulation)
             self.thread.start()
 
+    def samples_behind(self) -> float:
+        """
+        Samples missing vs the requested rate since the simulation was last
+            started or resumed, 0 when it is not running.
+        """
+        run_started = self.run_started
+        if run_started is None:
+            return 0
+        expected = (time.monotonic() - run_started) / self.sample_frequency
+        return max(expected - (self.samples - self.run_samples), 0)
+
     def reset(self) -> None:
         self.sample_queue = deque(maxlen=self.max_sample_queue)
         self.start_time = time.time()
         self.stats = Statistics(
             sample_periods=self.sample_periods, 
-            sample_queue=self.sample_queue)
+            sample_queue=self.sample_queue,
+            cadence=self.stat_cadence)
+        self.history = self.new_history(self.stats.stat_keys)
         self.samples = 0
+        self.run_samples = 0
         self.current_value = 0
         self.mark_value = None
         self.max_delta = 0
 
+    def new_history(self, stat_keys: list) -> SampleHistory:
+        """
+        An empty history for `stat_keys`, a shared window is cleared in place
+            so readers stay attached across restarts.
+        """
+        if not self.shared_window:
+            return SampleHistory(capacity=self.max_sample_queue, stat_keys=stat_keys)
+        history = self.history
+        if isinstance(history, SharedSampleHistory):
+            if history.stat_keys == list(stat_keys):
+                history.clear()
+                return history
+            history.close()
+        return SharedSampleHistory(self.sim_id, self.max_sample_queue, stat_keys)
+
+    def evaluate_stats(self) -> dict:
+        """
+        Evaluates the stats not due every sample now and writes them into the
+            newest history row, called before the history is queried.
+        """
+        with self.data_lock:
+            stats = self.stats.evaluate()
+            self.history.update_latest(stats)
+        return stats
+
     def mark(self) -> None:
         """
         Set the current value as the initiation value.
@@ -141,6 +259,28 @@ class MonteCarloSimulation:
         self.max_delta = 0
         self.curr_delta = 0
 
+    def refill(self) -> None:
+        """
+        Draw the next block of `prefetch` uniforms in [0, 1) from the simulation's stream.
+        """
+        self.draws = self.rng.random(self.prefetch)
+        self.draw_values = self.draws.tolist()
+        self.draw_index = 0
+
+    def uniforms(self, count:int) -> np.ndarray:
+        """
+        Take the next `count` uniforms in [0, 1) from the prefetched blocks.
+        """
+        parts = []
+        while count > 0:
+            if self.draw_index == len(self.draws):
+                self.refill()
+            part = self.draws[self.draw_index:self.draw_index + count]
+            self.draw_index += len(part)
+            count -= len(part)
+            parts.append(part)
+        return np.concatenate(parts) if len(parts) != 1 else parts[0]
+
     def sample(self, lower:float=-5.0, upper:float=5.0) -> None:
         """
         Sample a random value within the specified range.
@@ -148,58 +288,172 @@ class MonteCarloSimulation:
         :param lower: The lower bound of the range (default: -5.0)
         :param upper: The upper bound of the range (default: 5.0)
         """
-        return random.uniform(lower, upper)
+        index = self.draw_index
+        if index == len(self.draw_values):
+            self.refill()
+            index = 0
+        self.draw_index = index + 1
+        return lower + (upper - lower) * self.draw_values[index]
+
+    def sample_batch(self, steps:int, lower:float=-5.0, upper:float=5.0) -> np.ndarray:
+        """
+        Sample `steps` random values within the specified range.
+
+        :param steps: The number of values to sample
+        :param lower: The lower bound of the range (default: -5.0)
+        :param upper: The upper bound of the range (default: 5.0)
+        """
+        return lower + (upper - lower) * self.uniforms(steps)
 
     def update(self, stats:dict) -> None:
         # do fancy things, definitely not something this simple:
         if self.mark_value:
             self.max_delta = self.current_value - self.mark_value
 
+    def update_batch(self, values:np.ndarray, lengths:np.ndarray) -> np.ndarray:
+        """
+        Vectorized counterpart of `update` for a batch of steps.
+
+        :param values: The simulation value after each step
+        :param lengths: The sample queue length after each step
+        :return: The delta reported for each step
+        """
+        if self.mark_value:
+            return np.where(
+                lengths > self.sample_periods[-1], 
+                values - self.mark_value, 
+                self.max_delta)
+        return np.full(len(values), self.max_delta, dtype=float)
+
+    def step_batch(self, steps:int, start_time:datetime=None) -> None:
+        """
+        Take `steps` steps at once and write the rows in bulk.
+
+        The walk is the cumulative sum of a NumPy array of draws, the stats are
+        computed for the whole batch by `Statistics.process_batch` and the rows 
+        are timestamped `sample_frequency` apart starting at `start_time`. The
+        sink gets the columns as a SampleBatch, row objects are only built for
+        the live feed and the sinks that need them.
+
+        :param steps: The number of steps to take
+        :param start_time: Timestamp of the first step (default: now)
+        """
+        with self.data_lock:
+            if start_time is None:
+                start_time = datetime.utcnow()
+
+            # sample from distribution and take steps
+            values = self.current_value + np.cumsum(self.sample_batch(steps))
+            samples = self.samples + np.arange(1, steps + 1)
+
+            # process and get stats for the batch
+            stats_results = self.stats.process_batch(values)
+            lengths = np.minimum(samples, self.max_sample_queue)
+
+            # calculate fancy things
+            deltas = self.update_batch(values, lengths)
+
+            # timestamped as `start_time + step * i`, to the microsecond
+            step = timedelta(seconds=self.sample_frequency) // timedelta(microseconds=1)
+            batch = SampleBatch(
+                sim_id=self.sim_id,
+                timestamps=np.datetime64(start_time, "us") + np.arange(steps) * np.timedelta64(step, "us"),
+                samples=samples,
+                values=values,
+                mark=self.mark_value,
+                deltas=deltas,
+                statistics=stats_results)
+            self.db_client.write_columns(batch)
+            if self.feed is not None:
+                self.feed.publish_many(batch.records())
+            self.history.append_many(
+                timestamps=batch.epoch_seconds(),
+                samples=samples,
+                values=values,
+                mark=self.mark_value,
+                deltas=deltas,
+                statistics=stats_results)
+
+            self.samples += steps
+            self.current_value = float(values[-1])
+            self.max_delta = float(deltas[-1])
+
+    def step(self) -> None:
+        """
+        Take a single step and write its row.
+        """
+        with self.data_lock:
+            current_time = datetime.utcnow()
+
+            # sample from distribution
+            change = self.sample()
+
+            # increment sample count
+            self.samples += 1
+
+            # take step
+            self.current_value += change
+
+            # maintain max sample_queue length
+            if len(self.sample_queue) == self.max_sample_queue - 5:
+                self.sample_queue.popleft()
+
+            # add current value to sample_queue
+            self.sample_queue.append(self.current_value)
+
+            # process and get stats on latest sample_queue
+            stats_results = self.stats.process()
+
+            # calculate fancy things
+            if len(self.sample_queue) > self.sample_periods[-1]:
+                self.update(stats_results)
+
+            # create db payload
+            payload = SampleRecord(
+                timestamp=current_time,
+                sim_id=self.sim_id,
+                samples=self.samples,
+                value=self.current_value,
+                mark=self.mark_value,
+                delta=self.max_delta,
+                statistics=stats_results
+            )
+            self.db_client.write(payload)
+            if self.feed is not None:
+                self.feed.publish(payload)
+            self.history.append(
+                current_time, self.samples, self.current_value, 
+                self.mark_value, self.max_delta, stats_results)
+
+    def tick(self) -> None:
+        """
+        Take the steps due every `tick_period`, one or `batch_size` steps.
+        """
+        begin = time.perf_counter()
+        if self.batch_size > 1:
+            self.step_batch(self.batch_size)
+            self.metric_samples.inc(self.batch_size)
+        else:
+            self.step()
+            self.metric_samples.inc()
+        SIM_TICK_SECONDS.observe(time.perf_counter() - begin)
+
     def run_simulation(self) -> None:
         """
-        Run the simulation loop.
+        Run the simulation loop on the simulation's own thread.
         """
         try:
+            next_due = time.monotonic()
             while self.running:
-                with self.data_lock:
-                    current_time = datetime.utcnow()
-
-                    # sample from distribution
-                    change = self.sample()
-
-                    # increment sample count
-                    self.samples += 1
-
-                    # take step
-                    self.current_value += change
-
-                    # maintain max sample_queue length
-                    if len(self.sample_queue) == self.max_sample_queue - 5:
-                        self.sample_queue.popleft()
-
-                    # add current value to sample_queue
-                    self.sample_queue.append(self.current_value)
-
-                    # process and get stats on latest sample_queue
-                    stats_results = self.stats.process()
-
-                    # calculate fancy things
-                    if len(self.sample_queue) > self.sample_periods[-1]:
-                        self.update(stats_results)
-
-                    # create db payload
-                    payload = SampleData(
-                        timestamp=current_time,
-                        sim_id=self.sim_id,
-                        samples=self.samples,
-                        value=self.current_value,
-                        mark=self.mark_value,
-                        delta=self.max_delta,
-                        statistics=stats_results
-                    )
-                    self.db_client.write(payload)
-                    
-                    # wait to sample again
-                    time.sleep(self.sample_frequency)
+                self.tick()
+
+                # wait to sample again, drift corrected against the schedule
+                next_due += self.tick_period
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > 1.0:
+                    next_due = time.monotonic()
+                    self.metric_resyncs.inc()
         except KeyboardInterrupt:
             self.thread.join()
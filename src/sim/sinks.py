@@ -0,0 +1,284 @@
+"""
+Storage sinks the simulations write their rows to.
+"""
+# locals
+import os
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Dict, List, Union
+
+# project
+from src.sim.data_model import SampleBatch, SampleData, SampleRecord, SimID
+from src.sim.history import BASE_FIELDS, EPOCH
+
+# third party
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet segments are optional
+    pa = None
+
+# constants
+logger = logging.getLogger(__name__)
+DTYPE_FILE = "dtype.json"
+
+
+class Sink(ABC):
+    """
+    Where simulation rows go, implemented by DatabaseClient and the file sinks.
+
+    `write` is called from the producing simulation's thread (or scheduler
+    worker), one producer per sim_id, and must not block longer than the
+    sink's own backpressure requires. `write_columns` takes the rows of a
+    batch step as columns, sinks that can store them as they are override it.
+    `close` is called once the producers are stopped and must persist 
+    everything written.
+    """
+    @abstractmethod
+    def write(self,
+              sample_data: Union[SampleRecord, SampleData, SimID],
+              immediate_commit: bool=False) -> None:
+        """
+        Takes a row, or a SimID to register, `immediate_commit` asks for it to
+            be persisted before returning.
+        """
+
+    def write_many(self, items: list) -> None:
+        for item in items:
+            self.write(item)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        self.write_many(batch.records())
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        """
+        Closes the sink from a coroutine, overridden by sinks running on the 
+            event loop, which a blocking `close` there would deadlock.
+        """
+        self.close()
+
+
+class ChainSink(Sink):
+    """
+    Writes every row to each of `sinks` in turn, e.g. the database and local files.
+    """
+    def __init__(self, sinks: List[Sink]) -> None:
+        self.sinks = sinks
+
+    def write(self,
+              sample_data: Union[SampleRecord, SampleData, SimID],
+              immediate_commit: bool=False) -> None:
+        for sink in self.sinks:
+            sink.write(sample_data, immediate_commit=immediate_commit)
+
+    def write_many(self, items: list) -> None:
+        for sink in self.sinks:
+            sink.write_many(items)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        for sink in self.sinks:
+            sink.write_columns(batch)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                logger.exception(f"failed to close {type(sink).__name__}")
+
+    async def aclose(self) -> None:
+        for sink in self.sinks:
+            try:
+                await sink.aclose()
+            except Exception:
+                logger.exception(f"failed to close {type(sink).__name__}")
+
+
+def read_segment(path: str) -> np.memmap:
+    """
+    Maps a raw segment written by ColumnarFileSink read-only, without copying.
+
+    Rows are appended whole, a trailing partial row of a segment being written is ignored.
+    """
+    with open(os.path.join(os.path.dirname(path), DTYPE_FILE)) as file:
+        dtype = np.lib.format.descr_to_dtype(
+            [tuple(field) for field in json.load(file)])
+    rows = os.path.getsize(path) // dtype.itemsize
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def list_segments(directory: str, sim_id: str) -> List[str]:
+    """
+    The segment files of a simulation, oldest first.
+    """
+    sim_directory = os.path.join(directory, sim_id)
+    if not os.path.isdir(sim_directory):
+        return []
+    return sorted(
+        os.path.join(sim_directory, name) for name in os.listdir(sim_directory)
+        if name.endswith((".bin", ".parquet")))
+
+
+def load_segments(directory: str, sim_id: str) -> List[np.memmap]:
+    """
+    Maps every raw segment of a simulation, oldest first, see `read_segment`.
+    """
+    return [read_segment(path) for path in list_segments(directory, sim_id) if path.endswith(".bin")]
+
+
+class ColumnarFileSink(Sink):
+    """
+    Writes each simulation's rows to its own directory, in one segment file
+    per `chunk` of time named after the chunk start, e.g. `sim-ab12cd-20-Hz/20240101T130000.bin`.
+
+    Segments are either append-only raw NumPy structured arrays (`format="raw"`,
+    `.bin` without a header plus the sim's `dtype.json`) that readers memory map with
+    `read_segment` while they are written, or Parquet files (`format="parquet"`,
+    requires pyarrow) that can be read once their chunk is over.
+
+    Columns are the timestamp (UTC epoch seconds), samples, value, mark (NaN
+    when unset), delta and a column per stat key of the first row of the sim.
+    Rows are buffered per simulation and appended every `batch_rows` rows by
+    the simulation's own producer thread, and the rest on close. Batches from
+    `write_columns` are appended straight from their columns.
+
+    Attributes:
+        directory (str): The root directory.
+        chunk (timedelta): Time covered by a segment.
+        format (str): `raw` or `parquet`.
+        batch_rows (int): Rows buffered per simulation before they are appended.
+    """
+    def __init__(self,
+                 directory: str,
+                 chunk: timedelta=timedelta(hours=1),
+                 format: str="raw",
+                 batch_rows: int=256) -> None:
+        if format == "npy":
+            # the segments never were .npy files, np.load can not read them
+            logger.warning("segment format npy is deprecated, use raw")
+            format = "raw"
+        if format not in ("raw", "parquet"):
+            raise ValueError(f"unknown segment format {format!r}, use raw or parquet")
+        if format == "parquet" and pa is None:
+            raise RuntimeError("parquet segments require pyarrow")
+        self.directory = directory
+        self.chunk = chunk.total_seconds()
+        self.format = format
+        self.batch_rows = batch_rows
+        self.pending: Dict[str, list] = {}
+        self.dtypes: Dict[str, np.dtype] = {}
+        self.segments: Dict[str, tuple] = {}  # sim_id -> (chunk start, open file or parquet writer)
+        self.rows_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self,
+              sample_data: Union[SampleRecord, SampleData, SimID],
+              immediate_commit: bool=False) -> None:
+        if not isinstance(sample_data, (SampleRecord, SampleData)):
+            return
+        rows = self.pending.get(sample_data.sim_id)
+        if rows is None:
+            rows = self.pending.setdefault(sample_data.sim_id, [])
+        rows.append(sample_data)
+        if len(rows) >= self.batch_rows:
+            self.flush_sim(sample_data.sim_id)
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        # rows written before the batch go first
+        self.flush_sim(batch.sim_id)
+        dtype = self.dtype(batch.sim_id, list(batch.statistics))
+        data = np.empty(len(batch), dtype=dtype)
+        data["timestamp"] = batch.epoch_seconds()
+        data["samples"] = batch.samples
+        data["value"] = batch.values
+        data["mark"] = np.nan if batch.mark is None else batch.mark
+        data["delta"] = batch.deltas
+        for key in dtype.names[len(BASE_FIELDS):]:
+            data[key] = batch.statistics.get(key, np.nan)
+        self.append_rows(batch.sim_id, data)
+
+    def dtype(self, sim_id: str, stat_keys: List[str]) -> np.dtype:
+        dtype = self.dtypes.get(sim_id)
+        if dtype is None:
+            fields = BASE_FIELDS + stat_keys
+            dtype = np.dtype([
+                (name, np.int64 if name == "samples" else np.float64) for name in fields])
+            os.makedirs(os.path.join(self.directory, sim_id), exist_ok=True)
+            with open(os.path.join(self.directory, sim_id, DTYPE_FILE), "w") as file:
+                json.dump(np.lib.format.dtype_to_descr(dtype), file)
+            self.dtypes[sim_id] = dtype
+        return dtype
+
+    def to_array(self, rows: list, dtype: np.dtype) -> np.ndarray:
+        data = np.empty(len(rows), dtype=dtype)
+        data["timestamp"] = [(row.timestamp - EPOCH).total_seconds() for row in rows]
+        data["samples"] = [row.samples for row in rows]
+        data["value"] = [row.value for row in rows]
+        data["mark"] = [np.nan if row.mark is None else row.mark for row in rows]
+        data["delta"] = [row.delta for row in rows]
+        for key in dtype.names[len(BASE_FIELDS):]:
+            data[key] = [(row.statistics or {}).get(key, np.nan) for row in rows]
+        return data
+
+    def flush_sim(self, sim_id: str) -> None:
+        """
+        Appends the buffered rows of a simulation to their segments.
+        """
+        rows = self.pending.get(sim_id)
+        if not rows:
+            return
+        self.pending[sim_id] = []
+        self.append_rows(sim_id, self.to_array(rows, self.dtype(sim_id, list(rows[0].statistics or {}))))
+
+    def append_rows(self, sim_id: str, data: np.ndarray) -> None:
+        """
+        Appends rows to the segments of the chunks they fall into.
+        """
+        starts = np.floor(data["timestamp"] / self.chunk) * self.chunk
+        # rows of a simulation arrive in time order, split where the chunk changes
+        bounds = [0, *(np.flatnonzero(np.diff(starts)) + 1).tolist(), len(data)]
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            self.append(sim_id, float(starts[begin]), data[begin:end])
+        self.rows_written += len(data)
+
+    def append(self, sim_id: str, start: float, data: np.ndarray) -> None:
+        current = self.segments.get(sim_id)
+        if current is None or current[0] != start:
+            if current is not None:
+                current[1].close()
+            name = f"{EPOCH + timedelta(seconds=start):%Y%m%dT%H%M%S}"
+            path = os.path.join(self.directory, sim_id, name)
+            if self.format == "raw":
+                writer = open(f"{path}.bin", "ab")
+            else:
+                writer = pq.ParquetWriter(f"{path}.parquet", self.schema(data.dtype))
+            current = (start, writer)
+            self.segments[sim_id] = current
+
+        if self.format == "raw":
+            current[1].write(data.tobytes())
+            current[1].flush()
+        else:
+            columns = {name: data[name] for name in data.dtype.names}
+            columns["timestamp"] = (data["timestamp"] * 1e6).astype("datetime64[us]")
+            current[1].write_table(pa.table(columns, schema=current[1].schema))
+
+    def schema(self, dtype: np.dtype) -> "pa.Schema":
+        return pa.schema(
+            [("timestamp", pa.timestamp("us"))]
+            + [(name, pa.int64() if name == "samples" else pa.float64()) for name in dtype.names[1:]])
+
+    def close(self) -> None:
+        for sim_id in list(self.pending):
+            self.flush_sim(sim_id)
+        for _, writer in self.segments.values():
+            writer.close()
+        self.segments = {}
@@ -2,35 +2,476 @@
 Calculate statistics of the simulation values.
 """
 # locals
+import re
+import time
 import logging
+import functools
 import itertools
+from typing import Callable, Dict, List, Optional, Tuple
 from collections import deque
 
 # project
-# ..
+from src.sim.metrics import Histogram
 
 # third party
-# ..
+import numpy as np
 
 # constants
 logger = logging.getLogger(__name__)
+SAMPLE_PERIODS = (23, 53, 107, 223)  # windows the simulations compute their stats over
+STATS_PROCESS_SECONDS = Histogram(
+    "stats_process_seconds", "Time spent in Statistics.process per sample")
+STATS_BATCH_SECONDS = Histogram(
+    "stats_process_batch_seconds", "Time spent in Statistics.process_batch per batch")
+PREVIOUS_API_PROCS = ("proc_calculate_running_avg", "proc_ema")  # kept for callers, not run by the shim
+CADENCE_PATTERN = re.compile(r"^(\d+)$|^(\d+(?:\.\d+)?)(ms|s)$|^(demand)$")
+
+
+class RollingStatistics:
+    def __init__(self, 
+                 periods: list, 
+                 alpha: float=0.1, 
+                 resync_interval: int=4096) -> None:
+        """
+        Incremental rolling-window engine backing Statistics.
+
+        Keeps its own ring of the most recent samples together with a running
+        sum and an EMA accumulator per period, so every pushed sample costs
+        O(1) per period instead of a rescan of the window.
+
+        Window semantics mirror the original slice based implementation: for a
+        period `p` the window is the `p - 1` samples preceding the newest one,
+        the average divides by `p` and the EMA is seeded with 1.
+
+        Args:
+            periods (list): window lengths to maintain.
+            alpha (float): EMA smoothing factor.
+            resync_interval (int): pushes between exact recomputations of the 
+                running sums, bounds floating point drift.
+        """
+        self.periods = list(periods)
+        self.alpha = alpha
+        self.decay = 1 - alpha
+        self.resync_interval = resync_interval
+        self.capacity = max(self.periods)
+        self.ring = [0.0] * self.capacity
+        self.head = 0  # slot the next sample is written to
+        self.count = 0  # samples pushed so far
+        self.last = None
+        self.sums = {p: 0.0 for p in self.periods}
+        self.ema_acc = {p: 0.0 for p in self.periods}
+        self.ema_seed = {p: self.decay ** (p - 1) for p in self.periods}
+        self.ema_exit = {p: alpha * self.decay ** (p - 1) for p in self.periods}
+
+    def push(self, value: float) -> None:
+        """
+        Add a sample and slide every window by one.
+
+        Args:
+            value (float): The newest simulation value.
+        """
+        count = self.count + 1
+        entering = self.last
+
+        if entering is not None:
+            ring = self.ring
+            head = self.head
+            capacity = self.capacity
+            alpha = self.alpha
+            decay = self.decay
+            for p in self.periods:
+                if count > p:
+                    leaving = ring[(head - p) % capacity]
+                    self.sums[p] += entering - leaving
+                    self.ema_acc[p] = decay * self.ema_acc[p] + alpha * entering - self.ema_exit[p] * leaving
+                else:
+                    self.sums[p] += entering
+                    self.ema_acc[p] = decay * self.ema_acc[p] + alpha * entering
+
+        self.ring[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.last = value
+        self.count = count
+
+        if count % self.resync_interval == 0:
+            self.resync()
+
+    def window(self, period: int) -> list:
+        """
+        Get the current window for a period, oldest sample first.
+
+        Args:
+            period (int): The window length.
+
+        Returns:
+            list: Up to `period - 1` samples preceding the newest one.
+        """
+        size = max(min(self.count - 1, period - 1), 0)
+        start = self.head - 1 - size
+        return [self.ring[(start + i) % self.capacity] for i in range(size)]
+
+    def history(self) -> list:
+        """
+        Get the retained samples, oldest first.
+
+        Returns:
+            list: Up to `capacity` of the most recent samples.
+        """
+        size = min(self.count, self.capacity)
+        start = self.head - size
+        return [self.ring[(start + i) % self.capacity] for i in range(size)]
+
+    def extend(self, values: list) -> None:
+        """
+        Add a batch of samples without sliding the windows step by step.
+
+        The ring is reloaded from the tail of the batch and the accumulators
+        are recomputed once, used after a batch was processed vectorized.
+
+        Args:
+            values (list): The new simulation values, oldest first.
+        """
+        if len(values) == 0:
+            return
+        retained = self.history() + list(values[-self.capacity:])
+        retained = retained[-self.capacity:]
+        self.ring = retained + [0.0] * (self.capacity - len(retained))
+        self.head = len(retained) % self.capacity
+        self.count += len(values)
+        self.last = float(values[-1])
+        self.resync()
+
+    def resync(self) -> None:
+        """
+        Recompute the running sums and EMA accumulators from the ring.
+        """
+        for p in self.periods:
+            window = self.window(p)
+            self.sums[p] = sum(window)
+            acc = 0.0
+            for x in window:
+                acc = self.decay * acc + self.alpha * x
+            self.ema_acc[p] = acc
+
+    def running_avg(self, period: int) -> float:
+        """
+        Get the running average for a period.
+        """
+        return self.sums[period] / period
+
+    def ema(self, period: int) -> float:
+        """
+        Get the exponential moving average for a period.
+        """
+        return self.ema_seed[period] + self.ema_acc[period]
+
+
+def statistic(key: str, per_period: bool=True, batch: str=None) -> Callable:
+    """
+    Register a Statistics method as a stat.
+
+    Registered methods are resolved once when Statistics is built and then run
+    from a flat call list on every step. Per period stats are called with each
+    sample period and reported as `{key}_{period}`, other stats are called
+    without arguments and reported as `key`.
+
+    Args:
+        key (str): The output key (prefix) of the stat.
+        per_period (bool): Whether the stat is evaluated for every sample period.
+        batch (str): Name of a method computing the stat for a whole batch of 
+            samples with NumPy, see `Statistics.process_batch`.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(method: Callable) -> Callable:
+        method._stat_key = key
+        method._stat_per_period = per_period
+        method._stat_batch = batch
+        return method
+
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def registered_stats(cls: type) -> tuple:
+    """
+    Get the stats registered on a Statistics class.
+
+    Args:
+        cls (type): Statistics or a subclass of it.
+
+    Returns:
+        tuple: (attribute name, key, per_period, batch) for each registered stat.
+    """
+    stats = []
+    for attr_name in dir(cls):
+        method = getattr(cls, attr_name)
+        key = getattr(method, "_stat_key", None)
+        if key is not None:
+            stats.append((attr_name, key, method._stat_per_period, method._stat_batch))
+    return tuple(stats)
+
+
+def stat_keys(cls: type=None, periods: tuple=SAMPLE_PERIODS) -> List[str]:
+    """
+    Get the keys `process` reports for a Statistics class, without building one.
+
+    Args:
+        cls (type): Statistics or a subclass of it (default: Statistics).
+        periods (tuple): The sample periods.
+
+    Returns:
+        list: The stat keys, `proc_` stats of the compatibility shim are not included.
+    """
+    keys = []
+    for _, key, per_period, _ in registered_stats(cls or Statistics):
+        if per_period:
+            keys.extend(f"{key}_{period}" for period in periods)
+        else:
+            keys.append(key)
+    return keys
+
+
+def parse_cadence(spec: str) -> Dict[str, Tuple[str, Optional[float]]]:
+    """
+    Parse a stat cadence like `ema=10,running_avg_223=500ms,*=demand`.
+
+    Each entry maps a stat key (`ema_223`), a registered stat (`ema`, every
+    period) or `*` (every other stat) to how often it is evaluated: every N
+    samples (`10`), every T milliseconds or seconds (`500ms`, `2s`) or only
+    on demand (`demand`). Stats not listed are evaluated every sample.
+
+    Args:
+        spec (str): Comma separated `key=cadence` entries, may be empty.
+
+    Returns:
+        dict: (kind, every) per key, kind being `samples`, `time` (every in
+            seconds) or `demand` (every None).
+    """
+    cadence = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = entry.partition("=")
+        match = CADENCE_PATTERN.match(value.strip())
+        if not key.strip() or match is None:
+            raise ValueError(
+                f"invalid stat cadence {entry!r}, expected e.g. ema=10, ema_223=500ms or *=demand")
+        samples, amount, unit, demand = match.groups()
+        if samples is not None:
+            cadence[key.strip()] = ("samples", max(int(samples), 1))
+        elif demand is not None:
+            cadence[key.strip()] = ("demand", None)
+        else:
+            cadence[key.strip()] = ("time", float(amount) / (1000 if unit == "ms" else 1))
+    return cadence
+
+
+def carry_forward(column: np.ndarray, due: np.ndarray, last: float) -> np.ndarray:
+    """
+    Keep `column` at the rows that are `due` and repeat the previous due row 
+        (or `last` before the first) everywhere else.
+    """
+    rows = np.where(due, np.arange(len(column)), -1)
+    np.maximum.accumulate(rows, out=rows)
+    return np.where(rows >= 0, column[rows], last)
 
 
 class Statistics:
-    def __init__(self, sample_periods:list, sample_queue: deque) -> None:
+    def __init__(self, 
+                 sample_periods:list, 
+                 sample_queue: deque, 
+                 cadence: Dict[str, Tuple[str, Optional[float]]]=None,
+                 clock: Callable[[], float]=time.monotonic) -> None:
         """
         Initialize the Statistics class.
 
+        `process` must be called once per sample appended to `sample_queue`,
+        the newest sample is pushed into the incremental engine on each call.
+
+        With a `cadence` (see `parse_cadence`) only the stats that are due are
+        evaluated, the others carry their last value forward into the rows,
+        None (NaN in batch columns) until they are first evaluated. On demand
+        stats are only evaluated by `evaluate`, e.g. when the rows are queried.
+        The windows still slide every sample, so a stat is exact for the sample
+        it was evaluated at.
+
         Args:
             sample_periods (list): list of periods for calculating running average
             sample_queue (deque): A deque object containing the simulation values.
+            cadence (dict): How often each stat is evaluated, every sample when omitted.
+            clock (Callable): Monotonic seconds the time cadences are measured in.
         """
         self.sample_queue = sample_queue
         self.sample_periods = sample_periods
-        self.attr_init = False
-        self._stat_attributes = {}
+        self.rolling = RollingStatistics(periods=sample_periods)
+        self._stat_calls, self._batch_calls = self._compile_stats()
+        self.stat_keys = [key for key, _ in self._stat_calls]
+        self.clock = clock
+        self.processed = 0  # samples processed, count cadences are counted in
+        self._schedule = self._compile_cadence(cadence) if cadence else None
+        # compatibility shim for `proc_` methods setting `_s_` attributes, the
+        #   ones kept on Statistics for callers of the previous API are not run
+        #   unless a subclass overrides them
+        self._legacy_procs = [
+            getattr(self, attr_name) for attr_name in dir(type(self)) 
+            if attr_name.startswith("proc_") and callable(getattr(self, attr_name))
+            and not (attr_name in PREVIOUS_API_PROCS 
+                     and getattr(type(self), attr_name) is getattr(Statistics, attr_name))]
+        self._legacy_attributes = None
+
+    def _compile_stats(self) -> tuple:
+        """
+        Resolve the registered stats into flat lists of calls.
+
+        Returns:
+            tuple: (output key, callable) pairs in registration order for 
+                single steps, and for batches (None if any stat has no batch method).
+        """
+        calls = []
+        batch_calls = []
+        for attr_name, key, per_period, batch in registered_stats(type(self)):
+            method = getattr(self, attr_name)
+            batch_method = getattr(self, batch) if batch else None
+            if batch_method is None:
+                batch_calls = None
+            if per_period:
+                for period in self.sample_periods:
+                    calls.append((f"{key}_{period}", functools.partial(method, period)))
+                    if batch_calls is not None:
+                        batch_calls.append((f"{key}_{period}", functools.partial(batch_method, period)))
+            else:
+                calls.append((key, method))
+                if batch_calls is not None:
+                    batch_calls.append((key, batch_method))
+        return calls, batch_calls
+
+    def _compile_cadence(self, cadence: Dict[str, Tuple[str, Optional[float]]]) -> Optional[list]:
+        """
+        Resolve a cadence into the schedule of the stats not evaluated every sample.
+
+        Returns:
+            list: [key, call, kind, every, next due] per scheduled stat, in
+                registration order, None when every stat is evaluated every sample.
+        """
+        # output key -> registered stat, e.g. ema_223 -> ema
+        stat_names = {}
+        for _, name, per_period, _ in registered_stats(type(self)):
+            for key in ([f"{name}_{period}" for period in self.sample_periods] if per_period else [name]):
+                stat_names[key] = name
+        unknown = set(cadence) - set(stat_names) - set(stat_names.values()) - {"*"}
+        if unknown:
+            raise ValueError(f"unknown stats in cadence: {sorted(unknown)}, available: {self.stat_keys}")
+
+        schedule = []
+        self._every_calls = []
+        self._carried = {}
+        for key, call in self._stat_calls:
+            kind, every = (
+                cadence.get(key) or cadence.get(stat_names[key]) or cadence.get("*") or ("samples", 1))
+            self._carried[key] = None
+            if kind == "samples" and every == 1:
+                self._every_calls.append((key, call))
+            else:
+                # due right away, so every stat has a value from the first row
+                schedule.append([key, call, kind, every, 1 if kind == "samples" else float("-inf")])
+        self._timed = any(entry[2] == "time" for entry in schedule)
+        self._schedule = schedule
+        self._next_due()
+        return schedule or None
 
-    def proc_calculate_running_avg(self, sample_size: int = 21) -> None:
+    @property
+    def on_demand(self) -> bool:
+        """
+        Whether any stat is only evaluated by `evaluate`.
+        """
+        return any(entry[2] == "demand" for entry in self._schedule or ())
+
+    def evaluate(self, keys: List[str]=None) -> dict:
+        """
+        Evaluate stats now, regardless of their cadence, and carry the values 
+            forward from here.
+
+        Args:
+            keys (list): The stat keys, the scheduled ones when omitted.
+
+        Returns:
+            dict: The evaluated stats.
+        """
+        if self._schedule is None:
+            calls = self._stat_calls
+        else:
+            calls = [(entry[0], entry[1]) for entry in self._schedule]
+        if keys is not None:
+            keys = set(keys)
+            calls = [(key, call) for key, call in self._stat_calls if key in keys]
+        res = {key: call() for key, call in calls}
+        if self._schedule is not None:
+            self._carried.update(res)
+        return res
+
+    def _process_scheduled(self) -> dict:
+        """
+        Evaluate the stats that are due and carry the others forward.
+        """
+        processed = self.processed
+        now = self.clock() if self._timed else 0.0
+        carried = self._carried
+        for key, call in self._every_calls:
+            carried[key] = call()
+        if processed < self._next_sample and now < self._next_time:
+            return dict(carried)
+
+        for entry in self._schedule:
+            kind = entry[2]
+            if kind == "samples":
+                if processed >= entry[4]:
+                    carried[entry[0]] = entry[1]()
+                    entry[4] = processed + entry[3]
+            elif kind == "time":
+                if now >= entry[4]:
+                    carried[entry[0]] = entry[1]()
+                    entry[4] = now + entry[3]
+        self._next_due()
+        return dict(carried)
+
+    def _next_due(self) -> None:
+        """
+        Track the earliest due sample and time, so samples where nothing is due skip the schedule.
+        """
+        self._next_sample = min(
+            (entry[4] for entry in self._schedule if entry[2] == "samples"), default=float("inf"))
+        self._next_time = min(
+            (entry[4] for entry in self._schedule if entry[2] == "time"), default=float("inf"))
+
+    def _carry_batch(self, res: dict, count: int) -> dict:
+        """
+        Apply the cadence to the columns of a batch of `count` samples, the
+            batch counts as taken at once for the time cadences.
+        """
+        processed = self.processed - count + np.arange(1, count + 1)
+        now = self.clock() if self._timed else 0.0
+        for entry in self._schedule:
+            key, _, kind, every, next_due = entry
+            if kind == "samples":
+                due = (processed >= next_due) & ((processed - next_due) % every == 0)
+                if due.any():
+                    entry[4] = int(processed[due][-1]) + every
+            elif kind == "time" and now >= next_due:
+                due = np.zeros(count, dtype=bool)
+                due[-1] = True
+                entry[4] = now + every
+            else:
+                due = np.zeros(count, dtype=bool)
+            last = self._carried[key]
+            res[key] = carry_forward(res[key], due, np.nan if last is None else last)
+        for key in self._carried:
+            last = float(res[key][-1])
+            self._carried[key] = None if np.isnan(last) else last
+        self._next_due()
+        return res
+
+    @statistic("running_avg", batch="running_avg_batch")
+    def running_avg(self, sample_size: int) -> float:
         """
         Calculate the running average of the simulation values.
 
@@ -41,61 +482,180 @@ class Statistics:
             float: The running average of the simulation values.
         """
         if len(self.sample_queue) < sample_size:
-            running_avg = 0
-            setattr(self, f"_s_running_avg_{sample_size}", running_avg)
-            return
+            return 0
+        return self.rolling.running_avg(sample_size)
+
+    @statistic("ema", batch="ema_batch")
+    def ema(self, sample_size: int) -> float:
+        """
+        Calculate exponential moving average
+
+        Args:
+            sample_size (int): The number of samples in the averaging window.
+
+        Returns:
+            float: The exponential moving average of the simulation values.
+        """
+        if len(self.sample_queue) < sample_size:
+            return 0
+        return self.rolling.ema(sample_size)
+
+    def running_avg_batch(self, 
+                          sample_size: int, 
+                          series: np.ndarray, 
+                          lengths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the running average for a batch using cumulative sums.
+
+        Args:
+            sample_size (int): The number of samples to consider for calculating the running average.
+            series (np.ndarray): Retained history followed by the batch.
+            lengths (np.ndarray): The sample queue length at each batch row.
 
-        summation = sum(itertools.islice(self.sample_queue, len(self.sample_queue) - sample_size, len(self.sample_queue) - 1))
+        Returns:
+            np.ndarray: The running average at each batch row.
+        """
+        cumsum = np.concatenate(([0.0], np.cumsum(series)))
+        rows = np.arange(len(series) - len(lengths), len(series))
+        starts = np.maximum(rows - sample_size + 1, 0)
+        running_avg = (cumsum[rows] - cumsum[starts]) / sample_size
+        return np.where(lengths < sample_size, 0.0, running_avg)
 
-        running_avg = summation / sample_size
+    def ema_batch(self, 
+                  sample_size: int, 
+                  series: np.ndarray, 
+                  lengths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the exponential moving average for a batch by convolving
+        with the truncated EMA kernel.
 
+        Args:
+            sample_size (int): The number of samples in the averaging window.
+            series (np.ndarray): Retained history followed by the batch.
+            lengths (np.ndarray): The sample queue length at each batch row.
+
+        Returns:
+            np.ndarray: The exponential moving average at each batch row.
+        """
+        alpha = self.rolling.alpha
+        kernel = alpha * (1 - alpha) ** np.arange(sample_size - 1)
+        # weighted window ending at each sample, the window of a row excludes the row itself
+        weighted = np.convolve(series, kernel)[:len(series)]
+        weighted = np.concatenate(([0.0], weighted[:-1]))
+        ema = (1 - alpha) ** (sample_size - 1) + weighted[len(series) - len(lengths):]
+        return np.where(lengths < sample_size, 0.0, ema)
+
+    def proc_calculate_running_avg(self, sample_size: int=21) -> None:
+        """
+        Previous API, sets `_s_running_avg_{sample_size}` to the running average.
+
+        Args:
+            sample_size (int): The number of samples to consider for calculating the running average.
+        """
+        if sample_size in self.rolling.sums:
+            running_avg = self.running_avg(sample_size)
+        elif len(self.sample_queue) < sample_size:
+            running_avg = 0
+        else:
+            running_avg = sum(
+                itertools.islice(self.sample_queue, len(self.sample_queue) - sample_size, len(self.sample_queue) - 1)
+            ) / sample_size
         setattr(self, f"_s_running_avg_{sample_size}", running_avg)
 
-    def proc_ema(self, sample_size:int=21, alpha:float=0.1) -> None:
+    def proc_ema(self, sample_size: int=21, alpha: float=0.1) -> None:
         """
-        Calculate exponential moving average
+        Previous API, sets `_s_ema_{sample_size}` to the exponential moving average.
+
+        Args:
+            sample_size (int): The number of samples in the averaging window.
+            alpha (float): The smoothing factor.
         """
-        if len(self.sample_queue) < sample_size:
+        if sample_size in self.rolling.ema_acc and alpha == self.rolling.alpha:
+            ema = self.ema(sample_size)
+        elif len(self.sample_queue) < sample_size:
             ema = 0
-            setattr(self, f"_s_ema_{sample_size}", ema)
-            return
-
-        sample = itertools.islice(self.sample_queue, len(self.sample_queue) - sample_size, len(self.sample_queue) - 1)
-        ema = 1
-        for x in sample:
-            ema = alpha * x + (1 - alpha) * ema
-        
+        else:
+            ema = 1
+            for x in itertools.islice(
+                    self.sample_queue, len(self.sample_queue) - sample_size, len(self.sample_queue) - 1):
+                ema = alpha * x + (1 - alpha) * ema
         setattr(self, f"_s_ema_{sample_size}", ema)
 
-    def process(self) -> dict:
+    def _process_legacy(self) -> dict:
+        """
+        Call the `proc_` methods and collect the `_s_` attributes they set.
+
+        Returns:
+            dict: The legacy stats keyed without the `_s_` prefix.
         """
-        Process the statistics by dynamically calling all methods 
-        that start with 'proc_' and setting attributes that start with '_s_'.
+        for method in self._legacy_procs:
+            method()
 
-        Get the updates of the statistics attributes.
+        if self._legacy_attributes is None:
+            self._legacy_attributes = {
+                attr_name[3:]: attr_name for attr_name in vars(self) if attr_name.startswith("_s_")}
+
+        values = vars(self)
+        return {key: values[attr_name] for key, attr_name in self._legacy_attributes.items()}
+
+    def process(self) -> dict:
+        """
+        Process the statistics by running the registered stats that are due,
+        followed by any `proc_` methods (setting attributes that start with '_s_').
 
         Returns:
             dict: A dictionary containing the updates of the statistics attributes.
         """
-        for attr_name in dir(self):
-            if attr_name.startswith('proc_calculate_running'):
-                method = getattr(self, attr_name)
-                if callable(method):
-                    for x in self.sample_periods:
-                        method(x)
-            elif attr_name.startswith('proc_ema'):
-                method = getattr(self, attr_name)
-                if callable(method):
-                    method(x)
-
-        if not self.attr_init:
-            self._stat_attributes = {
-                attr_name[3:]: attr_name for attr_name in dir(self) if attr_name.startswith('_s_')}
-            self.attr_init = True
-        
-        res = {}
-
-        for key, attr_name in self._stat_attributes.items():
-            res[key] = getattr(self, attr_name)
+        begin = time.perf_counter()
+        if self.sample_queue:
+            self.rolling.push(self.sample_queue[-1])
+        self.processed += 1
+
+        if self._schedule is None:
+            res = {key: call() for key, call in self._stat_calls}
+        else:
+            res = self._process_scheduled()
+
+        if self._legacy_procs:
+            res.update(self._process_legacy())
+
+        STATS_PROCESS_SECONDS.observe(time.perf_counter() - begin)
+        return res
+
+    def process_batch(self, values: np.ndarray) -> dict:
+        """
+        Append a batch of samples to the sample queue and process them.
+
+        When every registered stat provides a batch method (and there are no
+        `proc_` methods) the whole batch is computed vectorized, otherwise 
+        this falls back to `process` for each sample.
+
+        Args:
+            values (np.ndarray): The new simulation values, oldest first.
+
+        Returns:
+            dict: A dictionary of arrays, one value per sample, keyed like `process`.
+        """
+        if self._batch_calls is None or self._legacy_procs:
+            rows = []
+            for value in values.tolist():
+                self.sample_queue.append(value)
+                rows.append(self.process())
+            return {key: np.array([row[key] for row in rows]) for key in (rows[0] if rows else {})}
+
+        begin = time.perf_counter()
+        series = np.concatenate((np.asarray(self.rolling.history(), dtype=float), values))
+        lengths = self.rolling.count + np.arange(1, len(values) + 1)
+        if self.sample_queue.maxlen is not None:
+            lengths = np.minimum(lengths, self.sample_queue.maxlen)
+
+        res = {key: call(series, lengths) for key, call in self._batch_calls}
+
+        self.sample_queue.extend(values.tolist())
+        self.rolling.extend(values)
+        self.processed += len(values)
+        if self._schedule is not None and len(values):
+            res = self._carry_batch(res, len(values))
 
+        STATS_BATCH_SECONDS.observe(time.perf_counter() - begin)
         return res
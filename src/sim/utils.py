@@ -2,8 +2,10 @@
 This file contains utility functions for the simulation module.
 """
 # locals
+import re
 import argparse
 import logging
+from datetime import timedelta
 
 # project
 # ..
@@ -12,7 +14,8 @@ import logging
 # ..
 
 # constants
-# ..
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
 
 
 def setup_logging(cvars: argparse.ArgumentParser) -> None:
@@ -34,11 +37,46 @@ def setup_logging(cvars: argparse.ArgumentParser) -> None:
     return
 
 
+def parse_duration(duration: str) -> timedelta:
+    """
+    Parses durations like `90s`, `15m`, `24h` or `7d`.
+    """
+    match = DURATION_PATTERN.match(duration.strip())
+    if match is None:
+        raise ValueError(f"invalid duration {duration!r}, expected e.g. 90s, 15m, 24h or 7d")
+    amount, unit = match.groups()
+    return timedelta(**{DURATION_UNITS[unit]: float(amount)})
+
+
 def parse_cvars() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
         "-s", "--sims", type=int, help="number of simulations to run")
+    parser.add_argument(
+        "-b", "--batch-size", type=int, help="steps generated per loop iteration with NumPy")
+    parser.add_argument(
+        "-w", "--workers", type=int, help="processes the simulations are sharded across")
+    parser.add_argument(
+        "--sched-workers", type=int, help="scheduler threads driving the simulations, 0 for a thread per simulation")
+    parser.add_argument(
+        "--paths", type=int, help="run each simulation as an ensemble of this many paths, one aggregated row per step")
+    parser.add_argument(
+        "--path-rows", type=int, help="paths of each ensemble also written as their own rows")
+    parser.add_argument(
+        "--shared-windows", action="store_true", default=None,
+        help="publish each simulation's recent rows to shared memory for other processes")
+    parser.add_argument(
+        "--stat-cadence", type=str, 
+        help="how often stats are evaluated, e.g. ema=10,running_avg=500ms,*=demand, others carry forward")
+    parser.add_argument(
+        "--sinks", type=str, help="comma separated sinks the rows are written to: db, asyncdb, files")
+    parser.add_argument(
+        "--seed", type=int, help="seed of the simulations' random streams, runs with the same seed are identical")
+    parser.add_argument(
+        "--backfill", type=str, help="generate this much history (e.g. 24h) as fast as possible and exit, no web server")
+    parser.add_argument(
+        "--output", type=str, help="backfill into a .csv or .parquet file, or a directory of raw segments, instead of the sinks")
     parser.add_argument(
         "-v", "--verbose", action="count", default=0, help="increase logging verbosity level"
     )
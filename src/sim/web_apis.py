@@ -2,24 +2,52 @@
 This module provides web APIs for interacting with Monte Carlo simulations.
 """
 # locals
+import io
+import json
+import asyncio
+import fnmatch
 import logging
+from collections import Counter
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 # project
+from src.sim.control import ACTIONS, ControlDispatcher
+from src.sim.data_model import BulkControlRequest
+from src.sim.live_feed import LiveFeed
+from src.sim.metrics import REGISTRY
+from src.sim.profiler import StackSampler
 from src.sim.simulator import MonteCarloSimulation
 
 # third party
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+import numpy as np
+try:
+    import pyarrow as pa
+except ImportError:  # arrow output is optional
+    pa = None
 
 # constants
 logger = logging.getLogger(__name__)
 
 
+def json_column(column: np.ndarray) -> list:
+    """
+    A history column as a JSON-safe list, a missing mark or stat (NaN) becomes None.
+    """
+    if column.dtype.kind == "f":
+        return np.where(np.isnan(column), None, column).tolist()
+    return column.tolist()
+
+
 class SimulationWEBAPIs:
-    def __init__(self, sims: Dict[str, MonteCarloSimulation]) -> None:
+    def __init__(self, 
+                 sims: Dict[str, MonteCarloSimulation], 
+                 feed: Optional[LiveFeed]=None,
+                 max_dropped: int=10000,
+                 control_workers: int=16) -> None:
         self.app = FastAPI()
         self.app.mount(
             "/static", 
@@ -27,7 +55,11 @@ class SimulationWEBAPIs:
                 directory=Path(__file__).parent / "static"), 
                 name="static")
         self.sims = sims
+        self.feed = feed
+        self.max_dropped = max_dropped  # records a viewer may miss before it is disconnected
         self.ids = [sim_id for sim_id in self.sims.keys()]
+        self.control = ControlDispatcher(workers=control_workers)
+        self.profiler = StackSampler()
         self._setup_routes()
 
     def _setup_routes(self) -> None:
@@ -35,6 +67,13 @@ class SimulationWEBAPIs:
         routes = [
             ("/", self.read_index, ["GET"]),
             ("/simulation-ids/", self.get_simulation_ids, ["GET"]),
+            ("/stream", self.stream_samples, ["GET"]),
+            ("/simulations/{sim_id}/recent", self.get_recent, ["GET"]),
+            ("/control", self.bulk_control, ["POST"]),
+            ("/metrics", self.get_metrics, ["GET"]),
+            ("/profiler", self.get_profile, ["GET"]),
+            ("/profiler/start", self.start_profiler, ["POST"]),
+            ("/profiler/stop", self.stop_profiler, ["POST"]),
             ("/control/{sim_id}/start", "start", ["POST"]),
             ("/control/{sim_id}/pause", "pause", ["POST"]),
             ("/control/{sim_id}/resume", "resume", ["POST"]),
@@ -51,21 +90,192 @@ class SimulationWEBAPIs:
                 self.app.add_api_route(path, action, methods=methods)
 
     def handle_request(self, action: str) -> dict:
-        def handler(sim_id: str):
+        async def handler(sim_id: str, wait: bool=False, timeout: float=30.0):
             sim = self.sims.get(sim_id)
             if not sim:
                 raise HTTPException(status_code=404, detail="Simulation not found")
-            if hasattr(sim, action):
-                getattr(sim, action)()
-                return {"message": f"success"}
-            else:
+            if not hasattr(sim, action):
                 raise HTTPException(status_code=400, detail=f"failure")
+
+            future = self.control.submit(sim_id, sim, action)
+            if not wait:
+                return {"message": "accepted"}
+
+            await asyncio.wait([asyncio.wrap_future(future)], timeout=timeout)
+            result = self.control.results({sim_id: future}, timeout=0)[sim_id]
+            if result.startswith("error"):
+                raise HTTPException(status_code=500, detail=result)
+            return {"message": "success" if result == "ok" else result}
         
         return handler
 
+    async def bulk_control(self, request: BulkControlRequest) -> dict:
+        """
+        Applies an action to many simulations at once, concurrently.
+
+        Targets are the listed `sim_ids`, the ids matching the glob `pattern`, 
+            or all simulations when neither is given. With `wait` the response
+            is held until every action is applied or `timeout` expires.
+
+        Returns:
+            dict: The action, the result per simulation ("ok", "accepted", 
+                "pending", "error: ...") and a count per result.
+        """
+        if request.action not in ACTIONS:
+            raise HTTPException(status_code=400, detail=f"action must be one of {list(ACTIONS)}")
+
+        if request.sim_ids is not None:
+            sim_ids = request.sim_ids
+        elif request.pattern is not None:
+            sim_ids = fnmatch.filter(self.ids, request.pattern)
+        else:
+            sim_ids = self.ids
+
+        results = {sim_id: "error: not found" for sim_id in sim_ids if sim_id not in self.sims}
+        futures = self.control.submit_many(
+            {sim_id: self.sims[sim_id] for sim_id in sim_ids if sim_id in self.sims}, 
+            request.action)
+
+        if request.wait and futures:
+            await asyncio.wait(
+                [asyncio.wrap_future(future) for future in futures.values()], 
+                timeout=request.timeout)
+            results.update(self.control.results(futures, timeout=0))
+        else:
+            results.update({sim_id: "accepted" for sim_id in futures})
+
+        return {
+            "action": request.action,
+            "results": results,
+            "counts": dict(Counter(result.split(":")[0] for result in results.values()))}
+
     def read_index(self) -> HTMLResponse:
         index_file = Path(__file__).parent / "static" / "index.html"
         return HTMLResponse(content=index_file.read_text(), status_code=200)
     
     def get_simulation_ids(self) -> dict:
         return {"simulation_ids": self.ids }
+
+    def get_metrics(self) -> Response:
+        """
+        Exposes the metrics in the Prometheus text format.
+        """
+        return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    def start_profiler(self, duration: float=30.0, interval: float=0.005) -> dict:
+        """
+        Starts the stack sampler for `duration` seconds, 0 runs until stopped.
+        """
+        if duration < 0 or interval <= 0:
+            raise HTTPException(status_code=400, detail="duration must be >= 0 and interval > 0")
+        try:
+            self.profiler.start(duration=duration or None, interval=interval)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return self.profiler.status()
+
+    def stop_profiler(self, sim_id: Optional[str]=None) -> Response:
+        """
+        Stops the stack sampler and returns the collapsed stacks.
+        """
+        self.profiler.stop()
+        return Response(content=self.profiler.collapsed(sim_id), media_type="text/plain")
+
+    def get_profile(self, sim_id: Optional[str]=None, format: str="collapsed") -> Response:
+        """
+        Returns the collapsed stacks of the running or last profile, 
+            or the profiler status with `format=status`.
+        """
+        if format == "status":
+            return Response(content=json.dumps(self.profiler.status()), media_type="application/json")
+        return Response(content=self.profiler.collapsed(sim_id), media_type="text/plain")
+
+    async def stream_samples(self, 
+                             request: Request, 
+                             sim_ids: Optional[str]=None, 
+                             max_rate: Optional[float]=None) -> StreamingResponse:
+        """
+        Streams samples as server-sent events straight from the live feed, 
+            without touching the database.
+
+        Args:
+            sim_ids (str): Comma separated simulation ids, all when omitted.
+            max_rate (float): Max samples per second per simulation, latest wins.
+        """
+        if self.feed is None:
+            raise HTTPException(status_code=404, detail="Live feed not available")
+        if max_rate is not None and not max_rate > 0:
+            raise HTTPException(status_code=400, detail="max_rate must be > 0")
+
+        subscription = self.feed.subscribe(
+            sim_ids=sim_ids.split(",") if sim_ids else None,
+            max_rate=max_rate)
+
+        async def events():
+            try:
+                while not await request.is_disconnected():
+                    samples = subscription.poll()
+                    if subscription.dropped > self.max_dropped:
+                        logger.info(f"dropping slow live feed viewer after {subscription.dropped} missed samples")
+                        break
+                    if samples:
+                        yield f"data: {json.dumps(samples, default=str)}\n\n"
+                    await asyncio.sleep(subscription.interval)
+            finally:
+                self.feed.unsubscribe(subscription)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def get_recent(self, 
+                   sim_id: str, 
+                   n: int=100, 
+                   fields: Optional[str]=None, 
+                   format: str="json") -> Response:
+        """
+        Returns the last `n` rows of a simulation from its in-memory history.
+
+        Args:
+            n (int): The number of rows, capped at the history size.
+            fields (str): Comma separated columns, all when omitted.
+            format (str): `json` (columnar), `npy` (NumPy structured array) or 
+                `arrow` (Arrow IPC stream, requires pyarrow).
+        """
+        sim = self.sims.get(sim_id)
+        if not sim:
+            raise HTTPException(status_code=404, detail="Simulation not found")
+        history = getattr(sim, "history", None)
+        if history is None:
+            raise HTTPException(status_code=404, detail="History not available")
+
+        columns = fields.split(",") if fields else None
+        if columns and not set(columns) <= set(history.fields):
+            raise HTTPException(status_code=400, detail=f"unknown fields, available: {history.fields}")
+
+        stats = getattr(sim, "stats", None)
+        if stats is not None and stats.on_demand:
+            sim.evaluate_stats()
+        rows = history.tail(n, columns)
+        names = list(rows.dtype.names)
+
+        if format == "json":
+            return Response(
+                content=json.dumps({
+                    "sim_id": sim_id,
+                    "rows": len(rows),
+                    "columns": {name: json_column(rows[name]) for name in names}}, allow_nan=False),
+                media_type="application/json")
+        if format == "npy":
+            buffer = io.BytesIO()
+            np.save(buffer, rows, allow_pickle=False)
+            return Response(content=buffer.getvalue(), media_type="application/octet-stream")
+        if format == "arrow":
+            if pa is None:
+                raise HTTPException(status_code=400, detail="arrow output requires pyarrow")
+            table = pa.table({name: rows[name] for name in names})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return Response(
+                content=sink.getvalue().to_pybytes(), 
+                media_type="application/vnd.apache.arrow.stream")
+        raise HTTPException(status_code=400, detail="format must be json, npy or arrow")
@@ -0,0 +1,77 @@
+"""
+AsyncDatabaseClient ingest, on SQLite (aiosqlite) and on the PostgreSQL server
+in TEST_DATABASE_URL (asyncpg) when there is one.
+"""
+# locals
+import os
+import uuid
+import threading
+from datetime import datetime, timedelta
+
+# project
+from src.sim.data_model import SampleRecord, SimID
+
+# third party
+import pytest
+from sqlalchemy import create_engine, text
+
+# constants
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+ROWS = 2000
+PRODUCERS = 4
+
+
+def targets() -> list:
+    params = [pytest.param("sqlite", "insert", id="sqlite-insert")]
+    postgres = pytest.mark.skipif(
+        DATABASE_URL is None or not DATABASE_URL.startswith("postgresql"),
+        reason="needs a PostgreSQL server in TEST_DATABASE_URL")
+    params += [
+        pytest.param("postgresql", mode, id=f"postgresql-{mode}", marks=postgres)
+        for mode in ("insert", "copy")]
+    return params
+
+
+@pytest.mark.parametrize("dialect, ingest_mode", targets())
+def test_ingest(dialect, ingest_mode, tmp_path):
+    from src.sim.async_db_client import ASYNC_DRIVERS, AsyncDatabaseClient
+    pytest.importorskip(ASYNC_DRIVERS[dialect])
+    pytest.importorskip("greenlet")
+    database_url = f"sqlite:///{tmp_path / 'async.db'}" if dialect == "sqlite" else DATABASE_URL
+
+    client = AsyncDatabaseClient(
+        buffer_limit=100, ingest_mode=ingest_mode, rollups=False, database_url=database_url)
+    assert client.ingest_mode == ingest_mode
+    sim_ids = [f"test-{uuid.uuid4().hex[:6]}" for _ in range(PRODUCERS)]
+    for sim_id in sim_ids:
+        client.write(SimID(sim_id=sim_id), immediate_commit=True)
+
+    start = datetime(2024, 1, 1)
+
+    def produce(sim_id: str) -> None:
+        for i in range(ROWS):
+            client.write(SampleRecord(
+                timestamp=start + timedelta(milliseconds=20 * i), sim_id=sim_id, samples=i + 1,
+                value=float(i), statistics={"ema_23": i / 2, "custom": 1.0} if i % 2 else None))
+
+    threads = [threading.Thread(target=produce, args=(sim_id,)) for sim_id in sim_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+
+    engine = create_engine(database_url)
+    names = ", ".join(f"'{sim_id}'" for sim_id in sim_ids)
+    try:
+        with engine.connect() as connection:
+            count, typed, total = connection.execute(text(
+                f"SELECT count(*), count(ema_23), sum(value) FROM sampledata WHERE sim_id IN ({names})")).one()
+            assert count == ROWS * PRODUCERS
+            assert typed == ROWS // 2 * PRODUCERS
+            assert total == pytest.approx(sum(range(ROWS)) * PRODUCERS)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM sampledata WHERE sim_id IN ({names})"))
+            connection.execute(text(f"DELETE FROM simid WHERE sim_id IN ({names})"))
+        engine.dispose()
@@ -0,0 +1,108 @@
+"""
+Stat evaluation cadence: parsing, carry-forward and stepwise vs batched rows.
+"""
+# locals
+from collections import deque
+
+# project
+from src.sim.statistics import SAMPLE_PERIODS, Statistics, parse_cadence
+
+# third party
+import numpy as np
+import pytest
+
+# constants
+VALUES = np.random.default_rng(0).uniform(-5, 5, 3000).cumsum()
+
+
+def stepwise(cadence: dict, clock=None) -> dict:
+    sample_queue = deque(maxlen=1000)
+    options = {"clock": clock} if clock else {}
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue, cadence=cadence, **options)
+    rows = []
+    for value in VALUES.tolist():
+        sample_queue.append(value)
+        rows.append(stats.process())
+    return {key: [row[key] for row in rows] for key in rows[0]}
+
+
+def batched(cadence: dict, size: int) -> dict:
+    sample_queue = deque(maxlen=1000)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue, cadence=cadence)
+    parts = [stats.process_batch(VALUES[start:start + size]) for start in range(0, len(VALUES), size)]
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def as_array(column: list) -> np.ndarray:
+    return np.array([np.nan if stat is None else stat for stat in column])
+
+
+def test_parse_cadence():
+    assert parse_cadence("") == {}
+    assert parse_cadence("ema=10, running_avg_223=500ms,*=2s, ema_23=demand") == {
+        "ema": ("samples", 10),
+        "running_avg_223": ("time", 0.5),
+        "*": ("time", 2.0),
+        "ema_23": ("demand", None),
+    }
+    for spec in ("ema", "ema=", "=10", "ema=x", "ema=10m"):
+        with pytest.raises(ValueError):
+            parse_cadence(spec)
+
+
+def test_unknown_stat():
+    with pytest.raises(ValueError, match="unknown stats"):
+        Statistics(list(SAMPLE_PERIODS), deque(), cadence=parse_cadence("foo=10"))
+
+
+def test_carry_forward():
+    full = stepwise(None)
+    rows = stepwise(parse_cadence("ema=10,running_avg_223=7,*=demand"))
+    due = np.arange(len(VALUES))
+    for key in full:
+        if key.startswith("ema_"):
+            assert rows[key] == [full[key][i] for i in due // 10 * 10]
+        elif key == "running_avg_223":
+            assert rows[key] == [full[key][i] for i in due // 7 * 7]
+        else:
+            # never evaluated, not a made up 0.0
+            assert rows[key] == [None] * len(VALUES)
+
+
+def test_time_cadence():
+    now = [0.0]
+    full = stepwise(None)
+
+    def clock():
+        now[0] += 0.02  # 50 Hz
+        return now[0]
+
+    rows = stepwise(parse_cadence("*=1s"), clock)
+    # due on the first sample, then every 50 samples
+    assert rows["ema_23"][:50] == [full["ema_23"][0]] * 50
+    assert rows["ema_23"][50] == full["ema_23"][50]
+
+
+def test_evaluate_on_demand():
+    sample_queue = deque(maxlen=1000)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue, cadence=parse_cadence("*=demand"))
+    assert stats.on_demand
+    for value in VALUES.tolist():
+        sample_queue.append(value)
+        assert stats.process()["ema_223"] is None
+
+    evaluated = stats.evaluate()
+    assert evaluated["ema_223"] == pytest.approx(stepwise(None)["ema_223"][-1])
+    sample_queue.append(0.0)
+    # carried forward from the evaluation
+    assert stats.process()["ema_223"] == evaluated["ema_223"]
+
+
+@pytest.mark.parametrize("spec", ["ema=10,running_avg_223=7,running_avg=3", "ema=13,*=demand", ""])
+@pytest.mark.parametrize("size", [1, 37, 1000])
+def test_step_batch_equivalence(spec, size):
+    cadence = parse_cadence(spec)
+    rows = stepwise(cadence)
+    columns = batched(cadence, size)
+    for key, column in rows.items():
+        np.testing.assert_allclose(columns[key], as_array(column), rtol=1e-9, atol=1e-6)
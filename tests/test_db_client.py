@@ -0,0 +1,30 @@
+"""
+DatabaseClient schema setup, on SQLite.
+"""
+# locals
+from datetime import datetime
+
+# project
+from src.sim.data_model import SampleRecord, SimID
+from src.sim.db_client import DatabaseClient, setup_database
+
+# third party
+from sqlalchemy import create_engine, inspect, text
+
+
+def test_schema_set_up_once(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'sim.db'}"
+
+    client = DatabaseClient(rollups=False, database_url=database_url, setup_schema=False)
+    client.close()
+    # a worker's client leaves the schema alone
+    assert inspect(create_engine(database_url)).get_table_names() == []
+
+    setup_database(database_url)
+    client = DatabaseClient(rollups=False, database_url=database_url, setup_schema=False)
+    client.write(SimID(sim_id="sim-a"), immediate_commit=True)
+    client.write(SampleRecord(timestamp=datetime(2024, 1, 1), sim_id="sim-a", samples=1, value=1.0))
+    client.close()
+
+    with create_engine(database_url).connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM sampledata")).scalar() == 1
@@ -0,0 +1,93 @@
+"""
+Schema migration from the baseline unpartitioned `sampledata` table.
+
+Runs against the PostgreSQL server in TEST_DATABASE_URL, inside a throwaway
+schema, and is skipped without one.
+"""
+# locals
+import os
+import json
+from datetime import datetime, timedelta
+
+# project
+from src.sim.db_client import SAMPLES_TABLE, create_schema, list_partitions
+
+# third party
+import pytest
+from sqlalchemy import create_engine, text
+
+# constants
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = "rtsim_migration_test"
+# the tables as created by the first release, before partitioning and typed stat columns
+BASELINE_DDL = [
+    "CREATE TABLE simid (sim_id VARCHAR NOT NULL, PRIMARY KEY (sim_id))",
+    "CREATE TABLE sampledata ("
+    " timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,"
+    " sim_id VARCHAR NOT NULL,"
+    " samples INTEGER,"
+    " value FLOAT NOT NULL,"
+    " mark FLOAT,"
+    " delta FLOAT,"
+    " statistics JSON,"
+    " PRIMARY KEY (timestamp),"
+    " FOREIGN KEY(sim_id) REFERENCES simid (sim_id))",
+]
+
+pytestmark = pytest.mark.skipif(
+    DATABASE_URL is None or not DATABASE_URL.startswith("postgresql"),
+    reason="needs a PostgreSQL server in TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(f"SET search_path TO {SCHEMA}"))
+        connection.commit()
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            connection.commit()
+    engine.dispose()
+
+
+def test_migrates_baseline_table(connection):
+    for statement in BASELINE_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO simid VALUES ('sim-a')"))
+    start = datetime(2024, 1, 1, 12)
+    for i in range(3):
+        connection.execute(
+            text("INSERT INTO sampledata VALUES (:timestamp, 'sim-a', :samples, :value, NULL, 0, :statistics)"),
+            {"timestamp": start + timedelta(seconds=i), "samples": i + 1, "value": float(i),
+             "statistics": json.dumps({"ema_23": i + 0.5, "custom": 2.0})})
+    connection.commit()
+
+    create_schema(connection)
+    connection.commit()
+
+    relkind = connection.execute(text(
+        f"SELECT relkind FROM pg_class WHERE oid = to_regclass('{SAMPLES_TABLE}')")).scalar()
+    assert relkind == "p"
+    partitions = {name: (lower, upper) for name, lower, upper in list_partitions(connection)}
+    assert partitions[f"{SAMPLES_TABLE}_legacy"] == (None, datetime(2024, 1, 2))
+
+    rows = connection.execute(text(
+        f"SELECT samples, ema_23, statistics FROM {SAMPLES_TABLE} ORDER BY samples")).all()
+    assert [(samples, ema) for samples, ema, _ in rows] == [(1, 0.5), (2, 1.5), (3, 2.5)]
+    assert all(statistics == {"custom": 2.0} for _, _, statistics in rows)
+
+    # new rows land in the default partition next to the migrated ones
+    connection.execute(text(
+        f"INSERT INTO {SAMPLES_TABLE} (timestamp, sim_id, value, ema_23) "
+        "VALUES ('2024-02-01', 'sim-a', 1.0, 1.0)"))
+    assert connection.execute(text(f"SELECT count(*) FROM {SAMPLES_TABLE}")).scalar() == 4
+
+    # running it again on the migrated schema changes nothing
+    create_schema(connection)
+    assert connection.execute(text(f"SELECT count(*) FROM {SAMPLES_TABLE}")).scalar() == 4
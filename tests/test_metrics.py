@@ -0,0 +1,74 @@
+"""
+Metrics updated from several threads at once.
+"""
+# locals
+import gc
+import sys
+import weakref
+import threading
+
+# project
+from src.sim.metrics import REGISTRY, Counter, Histogram, Registry
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import Sink
+
+# third party
+import pytest
+
+# constants
+THREADS = 8
+UPDATES = 20000
+
+
+@pytest.fixture
+def switch_often():
+    # make the interpreter switch threads mid update
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def run_threads(target) -> None:
+    threads = [threading.Thread(target=target) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_keeps_every_increment(switch_often):
+    counter = Counter("test_total", "test", registry=Registry())
+    run_threads(lambda: [counter.inc() for _ in range(UPDATES)])
+    assert counter.default.value == THREADS * UPDATES
+
+
+def test_histogram_count_matches_sum(switch_often):
+    histogram = Histogram("test_seconds", "test", buckets=(0.5, 1.5), registry=Registry())
+    run_threads(lambda: [histogram.observe(1.0) for _ in range(UPDATES)])
+    counts, total = histogram.default.snapshot()
+    assert counts == [0, THREADS * UPDATES, 0]
+    assert total == THREADS * UPDATES
+    assert f"test_seconds_count {THREADS * UPDATES}" in histogram.samples()
+
+
+class NullSink(Sink):
+    def write(self, sample_data, immediate_commit: bool=False) -> None:
+        pass
+
+
+def test_closed_simulation_leaves_no_series():
+    sim = MonteCarloSimulation("sim-metrics", NullSink(), seed=0)
+    sim.step()
+    assert 'sim_id="sim-metrics"' in REGISTRY.render()
+    sim.close()
+    assert 'sim_id="sim-metrics"' not in REGISTRY.render()
+
+
+def test_registry_does_not_keep_simulations_alive():
+    sim = MonteCarloSimulation("sim-dropped", NullSink(), seed=0)
+    ref = weakref.ref(sim)
+    del sim
+    gc.collect()
+    assert ref() is None
+    assert 'sim_samples_behind{sim_id="sim-dropped"}' not in REGISTRY.render()
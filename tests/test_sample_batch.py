@@ -0,0 +1,199 @@
+"""
+Batches written as columns against the same rows written as records.
+"""
+# locals
+import csv
+import io
+import struct
+from datetime import datetime, timedelta
+
+# project
+from src.sim.backfill import CsvWriter
+from src.sim.data_model import SampleBatch, SimID
+from src.sim.db_client import (
+    COPY_COLUMNS, DatabaseClient, RingBuffer, copy_binary, copy_columns, copy_row, csv_lines)
+from src.sim.rollups import Rollups
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import ColumnarFileSink, Sink, load_segments
+from src.sim.statistics import parse_cadence
+
+# third party
+import pytest
+from sqlalchemy import create_engine, text
+
+# constants
+START = datetime(2024, 1, 1, 23, 59, 30)
+
+
+class CaptureSink(Sink):
+    def __init__(self) -> None:
+        self.batches = []
+
+    def write(self, sample_data, immediate_commit: bool=False) -> None:
+        pass
+
+    def write_columns(self, batch: SampleBatch) -> None:
+        self.batches.append(batch)
+
+
+def make_batches(steps: int=700, cadence: str="ema=demand", sample_hz: int=7) -> list:
+    # ema is on demand, its columns stay NaN, and 1/7 s is not a whole number of microseconds
+    sink = CaptureSink()
+    sim = MonteCarloSimulation(
+        "sim-a", sink, sample_hz=sample_hz, seed=0, stat_cadence=parse_cadence(cadence))
+    sim.mark_value = 1.5
+    sim.step_batch(steps // 2, start_time=START)
+    sim.step_batch(steps - steps // 2, start_time=START + timedelta(seconds=steps // 2 / sample_hz))
+    return sink.batches
+
+
+def test_records():
+    batch = make_batches()[0]
+    records = batch.records()
+    step = timedelta(seconds=1 / 7)
+    assert [record.timestamp for record in records] == [START + step * i for i in range(len(batch))]
+    assert records[-1].statistics["ema_23"] is None
+    assert records[-1].statistics["running_avg_23"] == batch.statistics["running_avg_23"][-1]
+    assert records[0].mark == 1.5
+
+
+def test_segments(tmp_path):
+    columns = ColumnarFileSink(str(tmp_path / "columns"), chunk=timedelta(minutes=1))
+    rows = ColumnarFileSink(str(tmp_path / "rows"), chunk=timedelta(minutes=1))
+    for batch in make_batches():
+        columns.write_columns(batch)
+        rows.write_many(batch.records())
+    columns.close()
+    rows.close()
+
+    written = load_segments(str(tmp_path / "columns"), "sim-a")
+    expected = load_segments(str(tmp_path / "rows"), "sim-a")
+    assert len(written) == len(expected) > 1
+    for segment, reference in zip(written, expected):
+        assert segment.tobytes() == reference.tobytes()
+
+
+def test_csv(tmp_path):
+    columns = CsvWriter(str(tmp_path / "columns.csv"))
+    rows = CsvWriter(str(tmp_path / "rows.csv"))
+    for batch in make_batches():
+        columns.write_columns(batch)
+        rows.write_many(batch.records())
+    columns.close()
+    rows.close()
+    assert (tmp_path / "columns.csv").read_text() == (tmp_path / "rows.csv").read_text()
+
+
+def test_copy_columns():
+    batch = make_batches()[0]
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(copy_row(record) for record in batch.records())
+    expected = list(csv.reader(io.StringIO(buffer.getvalue())))
+    written = list(csv.reader(io.StringIO(csv_lines(copy_columns(batch)))))
+    assert len(written) == len(expected)
+    for row, reference in zip(written, expected):
+        # isoformat vs str of the timestamp, both read the same by COPY
+        assert datetime.fromisoformat(row[0]) == datetime.fromisoformat(reference[0])
+        assert row[1:] == reference[1:]
+
+
+
+def read_binary(data: bytes) -> list:
+    # the tuples of binary COPY, decoded with the types of the sampledata columns
+    rows, offset = [], 0
+    while offset < len(data):
+        (fields,), offset = struct.unpack_from("!h", data, offset), offset + 2
+        assert fields == len(COPY_COLUMNS)
+        row = []
+        for name in COPY_COLUMNS:
+            (length,), offset = struct.unpack_from("!i", data, offset), offset + 4
+            if length == -1:
+                row.append(None)
+                continue
+            field, offset = data[offset:offset + length], offset + length
+            if name == "timestamp":
+                row.append(datetime(2000, 1, 1) + timedelta(microseconds=struct.unpack("!q", field)[0]))
+            elif name == "sim_id":
+                row.append(field.decode())
+            elif name == "samples":
+                row.append(struct.unpack("!i", field)[0])
+            else:
+                row.append(struct.unpack("!d", field)[0])
+        rows.append(row)
+    return rows
+
+
+def test_copy_binary():
+    batch = make_batches()[0]
+    # stats not evaluated yet are NULL, the tuples are packed one run of NULL columns at a time
+    key = next(iter(batch.statistics))
+    batch.statistics[key] = batch.statistics[key].copy()
+    batch.statistics[key][:10] = batch.statistics[key][200:220] = float("nan")
+    written = read_binary(copy_binary(batch))
+    assert len(written) == len(batch)
+    for row, record in zip(written, batch.records()):
+        reference = [None if field == "" else field for field in copy_row(record)]
+        assert row[0] == datetime.fromisoformat(str(reference[0]))
+        assert row[1] == reference[1]
+        assert row[2] == int(reference[2])
+        assert row[3:] == [None if field is None else float(field) for field in reference[3:]]
+
+
+def test_copy_binary_extra_stats():
+    batch = make_batches()[0]
+    batch.statistics["not a column"] = batch.values
+    assert copy_binary(batch) is None
+
+def assert_close(value, reference) -> None:
+    # sums of a run of rows are pairwise, not in row order
+    if isinstance(reference, dict):
+        assert value.keys() == reference.keys()
+        for key in reference:
+            assert_close(value[key], reference[key])
+    elif isinstance(reference, float):
+        assert value == pytest.approx(reference, rel=1e-12)
+    else:
+        assert value == reference
+
+
+def bucket_key(bucket: dict) -> tuple:
+    return bucket["sim_id"], bucket["resolution"], bucket["bucket"]
+
+
+def test_rollups():
+    columns = Rollups()
+    rows = Rollups()
+    for batch in make_batches(steps=2000):
+        written = columns.add([batch])
+        expected = rows.add(batch.records())
+        assert_close(
+            {bucket_key(bucket): bucket for bucket in written}, 
+            {bucket_key(bucket): bucket for bucket in expected})
+
+
+def test_ring_counts_rows():
+    ring = RingBuffer(10)
+    batch = make_batches(steps=16)[0]
+    ring.put(batch, len(batch))
+    assert ring.pending() == 8 and not ring.full()
+    ring.put(batch.records()[0])
+    ring.put(batch, len(batch))
+    assert ring.pending() == 17 and ring.full()
+    assert len(ring.drain()) == 3
+    assert ring.pending() == 0
+
+
+def test_database_client(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'sim.db'}"
+    client = DatabaseClient(buffer_limit=100, ingest_mode="orm", database_url=database_url)
+    client.write(SimID(sim_id="sim-a"), immediate_commit=True)
+    batches = make_batches(steps=1000)
+    for batch in batches:
+        client.write_columns(batch)
+    client.close()
+
+    with create_engine(database_url).connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM sampledata")).scalar() == 1000
+        count = connection.execute(text(
+            "SELECT sum(count) FROM samplerollup WHERE resolution = '1h'")).scalar()
+    assert count == 1000
@@ -0,0 +1,67 @@
+"""
+TickScheduler entries removed and added again while their tick is running.
+"""
+# locals
+import time
+import threading
+
+# project
+from src.sim.scheduler import TickScheduler
+
+# third party
+import pytest
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = TickScheduler(workers=4)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+class BlockingTick:
+    def __init__(self, fail: bool=False) -> None:
+        self.fail = fail
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.overlapped = False
+        self.calls = 0
+
+    def __call__(self) -> None:
+        with self.lock:
+            self.running += 1
+            self.calls += 1
+            self.overlapped |= self.running > 1
+        self.started.set()
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        if self.fail and self.calls == 1:
+            raise RuntimeError("tick failed")
+
+
+@pytest.mark.parametrize("fail", [False, True], ids=["ok", "failed"])
+def test_resume_during_tick(scheduler, fail):
+    tick = BlockingTick(fail=fail)
+    scheduler.add("sim", tick, 0.01)
+    assert tick.started.wait(5)
+
+    # pause and resume while the first tick is still running
+    scheduler.remove("sim")
+    scheduler.add("sim", tick, 0.01)
+    assert not tick.release.wait(0.1)
+    assert tick.calls == 1
+
+    tick.release.set()
+    for _ in range(500):
+        if tick.calls >= 5:
+            break
+        time.sleep(0.01)
+    scheduler.remove("sim", wait=True)
+
+    assert tick.calls >= 5
+    assert not tick.overlapped
+    assert "sim" not in scheduler.deferred
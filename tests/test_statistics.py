@@ -0,0 +1,159 @@
+"""
+The incremental Statistics engine against the original deque based formulas.
+"""
+# locals
+import itertools
+from collections import deque
+
+# project
+from src.sim.statistics import SAMPLE_PERIODS, RollingStatistics, Statistics
+
+# third party
+import numpy as np
+import pytest
+
+# constants
+MAX_SAMPLE_QUEUE = 1000  # as MonteCarloSimulation
+
+
+def baseline_running_avg(sample_queue: deque, sample_size: int) -> float:
+    if len(sample_queue) < sample_size:
+        return 0
+    return sum(itertools.islice(
+        sample_queue, len(sample_queue) - sample_size, len(sample_queue) - 1)) / sample_size
+
+
+def baseline_ema(sample_queue: deque, sample_size: int, alpha: float=0.1) -> float:
+    if len(sample_queue) < sample_size:
+        return 0
+    ema = 1
+    for x in itertools.islice(sample_queue, len(sample_queue) - sample_size, len(sample_queue) - 1):
+        ema = alpha * x + (1 - alpha) * ema
+    return ema
+
+
+def walk(steps: int, seed: int=0) -> list:
+    return np.random.default_rng(seed).uniform(-5, 5, steps).cumsum().tolist()
+
+
+def assert_matches_baseline(stats: Statistics, sample_queue: deque, res: dict) -> None:
+    for period in stats.sample_periods:
+        assert res[f"running_avg_{period}"] == pytest.approx(
+            baseline_running_avg(sample_queue, period), rel=1e-9, abs=1e-9)
+        assert res[f"ema_{period}"] == pytest.approx(
+            baseline_ema(sample_queue, period), rel=1e-9, abs=1e-9)
+
+
+def test_process_matches_baseline():
+    # past two resyncs of the running sums, with a full sample queue
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue)
+    for value in walk(2 * stats.rolling.resync_interval + 500):
+        sample_queue.append(value)
+        assert_matches_baseline(stats, sample_queue, stats.process())
+
+
+def test_warm_up():
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue)
+    for count, value in enumerate(walk(SAMPLE_PERIODS[-1] + 2), start=1):
+        sample_queue.append(value)
+        res = stats.process()
+        for period in SAMPLE_PERIODS:
+            if count < period:
+                assert res[f"running_avg_{period}"] == 0
+                assert res[f"ema_{period}"] == 0
+        assert_matches_baseline(stats, sample_queue, res)
+
+
+@pytest.mark.parametrize("pushes", [4095, 4096, 4097])
+def test_resync_boundary(pushes):
+    rolling = RollingStatistics(periods=list(SAMPLE_PERIODS))
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    for value in walk(pushes, seed=pushes):
+        rolling.push(value)
+        sample_queue.append(value)
+    assert rolling.resync_interval == 4096
+    for period in SAMPLE_PERIODS:
+        assert rolling.running_avg(period) == pytest.approx(
+            baseline_running_avg(sample_queue, period), rel=1e-9)
+        assert rolling.ema(period) == pytest.approx(baseline_ema(sample_queue, period), rel=1e-9)
+
+
+def test_frequent_resync():
+    rolling = RollingStatistics(periods=[3, 7], resync_interval=5)
+    sample_queue = deque()
+    for value in walk(200):
+        rolling.push(value)
+        sample_queue.append(value)
+        for period in (3, 7):
+            if len(sample_queue) >= period:
+                assert rolling.running_avg(period) == pytest.approx(baseline_running_avg(sample_queue, period))
+                assert rolling.ema(period) == pytest.approx(baseline_ema(sample_queue, period))
+
+
+def test_process_batch_matches_baseline():
+    values = np.array(walk(3000))
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue)
+    columns = {}
+    for start in range(0, len(values), 250):
+        for key, column in stats.process_batch(values[start:start + 250]).items():
+            columns.setdefault(key, []).extend(column.tolist())
+
+    baseline_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    for row, value in enumerate(values.tolist()):
+        baseline_queue.append(value)
+        for period in SAMPLE_PERIODS:
+            assert columns[f"running_avg_{period}"][row] == pytest.approx(
+                baseline_running_avg(baseline_queue, period), rel=1e-9, abs=1e-9)
+            assert columns[f"ema_{period}"][row] == pytest.approx(
+                baseline_ema(baseline_queue, period), rel=1e-9, abs=1e-9)
+
+
+def test_previous_api():
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue)
+    for value in walk(300):
+        sample_queue.append(value)
+        res = stats.process()
+    # not run by the shim, the rows keep their keys
+    assert set(res) == set(stats.stat_keys)
+
+    stats.proc_ema()
+    stats.proc_calculate_running_avg()
+    stats.proc_ema(sample_size=23)
+    stats.proc_ema(sample_size=23, alpha=0.2)
+    assert stats._s_ema_21 == pytest.approx(baseline_ema(sample_queue, 21))
+    assert stats._s_running_avg_21 == pytest.approx(baseline_running_avg(sample_queue, 21))
+    assert stats._s_ema_23 == pytest.approx(baseline_ema(sample_queue, 23, alpha=0.2))
+
+
+def test_legacy_shim():
+    class SumStatistics(Statistics):
+        def proc_sum(self) -> None:
+            self._s_sum = sum(self.sample_queue)
+
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = SumStatistics(list(SAMPLE_PERIODS), sample_queue)
+    for value in (1.0, 2.0, 3.0):
+        sample_queue.append(value)
+        res = stats.process()
+    assert res["sum"] == 6.0
+    assert "ema_21" not in res
+
+
+def test_legacy_shim_on_statistics(monkeypatch):
+    # as the README suggests, a `proc_` function added to Statistics itself
+    def proc_sum(self) -> None:
+        self._s_sum = sum(self.sample_queue)
+    monkeypatch.setattr(Statistics, "proc_sum", proc_sum, raising=False)
+
+    sample_queue = deque(maxlen=MAX_SAMPLE_QUEUE)
+    stats = Statistics(list(SAMPLE_PERIODS), sample_queue)
+    assert [method.__name__ for method in stats._legacy_procs] == ["proc_sum"]
+    for value in (1.0, 2.0, 3.0):
+        sample_queue.append(value)
+        res = stats.process()
+    assert res["sum"] == 6.0
+    assert "ema_21" not in res
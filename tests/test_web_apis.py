@@ -0,0 +1,48 @@
+"""
+Responses of the web APIs, called directly without a server.
+"""
+# locals
+import asyncio
+import json
+
+# project
+from src.sim.live_feed import LiveFeed
+from src.sim.simulator import MonteCarloSimulation
+from src.sim.sinks import Sink
+from src.sim.web_apis import SimulationWEBAPIs
+
+# third party
+from fastapi import HTTPException
+import pytest
+
+
+class NullSink(Sink):
+    def write(self, sample_data, immediate_commit: bool=False) -> None:
+        pass
+
+
+@pytest.fixture
+def api():
+    sim = MonteCarloSimulation("sim-a", NullSink(), seed=0)
+    for _ in range(5):
+        sim.step()
+    return SimulationWEBAPIs({"sim-a": sim})
+
+
+def test_recent_json_has_no_nan(api):
+    response = api.get_recent("sim-a", n=3)
+    # strict parsing, as a browser's JSON.parse
+    body = json.loads(response.body, parse_constant=lambda name: pytest.fail(f"{name} in response"))
+    assert body["rows"] == 3
+    assert body["columns"]["mark"] == [None, None, None]
+    assert body["columns"]["samples"] == [3, 4, 5]
+
+
+@pytest.mark.parametrize("max_rate", [0.0, -1.0, float("nan")])
+def test_stream_rejects_non_positive_max_rate(max_rate):
+    feed = LiveFeed(capacity=8)
+    api = SimulationWEBAPIs({}, feed=feed)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(api.stream_samples(None, max_rate=max_rate))
+    assert e.value.status_code == 400
+    assert feed.subscribers == 0